@@ -0,0 +1,860 @@
+#!/usr/bin/env python3
+"""
+Resident execution agent for the language containers.
+
+The worker connects over TCP and sends length-prefixed JSON frames; each
+request is compiled (when needed) and run directly with subprocess, without
+going through the docker CLI, a shell or base64 decoding.
+
+Request:  {"op": "execute", "id", "language", "source", "stdin",
+           "time_limit", "compile_flags", "compile_cache", "evict"}
+          {"op": "execute", ..., "cases": [stdin, ...]}
+          {"op": "ping"}
+Response: {"stdout", "stderr", "exit_code", "timed_out", "truncated",
+           "timings", "resources", "compile_failed", "compile_cache",
+           "artifact_key", "stored_bytes"}
+          With "cases" the program is compiled once and run per input;
+          stdout/stderr/exit_code/timed_out/truncated are then reported per
+          case in "cases" as {..., "time", "resources"}.
+
+"resources" holds {"compile", "run"} usage as {"cpu_user", "cpu_sys",
+"max_memory_kb", "read_bytes", "write_bytes"}, measured with wait4() for
+child processes. The resident runners share a process between runs and
+report CPU time of the submission's thread only, with memory and I/O null.
+
+A run producing more than "max_output" bytes is killed and reported as
+truncated. With "stream": true, output is also sent while the program runs
+as {"chunk": "stdout"|"stderr", "data"} frames ahead of the response.
+
+In the java image, compiles and runs go to a small pool of warm JVMs
+(docker/java/runner/JavaRunner.java) instead of starting javac and java for
+every submission; in the python image, runs are forked from a pre-imported
+interpreter (docker/python/zygote.py); in the nodejs image, they go to
+pre-started worker threads (docker/nodejs/runner.js).
+"""
+import codecs
+import hashlib
+import json
+import os
+import queue
+import selectors
+import shutil
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PORT = int(os.environ.get("AGENT_PORT", "7100"))
+WORK_ROOT = os.environ.get("AGENT_WORK_DIR", "/tmp/agent")
+# The agent compiles and runs as the container user, so it keeps its own
+# artifacts apart from the compile cache of the cli and engine backends
+CACHE_ROOT = os.environ.get("AGENT_CACHE_DIR", "/tmp/agent_cache")
+
+# Seconds a compile may take; the compiler's process group is killed after
+COMPILE_TIME_LIMIT = float(os.environ.get("COMPILE_TIME_LIMIT", "30"))
+
+HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+SOURCE_FILES = {
+    "python": "script.py",
+    "nodejs": "script.js",
+    "cpp": "prog.cpp",
+    "java": "Main.java",
+}
+
+VERSION_COMMANDS = {
+    "cpp": ["g++", "-dumpfullversion"],
+    "java": ["javac", "-version"],
+}
+
+JAVA_RUNNER_DIR = os.environ.get("JAVA_RUNNER_DIR", "/leetcode_compiler/runner")
+JAVA_RUNNER_ENABLED = (
+    os.environ.get("JAVA_RUNNER", "1") == "1"
+    and os.path.exists(os.path.join(JAVA_RUNNER_DIR, "JavaRunner.class"))
+)
+JAVA_RUNNERS = int(os.environ.get("JAVA_RUNNERS", "2"))
+JAVA_RUNNER_COMMAND = [
+    "java",
+    "-Djava.security.manager=allow",
+    "-Djava.security.policy=" + os.environ.get("JAVA_POLICY", "/leetcode_compiler/java.policy"),
+    "-XX:+UseSerialGC",
+    "-cp", JAVA_RUNNER_DIR,
+    "JavaRunner",
+]
+# Extra time the runner gets to stop a timed out submission before the
+# watchdog kills the whole JVM
+JAVA_RUNNER_GRACE = 5
+
+PYTHON_ZYGOTE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py")
+PYTHON_ZYGOTE_SOCKET = os.environ.get("PYTHON_ZYGOTE_SOCKET", "/tmp/zygote.sock")
+PYTHON_ZYGOTE_ENABLED = (
+    os.environ.get("PYTHON_ZYGOTE", "1") == "1"
+    and os.path.exists(PYTHON_ZYGOTE_SCRIPT)
+)
+if PYTHON_ZYGOTE_ENABLED:
+    import zygote
+
+NODE_RUNNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runner.js")
+NODE_RUNNER_SOCKET = os.environ.get("NODE_RUNNER_SOCKET", "/tmp/node_runner.sock")
+NODE_RUNNER_ENABLED = (
+    os.environ.get("NODE_RUNNER", "1") == "1"
+    and os.path.exists(NODE_RUNNER_SCRIPT)
+)
+NODE_RUNNER_GRACE = 5
+
+INT = struct.Struct(">i")
+LONG = struct.Struct(">q")
+RUNNER_COMPILE = 1
+RUNNER_RUN = 2
+RUNNER_TIMEOUT = 1
+RUNNER_OUTPUT_LIMIT = 2
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def resource_usage(rusage):
+    return {
+        "cpu_user": round(rusage.ru_utime, 6),
+        "cpu_sys": round(rusage.ru_stime, 6),
+        "max_memory_kb": rusage.ru_maxrss,
+        # Block I/O in 512-byte units; reads served from the page cache
+        # are not counted
+        "read_bytes": rusage.ru_inblock * 512,
+        "write_bytes": rusage.ru_oublock * 512,
+    }
+
+
+def thread_usage(cpu_ns, user_ns):
+    """Usage reported by a resident runner: CPU only"""
+    if cpu_ns < 0:
+        return None
+    return {
+        "cpu_user": user_ns / 1e9,
+        "cpu_sys": max(cpu_ns - user_ns, 0) / 1e9,
+        "max_memory_kb": None,
+        "read_bytes": None,
+        "write_bytes": None,
+    }
+
+
+def wait_with_usage(process, timeout=None):
+    """
+    Popen.wait() that reaps the child with wait4() and returns its
+    resource usage. Raises subprocess.TimeoutExpired like Popen.wait().
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    delay = 0.0005
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            if os.WIFSIGNALED(status):
+                process.returncode = -os.WTERMSIG(status)
+            else:
+                process.returncode = os.WEXITSTATUS(status)
+            return resource_usage(rusage)
+        if deadline is not None and time.time() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def read_frame(stream):
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError("Frame too large: %d bytes" % length)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def write_frame(stream, message):
+    payload = json.dumps(message).encode("utf-8")
+    stream.write(HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def compiler_version(language):
+    with _versions_lock:
+        if language not in _versions:
+            result = subprocess.run(
+                VERSION_COMMANDS[language],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+            _versions[language] = result.stdout.decode("utf-8", "replace").strip()
+        return _versions[language]
+
+
+class RunnerDied(Exception):
+    """The JVM exited or was killed by the watchdog mid-request"""
+
+
+class JavaRunner:
+    """One warm JVM speaking the JavaRunner protocol over a loopback socket"""
+
+    def __init__(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        listener.settimeout(30)
+        try:
+            self.process = subprocess.Popen(
+                JAVA_RUNNER_COMMAND + [str(listener.getsockname()[1])],
+                stdin=subprocess.DEVNULL
+            )
+            try:
+                self.sock, _ = listener.accept()
+            except OSError:
+                self.process.kill()
+                raise
+        finally:
+            listener.close()
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile("rwb")
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+        self.process.kill()
+        self.process.wait()
+        self.sock.close()
+
+    def _write(self, *parts):
+        chunks = []
+        for part in parts:
+            if isinstance(part, int):
+                chunks.append(INT.pack(part))
+            else:
+                chunks.append(INT.pack(len(part)) + part)
+        self.stream.write(b"".join(chunks))
+        self.stream.flush()
+
+    def _read_exactly(self, length):
+        data = self.stream.read(length)
+        if len(data) < length:
+            raise RunnerDied("Java runner exited")
+        return data
+
+    def _read_int(self):
+        return INT.unpack(self._read_exactly(INT.size))[0]
+
+    def _read_bytes(self):
+        return self._read_exactly(self._read_int())
+
+    def _read_long(self):
+        return LONG.unpack(self._read_exactly(LONG.size))[0]
+
+    def _read_usage(self):
+        cpu_ns = self._read_long()
+        return thread_usage(cpu_ns, self._read_long())
+
+    def compile(self, source, flags):
+        """Returns (ok, {class name: class file bytes}, diagnostics, resources)"""
+        self._write(RUNNER_COMPILE, source.encode("utf-8"), flags.encode("utf-8"))
+        if not self._read_int():
+            diagnostics = self._read_bytes().decode("utf-8", "replace")
+            return False, {}, diagnostics, self._read_usage()
+        classes = {}
+        for _ in range(self._read_int()):
+            name = self._read_bytes().decode("utf-8")
+            classes[name] = self._read_bytes()
+        return True, classes, "", self._read_usage()
+
+    def run(self, class_dir, stdin, time_limit, max_output=None):
+        self._write(RUNNER_RUN, class_dir.encode("utf-8"), (stdin or "").encode("utf-8"),
+                    int(time_limit * 1000), -1 if max_output is None else max_output)
+        outcome = self._read_int()
+        exit_code = self._read_int()
+        stdout = self._read_bytes()
+        stderr = self._read_bytes()
+        resources = self._read_usage()
+        timed_out = outcome == RUNNER_TIMEOUT
+        truncated = outcome == RUNNER_OUTPUT_LIMIT
+        return {
+            "stdout": stdout.decode("utf-8", "replace"),
+            "stderr": stderr.decode("utf-8", "replace"),
+            "exit_code": None if timed_out or truncated else exit_code,
+            "timed_out": timed_out,
+            "truncated": truncated,
+            "resources": resources,
+        }
+
+
+class JavaRunnerPool:
+    """
+    Hands out warm JVMs, one request at a time each.
+
+    A watchdog kills a JVM that overruns its deadline (a submission the
+    runner could not stop, a wedged compiler); killed or crashed JVMs are
+    dropped and replaced on demand.
+    """
+
+    def __init__(self, size):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.size = size
+
+    def call(self, method, deadline, *args):
+        with self._slots:
+            try:
+                runner = self._idle.get_nowait()
+            except queue.Empty:
+                runner = JavaRunner()
+            watchdog = threading.Timer(deadline, runner.kill)
+            watchdog.start()
+            try:
+                result = getattr(runner, method)(*args)
+            except (OSError, ValueError, RunnerDied):
+                if runner.killed:
+                    raise RunnerDied("Java runner killed after %ss" % deadline)
+                runner.kill()
+                raise RunnerDied("Java runner exited")
+            finally:
+                watchdog.cancel()
+            self._idle.put(runner)
+            return result
+
+    def warm(self):
+        """Start every JVM and push a trivial class through the compiler"""
+        for _ in range(self.size):
+            runner = JavaRunner()
+            runner.compile("public class Main { public static void main(String[] a) {} }", "")
+            self._idle.put(runner)
+
+
+java_runners = JavaRunnerPool(JAVA_RUNNERS)
+
+
+class ResidentServer:
+    """Keeps a helper process listening on a Unix socket, restarting it if it dies"""
+
+    def __init__(self, command, socket_path):
+        self.command = command
+        self.socket_path = socket_path
+        self.process = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.process = subprocess.Popen(self.command + [self.socket_path], stdin=subprocess.DEVNULL)
+            deadline = time.time() + 10
+            while not os.path.exists(self.socket_path):
+                if self.process.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("%s failed to start" % os.path.basename(self.command[-1]))
+                time.sleep(0.01)
+
+    def restart(self):
+        with self._lock:
+            if self.process is not None and self.process.poll() is None:
+                self.process.kill()
+                self.process.wait()
+        self.ensure_running()
+
+    def connect(self):
+        self.ensure_running()
+        # The socket file appears just before the server starts listening
+        deadline = time.time() + 1
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except ConnectionRefusedError:
+                sock.close()
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.01)
+            except OSError:
+                sock.close()
+                raise
+
+
+class PythonZygote(ResidentServer):
+    """Client for the fork server in docker/python/zygote.py"""
+
+    def run(self, script, stdin, time_limit, max_output=None):
+        with tempfile.TemporaryFile() as stdin_file, \
+                tempfile.TemporaryFile() as stdout_file, \
+                tempfile.TemporaryFile() as stderr_file:
+            stdin_file.write((stdin or "").encode("utf-8"))
+            stdin_file.seek(0)
+            sock = self.connect()
+            try:
+                zygote.send_frame(
+                    sock,
+                    {"script": script, "time_limit": time_limit},
+                    [stdin_file.fileno(), stdout_file.fileno(), stderr_file.fileno()]
+                )
+                reply, _ = zygote.recv_frame(sock)
+                if reply is None:
+                    raise RuntimeError("Python zygote closed the connection")
+                pid = reply["pid"]
+                timed_out = truncated = False
+                deadline = time.time() + time_limit
+                # Wake up periodically to enforce the output cap on the files
+                # the child writes to
+                sock.settimeout(0.05)
+                while True:
+                    try:
+                        reply, _ = zygote.recv_frame(sock)
+                        break
+                    except socket.timeout:
+                        pass
+                    if time.time() >= deadline:
+                        timed_out = True
+                    elif max_output is not None:
+                        written = os.fstat(stdout_file.fileno()).st_size + os.fstat(stderr_file.fileno()).st_size
+                        truncated = written > max_output
+                    if timed_out or truncated:
+                        kill_process_group(pid)
+                        sock.settimeout(None)
+                        reply, _ = zygote.recv_frame(sock)
+                        break
+                if reply is None:
+                    raise RuntimeError("Python zygote exited")
+            finally:
+                sock.close()
+            stdout_file.seek(0)
+            stderr_file.seek(0)
+            limit = -1 if max_output is None else max_output + 1
+            return {
+                "stdout": stdout_file.read(limit).decode("utf-8", "replace"),
+                "stderr": stderr_file.read(limit).decode("utf-8", "replace"),
+                "exit_code": None if timed_out else reply["exit_code"],
+                "timed_out": timed_out,
+                "truncated": truncated,
+                "resources": reply.get("resources"),
+            }
+
+
+def kill_process_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # Forked but not yet its own session leader
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class NodeRunner(ResidentServer):
+    """Client for the worker-thread runner in docker/nodejs/runner.js"""
+
+    def run(self, script, stdin, time_limit, max_output=None):
+        sock = self.connect()
+        try:
+            # The runner enforces the limits itself; this only catches a
+            # runner that stopped answering
+            sock.settimeout(time_limit + NODE_RUNNER_GRACE)
+            stream = sock.makefile("rwb")
+            write_frame(stream, {"script": script, "stdin": stdin or "", "time_limit": time_limit,
+                                 "max_output": max_output})
+            response = read_frame(stream)
+        except socket.timeout:
+            response = None
+        finally:
+            sock.close()
+        if response is None:
+            self.restart()
+            return {"stdout": "", "stderr": "Node runner stopped responding", "exit_code": None, "timed_out": True,
+                    "resources": None}
+        return response
+
+
+python_zygote = PythonZygote([sys.executable, PYTHON_ZYGOTE_SCRIPT], PYTHON_ZYGOTE_SOCKET)
+node_runner = NodeRunner(["node", NODE_RUNNER_SCRIPT], NODE_RUNNER_SOCKET)
+
+
+def artifact_key(language, source, flags):
+    digest = hashlib.sha256()
+    for part in (language, compiler_version(language), flags, source):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def compile_into(language, source, flags, out_dir):
+    """Compile `source` into `out_dir`; returns (ok, compiler stderr, resources)"""
+    if language == "java" and JAVA_RUNNER_ENABLED:
+        try:
+            ok, classes, diagnostics, resources = java_runners.call("compile", COMPILE_TIME_LIMIT, source, flags)
+        except RunnerDied as e:
+            return False, str(e), None
+        for name, data in classes.items():
+            class_path = os.path.join(out_dir, *name.split(".")) + ".class"
+            os.makedirs(os.path.dirname(class_path), exist_ok=True)
+            with open(class_path, "wb") as f:
+                f.write(data)
+        return ok, diagnostics, resources
+
+    source_path = os.path.join(out_dir, SOURCE_FILES[language])
+    with open(source_path, "w") as f:
+        f.write(source)
+    # Compile by relative name so diagnostics don't leak the staging path
+    source_name = SOURCE_FILES[language]
+    if language == "java":
+        command = ["javac"] + flags.split() + ["-d", ".", source_name]
+    else:
+        command = ["g++"] + flags.split() + ["-o", "prog", source_name]
+    # g++ runs cc1plus, as and ld as children, so the whole group goes on timeout
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=out_dir,
+                               start_new_session=True)
+    # Read on a thread so a compiler that hangs without output cannot
+    # block past the limit
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.append(process.stderr.read()), daemon=True)
+    reader.start()
+    try:
+        resources = wait_with_usage(process, timeout=COMPILE_TIME_LIMIT)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        kill_process_group(process.pid)
+        resources = wait_with_usage(process)
+        timed_out = True
+    reader.join()
+    process.stderr.close()
+    os.remove(source_path)
+    if timed_out:
+        return False, "Compilation timed out", resources
+    return process.returncode == 0, b"".join(chunks).decode("utf-8", "replace"), resources
+
+
+def ensure_artifact(request, workdir):
+    """
+    Make the compiled artifact available.
+
+    Returns (artifact dir or None, info dict, compiler stderr, compile
+    resources or None on a cache hit). With the compile cache enabled the
+    artifact is looked up by content hash and stored for later runs;
+    otherwise it is built inside the workspace.
+    """
+    language = request["language"]
+    flags = request.get("compile_flags", "")
+    if not request.get("compile_cache"):
+        ok, stderr, resources = compile_into(language, request["source"], flags, workdir)
+        return (workdir if ok else None), {}, stderr, resources
+
+    key = artifact_key(language, request["source"], flags)
+    target = os.path.join(CACHE_ROOT, key)
+    info = {"artifact_key": key}
+    if os.path.exists(os.path.join(target, ".ok")):
+        info["compile_cache"] = "hit"
+        return target, info, "", None
+
+    # Build in a private staging directory and rename it into place so
+    # concurrent misses never see a half-written artifact
+    staging = "%s.%s" % (target, request["id"])
+    os.makedirs(staging)
+    ok, stderr, resources = compile_into(language, request["source"], flags, staging)
+    if not ok:
+        shutil.rmtree(staging, ignore_errors=True)
+        info["compile_cache"] = "failed"
+        return None, info, stderr, resources
+
+    open(os.path.join(staging, ".ok"), "w").close()
+    info["compile_cache"] = "stored"
+    info["stored_bytes"] = directory_size(staging)
+    try:
+        os.rename(staging, target)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+    return target, info, stderr, resources
+
+
+def run_command(language, workdir, artifact_dir):
+    if language == "python":
+        return ["python3", os.path.join(workdir, SOURCE_FILES[language])]
+    if language == "nodejs":
+        return ["node", os.path.join(workdir, SOURCE_FILES[language])]
+    if language == "java":
+        return ["java", "-cp", artifact_dir, "Main"]
+    return [os.path.join(artifact_dir, "prog")]
+
+
+class CaseOutput:
+    """
+    Output of one run, capped at `max_output` bytes in total.
+
+    Chunks are handed to `emit(stream, text)` as they arrive when the
+    caller streams output.
+    """
+
+    def __init__(self, max_output=None, emit=None):
+        self.max_output = max_output
+        self.emit = emit
+        self.size = 0
+        self.truncated = False
+        self.buffers = {"stdout": bytearray(), "stderr": bytearray()}
+        self.decoders = {
+            stream: codecs.getincrementaldecoder("utf-8")("replace") for stream in self.buffers
+        }
+
+    def write(self, stream, data):
+        """Append a chunk; returns False once the cap has been exceeded"""
+        if self.max_output is not None and self.size + len(data) > self.max_output:
+            data = data[:max(self.max_output - self.size, 0)]
+            self.truncated = True
+        self.buffers[stream] += data
+        self.size += len(data)
+        if self.emit and data:
+            text = self.decoders[stream].decode(data)
+            try:
+                if text:
+                    self.emit(stream, text)
+            except OSError:
+                # The worker went away; keep collecting for the response
+                self.emit = None
+        return not self.truncated
+
+    def case(self, exit_code, timed_out):
+        return {
+            "stdout": self.buffers["stdout"].decode("utf-8", "replace"),
+            "stderr": self.buffers["stderr"].decode("utf-8", "replace"),
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "truncated": self.truncated,
+        }
+
+
+def cap_case(case, max_output):
+    """Apply the output cap to a run whose output was collected whole"""
+    case.setdefault("truncated", False)
+    if max_output is None:
+        return case
+    stdout = case["stdout"].encode("utf-8")
+    stderr = case["stderr"].encode("utf-8")
+    if len(stdout) + len(stderr) > max_output:
+        case["stdout"] = stdout[:max_output].decode("utf-8", "ignore")
+        case["stderr"] = stderr[:max(max_output - len(stdout), 0)].decode("utf-8", "ignore")
+        case["truncated"] = True
+    return case
+
+
+def feed(pipe, data):
+    try:
+        pipe.write(data)
+        pipe.close()
+    except OSError:
+        pass
+
+
+def run_case(command, workdir, stdin, time_limit, output=None):
+    """Run a subprocess, reading its output incrementally into `output`"""
+    started = time.time()
+    output = output or CaseOutput()
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=workdir
+    )
+    # Fed from a thread so a program that never reads its input cannot
+    # block the output reader
+    threading.Thread(target=feed, args=(process.stdin, (stdin or "").encode("utf-8")), daemon=True).start()
+
+    deadline = time.time() + time_limit
+    timed_out = False
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    try:
+        while selector.get_map() and not output.truncated:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, READ_CHUNK_BYTES)
+                if not data:
+                    selector.unregister(key.fileobj)
+                elif not output.write(key.data, data):
+                    break
+        if timed_out or output.truncated:
+            process.kill()
+        try:
+            resources = wait_with_usage(process, timeout=max(deadline - time.time(), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            process.kill()
+            resources = wait_with_usage(process)
+    finally:
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+
+    case = output.case(None if timed_out else process.returncode, timed_out)
+    case["time"] = time.time() - started
+    case["resources"] = resources
+    return case
+
+
+def run_java_case(class_dir, stdin, time_limit, max_output=None):
+    started = time.time()
+    try:
+        case = java_runners.call("run", time_limit + JAVA_RUNNER_GRACE, class_dir, stdin, time_limit, max_output)
+    except RunnerDied as e:
+        case = {"stdout": "", "stderr": str(e), "exit_code": None, "timed_out": True, "resources": None}
+    case["time"] = time.time() - started
+    return case
+
+
+def run_python_case(script, stdin, time_limit, max_output=None):
+    started = time.time()
+    case = python_zygote.run(script, stdin, time_limit, max_output)
+    case["time"] = time.time() - started
+    return case
+
+
+def run_node_case(script, stdin, time_limit, max_output=None):
+    started = time.time()
+    case = node_runner.run(script, stdin, time_limit, max_output)
+    case["time"] = time.time() - started
+    return case
+
+
+def execute(request, emit=None):
+    """Run one request; `emit(stream, text)` receives live output if streaming"""
+    started = time.time()
+    language = request["language"]
+    if language not in SOURCE_FILES:
+        raise ValueError("Unsupported language: %s" % language)
+
+    for key in request.get("evict", []):
+        shutil.rmtree(os.path.join(CACHE_ROOT, os.path.basename(key)), ignore_errors=True)
+
+    workdir = os.path.join(WORK_ROOT, os.path.basename(request["id"]))
+    os.makedirs(workdir)
+    response = {"stdout": "", "stderr": "", "exit_code": None, "timed_out": False,
+                "truncated": False, "timings": {}, "resources": {}}
+    try:
+        artifact_dir = None
+        if language in VERSION_COMMANDS:
+            compile_started = time.time()
+            artifact_dir, info, compile_stderr, compile_resources = ensure_artifact(request, workdir)
+            response.update(info)
+            response["timings"]["compile"] = time.time() - compile_started
+            response["resources"]["compile"] = compile_resources
+            if artifact_dir is None:
+                response["stderr"] = compile_stderr
+                response["exit_code"] = 1
+                response["compile_failed"] = True
+                return response
+        else:
+            with open(os.path.join(workdir, SOURCE_FILES[language]), "w") as f:
+                f.write(request["source"])
+
+        time_limit = request.get("time_limit", 30)
+        max_output = request.get("max_output")
+        # The resident runners hand back whole results; only subprocess runs
+        # can stream. They stop a run as soon as it exceeds max_output, as
+        # run_case does.
+        if language == "java" and JAVA_RUNNER_ENABLED:
+            def run(stdin, emit=None):
+                return cap_case(run_java_case(artifact_dir, stdin, time_limit, max_output), max_output)
+        elif language == "python" and PYTHON_ZYGOTE_ENABLED:
+            script = os.path.join(workdir, SOURCE_FILES[language])
+
+            def run(stdin, emit=None):
+                return cap_case(run_python_case(script, stdin, time_limit, max_output), max_output)
+        elif language == "nodejs" and NODE_RUNNER_ENABLED:
+            script = os.path.join(workdir, SOURCE_FILES[language])
+
+            def run(stdin, emit=None):
+                return cap_case(run_node_case(script, stdin, time_limit, max_output), max_output)
+        else:
+            command = run_command(language, workdir, artifact_dir)
+
+            def run(stdin, emit=None):
+                return run_case(command, workdir, stdin, time_limit, CaseOutput(max_output, emit))
+
+        run_started = time.time()
+        if "cases" in request:
+            response["cases"] = [run(stdin) for stdin in request["cases"]]
+        else:
+            case = run(request.get("stdin"), emit if request.get("stream") else None)
+            del case["time"]
+            response["resources"]["run"] = case.pop("resources", None)
+            response.update(case)
+        response["timings"]["run"] = time.time() - run_started
+        return response
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        response["timings"]["total"] = time.time() - started
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Serves framed requests on one connection until the worker closes it"""
+
+    def handle(self):
+        while True:
+            try:
+                request = read_frame(self.rfile)
+            except (OSError, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                if request.get("op") == "ping":
+                    response = {"ok": True}
+                else:
+                    response = execute(request, self.emit_chunk)
+            except Exception as e:
+                response = {"error": "%s: %s" % (type(e).__name__, e)}
+            try:
+                write_frame(self.wfile, response)
+            except OSError:
+                return
+
+
+    def emit_chunk(self, stream, text):
+        write_frame(self.wfile, {"chunk": stream, "data": text})
+
+
+class AgentServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    os.makedirs(WORK_ROOT, exist_ok=True)
+    os.makedirs(CACHE_ROOT, exist_ok=True)
+    if JAVA_RUNNER_ENABLED:
+        java_runners.warm()
+    if PYTHON_ZYGOTE_ENABLED:
+        python_zygote.ensure_running()
+    if NODE_RUNNER_ENABLED:
+        node_runner.ensure_running()
+    server = AgentServer(("0.0.0.0", PORT), AgentHandler)
+    print("Execution agent listening on port %d" % PORT, flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
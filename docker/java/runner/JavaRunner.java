@@ -0,0 +1,429 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.management.ManagementFactory;
+import java.lang.management.ThreadMXBean;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.lang.reflect.Modifier;
+import java.net.InetAddress;
+import java.net.Socket;
+import java.net.URI;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import java.util.concurrent.CountDownLatch;
+import java.util.concurrent.TimeUnit;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileManager;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Warm JVM that compiles and runs Java submissions for the execution agent.
+ *
+ * The agent (docker/agent/agent.py) starts this class once, passing the
+ * loopback port to connect back to, and sends length-prefixed binary frames
+ * over that socket, so submissions no longer pay a JVM cold start for javac
+ * and another one for java:
+ *
+ *   COMPILE: int 1, bytes source, bytes flags
+ *            -> int 1, int count, (bytes class name, bytes class file)*, usage
+ *            -> int 0, bytes diagnostics, usage
+ *   RUN:     int 2, bytes class directory, bytes stdin, int time limit (ms),
+ *            int output limit (bytes, -1 for MAX_OUTPUT_BYTES)
+ *            -> int outcome, int exit code, bytes stdout, bytes stderr, usage
+ *
+ * where "bytes" is an int length followed by that many bytes and "usage" is
+ * long CPU time, long user CPU time (ns) of the compiling or submission
+ * thread, -1 when unavailable. A run whose combined stdout and stderr
+ * exceed the output limit is stopped right away with the OUTPUT_LIMIT
+ * outcome and the output up to the limit. Each run loads
+ * the submission through a throwaway class loader, so static state never
+ * leaks between runs, and java.policy still applies through the security
+ * manager because submission classes get their own protection domain. The
+ * protocol deliberately avoids the process stdio, which java.policy lets
+ * submissions open through FileDescriptor.
+ */
+public final class JavaRunner {
+
+    static final int OP_COMPILE = 1;
+    static final int OP_RUN = 2;
+
+    static final int OUTCOME_EXITED = 0;
+    static final int OUTCOME_TIMEOUT = 1;
+    static final int OUTCOME_OUTPUT_LIMIT = 2;
+
+    /** Output limit of a run that does not set one */
+    static final int MAX_OUTPUT_BYTES = 16 * 1024 * 1024;
+
+    static final ThreadGroup SUBMISSIONS = new ThreadGroup("submissions");
+
+    /** Thrown in place of exiting the JVM when a submission calls System.exit */
+    static final class ExitTrap extends SecurityException {
+        final int status;
+
+        ExitTrap(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    static final class RunnerSecurityManager extends SecurityManager {
+        @Override
+        public void checkExit(int status) {
+            if (isSubmission()) {
+                throw new ExitTrap(status);
+            }
+            super.checkExit(status);
+        }
+
+        @Override
+        public void checkAccess(Thread t) {
+            if (isSubmission() && !SUBMISSIONS.parentOf(t.getThreadGroup())) {
+                throw new SecurityException("Access to runner threads denied");
+            }
+            super.checkAccess(t);
+        }
+
+        @Override
+        public void checkAccess(ThreadGroup g) {
+            if (isSubmission() && !SUBMISSIONS.parentOf(g)) {
+                throw new SecurityException("Access to runner thread groups denied");
+            }
+            super.checkAccess(g);
+        }
+
+        private static boolean isSubmission() {
+            return SUBMISSIONS.parentOf(Thread.currentThread().getThreadGroup());
+        }
+    }
+
+    /**
+     * Output limit shared by a run's stdout and stderr. Exceeding it counts
+     * down `done`, which the runner waits on along with the submission.
+     */
+    static final class OutputBudget {
+        private final int limit;
+        private final CountDownLatch done;
+        private int used;
+        private volatile boolean exceeded;
+
+        OutputBudget(int limit, CountDownLatch done) {
+            this.limit = limit;
+            this.done = done;
+        }
+
+        /** Bytes of a `len` byte write that fit; marks the budget exceeded if not all do */
+        synchronized int take(int len) {
+            if (exceeded) {
+                return 0;
+            }
+            int room = limit - used;
+            if (len > room) {
+                exceeded = true;
+                done.countDown();
+                len = room;
+            }
+            used += len;
+            return len;
+        }
+
+        boolean exceeded() {
+            return exceeded;
+        }
+    }
+
+    /** Byte sink that drops output once its budget is exceeded */
+    static final class CappedOutputStream extends OutputStream {
+        private final ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+        private final OutputBudget budget;
+
+        CappedOutputStream(OutputBudget budget) {
+            this.budget = budget;
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            if (budget.take(1) == 1) {
+                buffer.write(b);
+            }
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            buffer.write(b, off, budget.take(len));
+        }
+
+        synchronized byte[] toByteArray() {
+            return buffer.toByteArray();
+        }
+    }
+
+    static final class SourceFile extends SimpleJavaFileObject {
+        private final String source;
+
+        SourceFile(String source) {
+            super(URI.create("string:///Main.java"), JavaFileObject.Kind.SOURCE);
+            this.source = source;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return source;
+        }
+    }
+
+    static final class ClassFile extends SimpleJavaFileObject {
+        private final ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+
+        ClassFile(String className) {
+            super(URI.create("mem:///" + className.replace('.', '/') + ".class"), JavaFileObject.Kind.CLASS);
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return bytes;
+        }
+    }
+
+    private static final JavaCompiler COMPILER = ToolProvider.getSystemJavaCompiler();
+    private static final ThreadMXBean THREADS = ManagementFactory.getThreadMXBean();
+
+    private final DataInputStream in;
+    private final DataOutputStream out;
+
+    JavaRunner(InputStream in, OutputStream out) {
+        this.in = new DataInputStream(new BufferedInputStream(in));
+        this.out = new DataOutputStream(new BufferedOutputStream(out));
+    }
+
+    static byte[] readBytes(DataInputStream in) throws Exception {
+        byte[] data = new byte[in.readInt()];
+        in.readFully(data);
+        return data;
+    }
+
+    static void writeBytes(DataOutputStream out, byte[] data) throws Exception {
+        out.writeInt(data.length);
+        out.write(data);
+    }
+
+    /** CPU and user CPU time of the calling thread in ns, -1 if unsupported */
+    static long[] threadCpuTime() {
+        if (!THREADS.isCurrentThreadCpuTimeSupported()) {
+            return new long[] {-1, -1};
+        }
+        return new long[] {THREADS.getCurrentThreadCpuTime(), THREADS.getCurrentThreadUserTime()};
+    }
+
+    static void writeUsage(DataOutputStream out, long[] start, long[] end) throws Exception {
+        if (start[0] < 0 || end[0] < 0) {
+            out.writeLong(-1);
+            out.writeLong(-1);
+        } else {
+            out.writeLong(end[0] - start[0]);
+            out.writeLong(end[1] - start[1]);
+        }
+    }
+
+    void serve() throws Exception {
+        while (true) {
+            int op;
+            try {
+                op = in.readInt();
+            } catch (EOFException e) {
+                return;
+            }
+            if (op == OP_COMPILE) {
+                String source = new String(readBytes(in), StandardCharsets.UTF_8);
+                String flags = new String(readBytes(in), StandardCharsets.UTF_8);
+                compile(source, flags);
+            } else if (op == OP_RUN) {
+                String classDir = new String(readBytes(in), StandardCharsets.UTF_8);
+                byte[] stdin = readBytes(in);
+                int timeLimitMillis = in.readInt();
+                int outputLimit = in.readInt();
+                run(classDir, stdin, timeLimitMillis, outputLimit < 0 ? MAX_OUTPUT_BYTES : outputLimit);
+            } else {
+                throw new IllegalStateException("Unknown op " + op);
+            }
+            out.flush();
+        }
+    }
+
+    void compile(String source, String flags) throws Exception {
+        long[] started = threadCpuTime();
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<JavaFileObject>();
+        StandardJavaFileManager standard = COMPILER.getStandardFileManager(diagnostics, null, StandardCharsets.UTF_8);
+        final Map<String, ClassFile> classes = new LinkedHashMap<String, ClassFile>();
+        JavaFileManager fileManager = new ForwardingJavaFileManager<StandardJavaFileManager>(standard) {
+            @Override
+            public JavaFileObject getJavaFileForOutput(JavaFileManager.Location location, String className,
+                                                       JavaFileObject.Kind kind, FileObject sibling) {
+                ClassFile file = new ClassFile(className);
+                classes.put(className, file);
+                return file;
+            }
+        };
+
+        List<String> options = new ArrayList<String>();
+        for (String flag : flags.trim().split("\\s+")) {
+            if (!flag.isEmpty()) {
+                options.add(flag);
+            }
+        }
+
+        boolean ok = COMPILER.getTask(null, fileManager, diagnostics, options, null,
+                Collections.singletonList(new SourceFile(source))).call();
+        long[] finished = threadCpuTime();
+        if (!ok) {
+            StringBuilder report = new StringBuilder();
+            for (Diagnostic<? extends JavaFileObject> d : diagnostics.getDiagnostics()) {
+                String kind = d.getKind() == Diagnostic.Kind.ERROR ? "error" : "warning";
+                report.append("Main.java:").append(d.getLineNumber()).append(": ").append(kind)
+                        .append(": ").append(d.getMessage(Locale.ROOT)).append('\n');
+            }
+            out.writeInt(0);
+            writeBytes(out, report.toString().getBytes(StandardCharsets.UTF_8));
+            writeUsage(out, started, finished);
+            return;
+        }
+
+        out.writeInt(1);
+        out.writeInt(classes.size());
+        for (Map.Entry<String, ClassFile> entry : classes.entrySet()) {
+            writeBytes(out, entry.getKey().getBytes(StandardCharsets.UTF_8));
+            writeBytes(out, entry.getValue().bytes.toByteArray());
+        }
+        writeUsage(out, started, finished);
+    }
+
+    void run(String classDir, byte[] stdin, int timeLimitMillis, int outputLimit) throws Exception {
+        // Counted down when the submission ends or exceeds the output limit
+        final CountDownLatch done = new CountDownLatch(1);
+        final OutputBudget budget = new OutputBudget(outputLimit, done);
+        final CappedOutputStream stdout = new CappedOutputStream(budget);
+        final CappedOutputStream stderr = new CappedOutputStream(budget);
+        final PrintStream programOut = new PrintStream(stdout, true, "UTF-8");
+        final PrintStream programErr = new PrintStream(stderr, true, "UTF-8");
+        final int[] exitCode = {0};
+        // Written by the submission thread as it ends, so it covers a
+        // thread stopped on timeout too
+        final long[][] usage = {{-1, -1}, {-1, -1}};
+
+        URL[] urls = {Paths.get(classDir).toUri().toURL()};
+        final URLClassLoader loader = new URLClassLoader(urls, ClassLoader.getPlatformClassLoader());
+
+        InputStream savedIn = System.in;
+        PrintStream savedOut = System.out;
+        PrintStream savedErr = System.err;
+        System.setIn(new ByteArrayInputStream(stdin));
+        System.setOut(programOut);
+        System.setErr(programErr);
+
+        Thread thread = new Thread(SUBMISSIONS, new Runnable() {
+            @Override
+            public void run() {
+                usage[0] = threadCpuTime();
+                try {
+                    Class<?> mainClass = Class.forName("Main", true, loader);
+                    Method main = mainClass.getMethod("main", String[].class);
+                    if (!Modifier.isStatic(main.getModifiers())) {
+                        throw new NoSuchMethodException("Main.main must be static");
+                    }
+                    main.invoke(null, (Object) new String[0]);
+                } catch (InvocationTargetException e) {
+                    Throwable cause = e.getCause();
+                    if (cause instanceof ExitTrap) {
+                        exitCode[0] = ((ExitTrap) cause).status;
+                    } else {
+                        programErr.print("Exception in thread \"main\" ");
+                        cause.printStackTrace(programErr);
+                        exitCode[0] = 1;
+                    }
+                } catch (ExitTrap e) {
+                    exitCode[0] = e.status;
+                } catch (Throwable e) {
+                    programErr.println("Error: " + e);
+                    exitCode[0] = 1;
+                } finally {
+                    usage[1] = threadCpuTime();
+                    done.countDown();
+                }
+            }
+        }, "main");
+
+        int outcome = OUTCOME_EXITED;
+        try {
+            thread.start();
+            boolean ended = done.await(timeLimitMillis, TimeUnit.MILLISECONDS);
+            if (budget.exceeded()) {
+                outcome = OUTCOME_OUTPUT_LIMIT;
+            } else if (!ended) {
+                outcome = OUTCOME_TIMEOUT;
+            }
+            stopSubmissionThreads();
+            programOut.flush();
+            programErr.flush();
+        } finally {
+            System.setIn(savedIn);
+            System.setOut(savedOut);
+            System.setErr(savedErr);
+            loader.close();
+        }
+
+        out.writeInt(outcome);
+        out.writeInt(outcome == OUTCOME_EXITED ? exitCode[0] : -1);
+        writeBytes(out, stdout.toByteArray());
+        writeBytes(out, stderr.toByteArray());
+        writeUsage(out, usage[0], usage[1]);
+    }
+
+    /**
+     * Stop whatever the submission left running (the main thread on timeout,
+     * plus any threads it spawned) so the next run starts from a clean JVM.
+     */
+    @SuppressWarnings("deprecation")
+    static void stopSubmissionThreads() throws InterruptedException {
+        Thread[] threads = new Thread[SUBMISSIONS.activeCount() + 16];
+        int count = SUBMISSIONS.enumerate(threads, true);
+        for (Thread thread : Arrays.copyOf(threads, count)) {
+            thread.stop();
+        }
+        for (Thread thread : Arrays.copyOf(threads, count)) {
+            thread.join(1000);
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        Socket socket = new Socket(InetAddress.getLoopbackAddress(), Integer.parseInt(args[0]));
+        socket.setTcpNoDelay(true);
+        JavaRunner runner = new JavaRunner(socket.getInputStream(), socket.getOutputStream());
+        System.setSecurityManager(new RunnerSecurityManager());
+        runner.serve();
+        Runtime.getRuntime().halt(0);
+    }
+}
@@ -0,0 +1,460 @@
+'use strict';
+/**
+ * Resident Node.js runner for the execution agent.
+ *
+ * The agent (docker/agent/agent.py) starts this script once with a Unix
+ * socket path and sends length-prefixed JSON frames {script, stdin,
+ * time_limit, max_output}; the reply is {stdout, stderr, exit_code,
+ * timed_out, truncated, resources}. A run whose combined output exceeds
+ * max_output (MAX_OUTPUT_BYTES if unset) is ended at once and reported as
+ * truncated. Each submission runs in a fresh vm context inside one of a pool
+ * of pre-started worker threads, so a run skips V8 and Node bootstrap.
+ *
+ * The context shares Buffer, URL, the module cache and the other host
+ * objects of its worker, and a submission can patch them. A worker
+ * therefore serves a single run and is replaced by a fresh one, which boots
+ * while other workers run, so the next run still finds one ready. The main
+ * thread also enforces the output cap, since the worker's own accounting
+ * can be tampered with.
+ */
+const fs = require('fs');
+const net = require('net');
+const path = require('path');
+const { Worker, isMainThread, parentPort } = require('worker_threads');
+
+const WORKERS = parseInt(process.env.NODE_RUNNER_WORKERS || '2', 10);
+const MEMORY_MB = parseInt(process.env.NODE_RUNNER_MEMORY_MB || '256', 10);
+// Time a worker gets past the limit to wind a run down itself before the
+// main thread terminates it
+const GRACE_MS = 500;
+const FLUSH_BYTES = 64 * 1024;
+const MAX_OUTPUT_BYTES = 16 * 1024 * 1024;
+// USER_HZ, the unit of CPU times in /proc
+const CLOCK_TICKS = 100;
+
+function readFrames(socket, onFrame) {
+    let buffer = Buffer.alloc(0);
+    socket.on('data', chunk => {
+        buffer = Buffer.concat([buffer, chunk]);
+        while (buffer.length >= 4) {
+            const length = buffer.readUInt32BE(0);
+            if (buffer.length < 4 + length) {
+                break;
+            }
+            onFrame(JSON.parse(buffer.subarray(4, 4 + length).toString('utf8')));
+            buffer = buffer.subarray(4 + length);
+        }
+    });
+}
+
+function writeFrame(socket, message) {
+    const payload = Buffer.from(JSON.stringify(message), 'utf8');
+    const header = Buffer.alloc(4);
+    header.writeUInt32BE(payload.length, 0);
+    socket.write(Buffer.concat([header, payload]));
+}
+
+class WorkerPool {
+    constructor(size) {
+        this.idle = [];
+        this.waiting = [];
+        for (let i = 0; i < size; i++) {
+            this.idle.push(this.spawn());
+        }
+    }
+
+    spawn() {
+        const worker = new Worker(__filename, {
+            resourceLimits: { maxOldGenerationSizeMb: MEMORY_MB },
+        });
+        worker.ready = false;
+        worker.once('online', () => {
+            worker.ready = true;
+        });
+        // Errors are handled per run; this keeps late ones from a
+        // terminated worker from crashing the runner
+        worker.on('error', () => {});
+        return worker;
+    }
+
+    acquire() {
+        if (this.idle.length) {
+            // Prefer a worker that has finished booting
+            const ready = this.idle.findIndex(worker => worker.ready);
+            return Promise.resolve(this.idle.splice(ready === -1 ? 0 : ready, 1)[0]);
+        }
+        return new Promise(resolve => this.waiting.push(resolve));
+    }
+
+    release(worker) {
+        if (this.waiting.length) {
+            this.waiting.shift()(worker);
+        } else {
+            this.idle.push(worker);
+        }
+    }
+
+    run(request) {
+        return this.acquire().then(worker => new Promise(resolve => {
+            const output = { stdout: [], stderr: [] };
+            const maxOutput = request.max_output == null ? MAX_OUTPUT_BYTES : request.max_output;
+            let outputBytes = 0;
+            let finished = false;
+
+            const finish = result => {
+                if (finished) {
+                    return;
+                }
+                finished = true;
+                clearTimeout(timer);
+                worker.off('message', onMessage);
+                worker.off('error', onError);
+                worker.off('exit', onExit);
+                // Whatever the run left behind in the worker goes with it
+                worker.terminate();
+                this.release(this.spawn());
+                resolve(Object.assign({
+                    stdout: output.stdout.join(''),
+                    stderr: output.stderr.join(''),
+                }, result));
+            };
+            const onMessage = message => {
+                if (message.stream) {
+                    const data = Buffer.from(String(message.data), 'utf8');
+                    const room = maxOutput - outputBytes;
+                    output[message.stream].push(data.subarray(0, room).toString('utf8'));
+                    outputBytes += Math.min(data.length, room);
+                    if (data.length > room) {
+                        finish({ exit_code: null, timed_out: false, truncated: true, resources: null });
+                    }
+                } else if (message.done) {
+                    finish({
+                        exit_code: message.timedOut || message.truncated ? null : message.exitCode,
+                        timed_out: message.timedOut,
+                        truncated: message.truncated,
+                        resources: message.resources,
+                    });
+                }
+            };
+            const onError = error => {
+                output.stderr.push(`${error.message}\n`);
+                finish({ exit_code: 1, timed_out: false, resources: null });
+            };
+            const onExit = code => finish({ exit_code: code || 1, timed_out: false, resources: null });
+
+            worker.on('message', onMessage);
+            worker.on('error', onError);
+            worker.on('exit', onExit);
+            const timer = setTimeout(
+                () => finish({ exit_code: null, timed_out: true, resources: null }),
+                request.time_limit * 1000 + GRACE_MS
+            );
+            worker.postMessage(request);
+        }));
+    }
+}
+
+function serve(socketPath) {
+    const pool = new WorkerPool(WORKERS);
+    try {
+        fs.unlinkSync(socketPath);
+    } catch (e) {
+        // Nothing left over from a previous runner
+    }
+    const server = net.createServer(socket => {
+        socket.on('error', () => {});
+        readFrames(socket, request => {
+            pool.run(request).then(response => writeFrame(socket, response));
+        });
+    });
+    server.listen(socketPath, () => console.log(`Node runner listening on ${socketPath}`));
+}
+
+/* Worker side */
+
+/**
+ * [user, system] CPU ticks of the calling thread. Synchronous fs calls run
+ * on the calling thread, so /proc/thread-self is this worker's thread.
+ */
+function threadCpuTime() {
+    try {
+        const stat = fs.readFileSync('/proc/thread-self/stat', 'utf8');
+        const fields = stat.slice(stat.lastIndexOf(')') + 2).split(' ');
+        return [parseInt(fields[11], 10), parseInt(fields[12], 10)];
+    } catch (e) {
+        return null;
+    }
+}
+
+class ExitSignal {
+    constructor(code) {
+        this.code = code;
+    }
+}
+
+class Run {
+    constructor(request) {
+        this.request = request;
+        this.timers = new Map();
+        this.finished = false;
+        this.buffers = { stdout: [], stderr: [] };
+        this.pendingBytes = 0;
+        this.outputBytes = 0;
+        this.maxOutput = request.max_output == null ? MAX_OUTPUT_BYTES : request.max_output;
+        this.cpuStart = threadCpuTime();
+    }
+
+    write(stream, chunk) {
+        if (this.finished) {
+            return;
+        }
+        let data = typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString('utf8');
+        let bytes = Buffer.byteLength(data);
+        const overrun = this.outputBytes + bytes > this.maxOutput;
+        if (overrun) {
+            const room = this.maxOutput - this.outputBytes;
+            data = Buffer.from(data, 'utf8').subarray(0, room).toString('utf8');
+            bytes = room;
+        }
+        this.outputBytes += bytes;
+        this.pendingBytes += bytes;
+        this.buffers[stream].push(data);
+        if (overrun) {
+            this.finish(null, false, true);
+        } else if (this.pendingBytes >= FLUSH_BYTES) {
+            this.flush();
+        }
+    }
+
+    flush() {
+        for (const stream of ['stdout', 'stderr']) {
+            if (this.buffers[stream].length) {
+                parentPort.postMessage({ stream, data: this.buffers[stream].join('') });
+                this.buffers[stream] = [];
+            }
+        }
+        this.pendingBytes = 0;
+    }
+
+    /** Wrap a callback so a throw or process.exit() inside it ends the run */
+    guard(fn) {
+        const run = this;
+        return function (...args) {
+            if (run.finished) {
+                return undefined;
+            }
+            try {
+                return fn.apply(this, args);
+            } catch (error) {
+                run.fail(error);
+                return undefined;
+            }
+        };
+    }
+
+    fail(error) {
+        if (this.finished) {
+            return;
+        }
+        if (error instanceof ExitSignal) {
+            this.finish(error.code);
+            return;
+        }
+        if (error && error.code === 'ERR_SCRIPT_EXECUTION_TIMEOUT') {
+            this.finish(null, true);
+            return;
+        }
+        const util = require('util');
+        this.write('stderr', `${error && error.stack ? error.stack : util.inspect(error)}\n`);
+        this.finish(1);
+    }
+
+    finish(exitCode, timedOut = false, truncated = false) {
+        if (this.finished) {
+            return;
+        }
+        this.finished = true;
+        clearTimeout(this.deadline);
+        for (const [handle, clear] of this.timers) {
+            clear(handle);
+        }
+        this.stdin.destroy();
+        this.flush();
+        // The worker's heap and I/O are shared with earlier runs, so only
+        // CPU time can be attributed to this one
+        const cpuEnd = threadCpuTime();
+        const resources = this.cpuStart && cpuEnd ? {
+            cpu_user: (cpuEnd[0] - this.cpuStart[0]) / CLOCK_TICKS,
+            cpu_sys: (cpuEnd[1] - this.cpuStart[1]) / CLOCK_TICKS,
+            max_memory_kb: null,
+            read_bytes: null,
+            write_bytes: null,
+        } : null;
+        parentPort.postMessage({ done: true, exitCode: exitCode || 0, timedOut, truncated, resources });
+    }
+
+    stdinIdle() {
+        const stdin = this.stdin;
+        return stdin.readableEnded || stdin.destroyed
+            || stdin.listenerCount('data') + stdin.listenerCount('readable') === 0;
+    }
+
+    settle() {
+        if (this.finished) {
+            return;
+        }
+        if (this.timers.size === 0 && this.stdinIdle()) {
+            this.finish(this.process.exitCode);
+        } else {
+            setTimeout(() => this.settle(), 1);
+        }
+    }
+
+    globals() {
+        const { Console } = require('console');
+        const Module = require('module');
+        const { Readable, Writable } = require('stream');
+        const run = this;
+        const scriptPath = this.request.script;
+        const stdinBuffer = Buffer.from(this.request.stdin || '', 'utf8');
+
+        this.stdin = Readable.from([stdinBuffer], { objectMode: false });
+        const output = stream => new Writable({
+            write(chunk, encoding, callback) {
+                run.write(stream, chunk);
+                callback();
+            },
+        });
+        const stdout = output('stdout');
+        const stderr = output('stderr');
+
+        const processShim = this.process = {
+            argv: [process.argv[0], scriptPath],
+            env: Object.assign({}, process.env),
+            platform: process.platform,
+            version: process.version,
+            versions: process.versions,
+            exitCode: undefined,
+            stdin: this.stdin,
+            stdout,
+            stderr,
+            cwd: () => path.dirname(scriptPath),
+            exit: code => {
+                throw new ExitSignal(code === undefined ? processShim.exitCode : code);
+            },
+            hrtime: process.hrtime,
+            memoryUsage: process.memoryUsage,
+            uptime: process.uptime,
+            nextTick: (fn, ...args) => process.nextTick(run.guard(fn), ...args),
+            on: () => processShim,
+            once: () => processShim,
+            off: () => processShim,
+        };
+
+        const readStdin = (options) => {
+            const encoding = typeof options === 'string' ? options : options && options.encoding;
+            return encoding ? stdinBuffer.toString(encoding) : Buffer.from(stdinBuffer);
+        };
+        const fsShim = Object.create(fs);
+        fsShim.readFileSync = (file, options) => (file === 0 || file === '/dev/stdin')
+            ? readStdin(options)
+            : fs.readFileSync(file, options);
+
+        const realRequire = Module.createRequire(scriptPath);
+        const requireShim = name => {
+            switch (name.replace(/^node:/, '')) {
+                case 'fs':
+                    return fsShim;
+                case 'process':
+                    return processShim;
+                default:
+                    return realRequire(name);
+            }
+        };
+        requireShim.resolve = realRequire.resolve;
+
+        const timer = (set, clear, repeat) => [
+            (fn, ...args) => {
+                const guarded = run.guard(fn);
+                const handle = set((...callbackArgs) => {
+                    if (!repeat) {
+                        run.timers.delete(handle);
+                    }
+                    guarded(...callbackArgs);
+                }, ...args);
+                run.timers.set(handle, clear);
+                return handle;
+            },
+            handle => {
+                run.timers.delete(handle);
+                clear(handle);
+            },
+        ];
+        const [setTimeoutShim, clearTimeoutShim] = timer(setTimeout, clearTimeout, false);
+        const [setIntervalShim, clearIntervalShim] = timer(setInterval, clearInterval, true);
+        const [setImmediateShim, clearImmediateShim] = timer(setImmediate, clearImmediate, false);
+
+        const module = { exports: {} };
+        return {
+            console: new Console({ stdout, stderr }),
+            process: processShim,
+            require: requireShim,
+            module,
+            exports: module.exports,
+            __filename: scriptPath,
+            __dirname: path.dirname(scriptPath),
+            Buffer,
+            setTimeout: setTimeoutShim,
+            clearTimeout: clearTimeoutShim,
+            setInterval: setIntervalShim,
+            clearInterval: clearIntervalShim,
+            setImmediate: setImmediateShim,
+            clearImmediate: clearImmediateShim,
+            queueMicrotask,
+            TextEncoder,
+            TextDecoder,
+            URL,
+            URLSearchParams,
+        };
+    }
+
+    start() {
+        const vm = require('vm');
+        const timeLimitMs = this.request.time_limit * 1000;
+        const context = vm.createContext(this.globals());
+        vm.runInContext('globalThis.global = globalThis;', context);
+        // Bounds asynchronous work; synchronous code is bounded by the vm
+        // timeout below
+        this.deadline = setTimeout(() => this.finish(null, true), timeLimitMs);
+        try {
+            const source = fs.readFileSync(this.request.script, 'utf8').replace(/^#!.*/, '');
+            new vm.Script(source, { filename: this.request.script })
+                .runInContext(context, { timeout: timeLimitMs });
+        } catch (error) {
+            this.fail(error);
+            return;
+        }
+        setImmediate(() => this.settle());
+    }
+}
+
+function runWorker() {
+    let current = null;
+    const fail = error => {
+        if (current) {
+            current.fail(error);
+        }
+    };
+    process.on('uncaughtException', fail);
+    process.on('unhandledRejection', fail);
+    parentPort.on('message', request => {
+        current = new Run(request);
+        current.start();
+    });
+}
+
+if (isMainThread) {
+    serve(process.argv[2] || process.env.NODE_RUNNER_SOCKET || '/tmp/node_runner.sock');
+} else {
+    runWorker();
+}
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Pre-forked interpreter server for Python submissions.
+
+Started by the execution agent in the python image. The parent imports the
+modules LeetCode-style solutions reach for once, then forks a child per
+submission, so a run costs a fork() instead of interpreter startup plus
+imports. Each child gets a fresh __main__, the caller's stdio and rlimits.
+
+The agent connects to the Unix socket and sends one length-prefixed JSON
+frame {"script", "time_limit"} with its stdin/stdout/stderr descriptors
+attached (SCM_RIGHTS). The server answers {"pid"} once the child is forked
+and {"exit_code", "resources"} when it has been reaped; exit codes follow
+subprocess (negative for signals) and resources are the child's wait4()
+usage.
+"""
+import array
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+
+# Imported for their side effect of being warm in every child
+import bisect  # noqa: F401
+import collections  # noqa: F401
+import functools  # noqa: F401
+import heapq  # noqa: F401
+import itertools  # noqa: F401
+import math  # noqa: F401
+import random
+import re  # noqa: F401
+import resource
+import string  # noqa: F401
+import traceback
+import types
+import typing  # noqa: F401
+
+SOCKET_PATH = os.environ.get("PYTHON_ZYGOTE_SOCKET", "/tmp/zygote.sock")
+MEMORY_LIMIT_MB = int(os.environ.get("PYTHON_ZYGOTE_MEMORY_MB", "512"))
+
+HEADER = struct.Struct(">I")
+FD_COUNT = 3
+
+
+def send_frame(sock, message, fds=()):
+    payload = json.dumps(message).encode("utf-8")
+    data = HEADER.pack(len(payload)) + payload
+    ancillary = []
+    if fds:
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+    sock.sendmsg([data], ancillary)
+
+
+def recv_frame(sock):
+    """Returns (message, fds), or (None, []) once the peer has closed"""
+    fds = array.array("i")
+    data, ancillary, _, _ = sock.recvmsg(65536, socket.CMSG_LEN(FD_COUNT * fds.itemsize))
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+    if len(data) < HEADER.size:
+        return None, list(fds)
+    (length,) = HEADER.unpack(data[:HEADER.size])
+    data = data[HEADER.size:]
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            return None, list(fds)
+        data += chunk
+    return json.loads(data.decode("utf-8")), list(fds)
+
+
+def exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def resource_usage(rusage):
+    return {
+        "cpu_user": round(rusage.ru_utime, 6),
+        "cpu_sys": round(rusage.ru_stime, 6),
+        "max_memory_kb": rusage.ru_maxrss,
+        "read_bytes": rusage.ru_inblock * 512,
+        "write_bytes": rusage.ru_oublock * 512,
+    }
+
+
+def run_child(request, fds):
+    """Runs in the forked child; never returns"""
+    code = 1
+    try:
+        os.setsid()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+
+        time_limit = int(request.get("time_limit", 30))
+        resource.setrlimit(resource.RLIMIT_CPU, (time_limit + 1, time_limit + 1))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if MEMORY_LIMIT_MB:
+            limit = MEMORY_LIMIT_MB * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        script = request["script"]
+        os.chdir(os.path.dirname(script))
+        sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+        sys.stderr = open(2, "w", encoding="utf-8", closefd=False, buffering=1)
+        sys.argv = [script]
+        sys.path[0] = os.path.dirname(script)
+        # Children would otherwise all inherit the parent's generator state
+        random.seed()
+
+        main = types.ModuleType("__main__")
+        main.__file__ = script
+        sys.modules["__main__"] = main
+        with open(script) as f:
+            source = f.read()
+        try:
+            exec(compile(source, script, "exec"), main.__dict__)
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BaseException:
+        try:
+            traceback.print_exc()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+    finally:
+        os._exit(code & 0xFF)
+
+
+def serve(path):
+    if os.path.exists(path):
+        os.remove(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(64)
+
+    # SIGCHLD wakes the selector through a self-pipe so reaping stays in
+    # the single-threaded loop
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(wakeup_r, selectors.EVENT_READ, "reap")
+    children = {}
+
+    print("Python zygote listening on %s" % path, flush=True)
+    while True:
+        for key, _ in selector.select():
+            if key.data == "accept":
+                conn, _ = listener.accept()
+                try:
+                    request, fds = recv_frame(conn)
+                except (OSError, ValueError):
+                    conn.close()
+                    continue
+                if request is None or len(fds) != FD_COUNT:
+                    for fd in fds:
+                        os.close(fd)
+                    conn.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    selector.close()
+                    listener.close()
+                    conn.close()
+                    os.close(wakeup_r)
+                    os.close(wakeup_w)
+                    run_child(request, fds)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                try:
+                    send_frame(conn, {"pid": pid})
+                except OSError:
+                    pass
+            else:
+                try:
+                    while os.read(wakeup_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+                while children:
+                    try:
+                        pid, status, rusage = os.wait4(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    conn = children.pop(pid, None)
+                    if conn is None:
+                        continue
+                    try:
+                        send_frame(conn, {"exit_code": exit_code(status), "resources": resource_usage(rusage)})
+                    except OSError:
+                        pass
+                    conn.close()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Throughput and latency benchmark for the LeetCode Compiler API
+
+Closed loop: --concurrency clients each send their next request as soon as
+the previous one finished. Open loop: requests arrive at --rate per second
+whether or not earlier ones finished, and latency is counted from the
+scheduled send time, so a backed-up service shows as latency instead of
+quietly lowering the load.
+
+Flows:
+  direct  POST /api/execute/direct
+  queue   POST /api/execute, then long-poll GET /api/job/<id> until done
+  cases   POST /api/execute/cases, then long-poll until done
+
+The report (JSON on stdout, or --output) has jobs/sec, p50/p95/p99 latency
+overall and per language, outcome counts and the mean server-side phase
+timings, tagged with the git commit for comparison across commits.
+
+To benchmark the API and queue layers without Docker, start Redis and run
+the API and worker with EXECUTION_BACKEND=stub (see README).
+"""
+import argparse
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+# Each program echoes its first line of input, so results can be checked
+PROGRAMS = {
+    "python": "print(input())",
+    "nodejs": "console.log(require('fs').readFileSync(0, 'utf8').split('\\n')[0])",
+    "cpp": "#include <iostream>\n#include <string>\n"
+           "int main() { std::string s; std::getline(std::cin, s); std::cout << s << std::endl; }",
+    "java": "import java.util.Scanner;\n"
+            "public class Main { public static void main(String[] a) {"
+            " System.out.println(new Scanner(System.in).nextLine()); } }",
+}
+
+CASES_PER_REQUEST = 5
+
+
+def parse_mix(spec):
+    """"python=3,cpp=1" into ([languages], [weights])"""
+    languages, weights = [], []
+    for entry in spec.split(","):
+        name, _, weight = entry.strip().partition("=")
+        if name not in PROGRAMS:
+            raise argparse.ArgumentTypeError(f"Unknown language: {name}. Supported: {list(PROGRAMS)}")
+        languages.append(name)
+        weights.append(float(weight) if weight else 1.0)
+    return languages, weights
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(values)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.url = args.url.rstrip("/")
+        self.languages, self.weights = args.mix
+        self.results = []
+        self.lock = threading.Lock()
+        self.sessions = threading.local()
+        self.sequence = 0
+        self.submitted = 0
+
+    def session(self):
+        if not hasattr(self.sessions, "session"):
+            self.sessions.session = requests.Session()
+        return self.sessions.session
+
+    def next_request(self):
+        with self.lock:
+            self.sequence += 1
+            number = self.sequence
+        language = random.choices(self.languages, self.weights)[0]
+        # A distinct stdin per request keeps the result cache out of the way
+        return number, language, f"bench-{number}-{random.getrandbits(32):08x}"
+
+    def run_one(self, scheduled=None):
+        number, language, token = self.next_request()
+        started = time.time()
+        scheduled = scheduled or started
+        record = {"language": language, "warmup": number <= self.args.warmup}
+        try:
+            result, enqueued = getattr(self, f"flow_{self.args.flow}")(language, token)
+            record["outcome"] = result.get("status", "unknown")
+            if self.args.flow != "cases" and record["outcome"] == "success" and result.get("output") != token:
+                record["outcome"] = "wrong_output"
+            record["timings"] = result.get("timings") or {}
+            if enqueued is not None:
+                record["enqueue_latency"] = enqueued - started
+        except HTTPFailure as e:
+            record["outcome"] = f"http_{e.status}"
+        except Exception as e:
+            record["outcome"] = f"exception_{type(e).__name__}"
+        record["latency"] = time.time() - scheduled
+        with self.lock:
+            self.results.append(record)
+
+    def flow_direct(self, language, token):
+        response = self.session().post(
+            f"{self.url}/api/execute/direct",
+            json={"code": PROGRAMS[language], "language": language, "stdin": token},
+            headers=self.headers(), timeout=self.args.timeout
+        )
+        check(response)
+        return response.json(), None
+
+    def flow_queue(self, language, token):
+        response = self.session().post(
+            f"{self.url}/api/execute",
+            json={"code": PROGRAMS[language], "language": language, "stdin": token,
+                  "priority": self.args.priority},
+            headers=self.headers(), timeout=self.args.timeout
+        )
+        check(response)
+        return self.await_job(response.json())
+
+    def flow_cases(self, language, token):
+        response = self.session().post(
+            f"{self.url}/api/execute/cases",
+            json={"code": PROGRAMS[language], "language": language,
+                  "cases": [f"{token}-{i}" for i in range(CASES_PER_REQUEST)],
+                  "priority": self.args.priority},
+            headers=self.headers(), timeout=self.args.timeout
+        )
+        check(response)
+        return self.await_job(response.json())
+
+    def await_job(self, body):
+        enqueued = time.time()
+        if body.get("cached"):
+            return body["result"], enqueued
+        deadline = enqueued + self.args.timeout
+        while time.time() < deadline:
+            response = self.session().get(
+                f"{self.url}/api/job/{body['job_id']}",
+                params={"wait": self.args.poll_wait}, timeout=self.args.poll_wait + 10
+            )
+            check(response)
+            status = response.json()
+            if status["status"] == "completed":
+                return status["result"], enqueued
+            if status["status"] == "failed":
+                return {"status": "job_failed"}, enqueued
+            if self.args.poll_wait <= 0:
+                time.sleep(self.args.poll_interval)
+        return {"status": "client_timeout"}, enqueued
+
+    def headers(self):
+        # Virtual users, so per-client rate limits spread like real traffic
+        return {"X-User-Id": f"bench-{threading.get_ident() % self.args.users}"}
+
+    def closed_loop(self):
+        deadline = time.time() + self.args.duration
+
+        def client():
+            while time.time() < deadline and not self.done():
+                self.run_one()
+
+        threads = [threading.Thread(target=client) for _ in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def open_loop(self):
+        started = time.time()
+        deadline = started + self.args.duration
+        next_send = started
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as pool:
+            while next_send < deadline and not self.done(sent=True):
+                delay = next_send - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.run_one, next_send)
+                with self.lock:
+                    self.submitted += 1
+                next_send += random.expovariate(self.args.rate) if self.args.poisson else 1.0 / self.args.rate
+
+    def done(self, sent=False):
+        if not self.args.requests:
+            return False
+        with self.lock:
+            count = self.submitted if sent else self.sequence
+        return count >= self.args.requests + self.args.warmup
+
+    def run(self):
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        started = time.time()
+        if self.args.mode == "closed":
+            self.closed_loop()
+        else:
+            self.open_loop()
+        return self.report(time.time() - started)
+
+    def report(self, elapsed):
+        measured = [r for r in self.results if not r["warmup"]]
+        ok = [r for r in measured if r["outcome"] == "success"]
+        outcomes = {}
+        for record in measured:
+            outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+        phases = {}
+        for record in ok:
+            for name, seconds in record.get("timings", {}).items():
+                phases.setdefault(name, []).append(seconds)
+        enqueue = [r["enqueue_latency"] for r in measured if "enqueue_latency" in r]
+        config = {k: v for k, v in vars(self.args).items() if k not in ("mix", "output")}
+        config["mix"] = dict(zip(self.languages, self.weights))
+        return {
+            "commit": git_commit(),
+            "started_at": self.started_at,
+            "config": config,
+            "elapsed_seconds": elapsed,
+            "requests": len(measured),
+            "succeeded": len(ok),
+            "jobs_per_second": len(ok) / elapsed if elapsed else 0.0,
+            "outcomes": outcomes,
+            "latency": summarize([r["latency"] for r in ok]),
+            "latency_by_language": {
+                language: summarize([r["latency"] for r in ok if r["language"] == language])
+                for language in self.languages
+            },
+            "enqueue_latency": summarize(enqueue) if enqueue else None,
+            "server_phase_means": {name: sum(v) / len(v) for name, v in sorted(phases.items())},
+        }
+
+
+class HTTPFailure(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+def check(response):
+    if response.status_code != 200:
+        raise HTTPFailure(response.status_code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:5002", help="API base URL")
+    parser.add_argument("--flow", choices=["direct", "queue", "cases"], default="queue")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=20.0, help="arrivals per second in open-loop mode")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times (open loop)")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="open-loop request threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send requests for")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0: duration only)")
+    parser.add_argument("--warmup", type=int, default=0, help="initial requests left out of the report")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("python"),
+                        help='language weights, e.g. "python=3,nodejs=1,cpp=1,java=1"')
+    parser.add_argument("--priority", default="run", help="queue priority class for queued flows")
+    parser.add_argument("--users", type=int, default=1000, help="distinct X-User-Id values to spread load over")
+    parser.add_argument("--poll-wait", type=float, default=25.0, help="long-poll seconds per status request (0: plain polling)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="sleep between plain polls")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request give-up time")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = Benchmark(args).run()
+    body = json.dumps(report, indent=2)
+    print(body)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body + "\n")
+    return 0 if report["succeeded"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from rq import Queue, Worker
+
+from api.execution import SUPPORTED_LANGUAGES
+
+logger = logging.getLogger(__name__)
+
+# Intake is refused with 503 once a queue holds this many jobs or its
+# estimated wait (depth x average job time / worker slots) exceeds
+# ADMISSION_MAX_WAIT seconds
+MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "1000"))
+MAX_ESTIMATED_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "60"))
+
+# Assumed job time for a queue until workers have reported real ones
+DEFAULT_JOB_SECONDS = 2.0
+JOB_SECONDS_KEY = "admission:job_seconds"
+# Weight of the newest job in the per-queue moving average
+JOB_SECONDS_ALPHA = 0.1
+
+# Worker slots per queue are looked up at most this often per process
+CAPACITY_CACHE_SECONDS = 5
+
+# Token buckets per client: RATE_LIMIT_PER_MINUTE requests refilled evenly,
+# up to RATE_LIMIT_BURST at once. Each language has its own bucket too,
+# sized by RATE_LIMIT_PER_MINUTE_<LANGUAGE> (defaults to the overall rate).
+# 0 disables rate limiting.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+LANGUAGE_RATE_LIMITS = {
+    language: float(os.getenv(f"RATE_LIMIT_PER_MINUTE_{language.upper()}", str(RATE_LIMIT_PER_MINUTE)))
+    for language in SUPPORTED_LANGUAGES
+}
+BUCKET_KEY = "ratelimit:{}"
+
+# Batches (e.g. rejudges) draw on a bucket of their own per client, one
+# token per submission, so that the largest batch the API accepts
+# (MAX_BATCH_JOBS) fits its burst. 0 disables it.
+BATCH_RATE_LIMIT_PER_MINUTE = float(os.getenv("BATCH_RATE_LIMIT_PER_MINUTE", "1000"))
+BATCH_RATE_LIMIT_BURST = float(os.getenv("BATCH_RATE_LIMIT_BURST", os.getenv("MAX_BATCH_JOBS", "1000")))
+BATCH_BUCKET_KEY = "ratelimit:batch:{}"
+
+# Addresses of the gateways allowed to name the user in X-User-Id (comma
+# separated). The header is ignored on requests from anywhere else, so
+# clients can't pick their own rate limit bucket.
+TRUSTED_PROXIES = {addr.strip() for addr in os.getenv("TRUSTED_PROXIES", "").split(",") if addr.strip()}
+
+# Takes its count of tokens from every bucket, or nothing from any if one
+# falls short. KEYS are the bucket hashes; ARGV holds now and then (rate per
+# second, capacity, count) per bucket. Returns 0 when admitted, -1 when a
+# count exceeds its bucket's capacity, otherwise the seconds (as a string,
+# Lua numbers are truncated to integers) until all buckets hold enough.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local count = tonumber(ARGV[i * 3 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if count > capacity then
+        wait = -1
+    elseif tokens < count and wait >= 0 then
+        wait = math.max(wait, (count - tokens) / rate)
+    end
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local capacity = tonumber(ARGV[i * 3])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - tonumber(ARGV[i * 3 + 1])
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[i], math.ceil(capacity / rate) + 1)
+end
+return tostring(wait)
+"""
+
+# Exponential moving average of job seconds per queue.
+# KEYS[1] is the averages hash; ARGV holds queue name, seconds and alpha.
+JOB_SECONDS_SCRIPT = """
+local previous = tonumber(redis.call('HGET', KEYS[1], ARGV[1]))
+local seconds = tonumber(ARGV[2])
+if previous then
+    seconds = previous + tonumber(ARGV[3]) * (seconds - previous)
+end
+redis.call('HSET', KEYS[1], ARGV[1], tostring(seconds))
+return tostring(seconds)
+"""
+
+
+class Rejected(Exception):
+    """A request turned away; maps to an HTTP status with Retry-After"""
+
+    def __init__(self, status: int, message: str, retry_after: float):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def record_job_time(conn, queue_name: str, seconds: float) -> None:
+    """Fold a finished job's run time into its queue's average; best effort"""
+    try:
+        conn.register_script(JOB_SECONDS_SCRIPT)(
+            keys=[JOB_SECONDS_KEY], args=[queue_name, seconds, JOB_SECONDS_ALPHA]
+        )
+    except Exception as e:
+        logger.warning(f"Could not record job time for {queue_name}: {e}")
+
+
+class AdmissionController:
+    """
+    Decides whether the API accepts a request before any work is queued.
+
+    Clients are rate limited with token buckets kept in Redis, so limits
+    hold across API processes. Queues are protected by depth and estimated
+    wait thresholds. Redis errors admit the request: the limiter must not
+    become the outage.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._capacity: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def check_rate(self, client: str, language: str) -> None:
+        """Take a token for `client`; raises Rejected (429) if none is left"""
+        self.check_rates(client, {language: 1})
+
+    def check_rates(self, client: str, counts: Dict[str, int]) -> None:
+        """
+        Take a token per submission for `client`, counted by language, all
+        at once or not at all; raises Rejected (429) if too few are left
+        """
+        rates: List[Tuple[str, float, float, int]] = [
+            (BUCKET_KEY.format(client), RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, sum(counts.values()))
+        ]
+        for language, count in counts.items():
+            if language in LANGUAGE_RATE_LIMITS:
+                rates.append((
+                    BUCKET_KEY.format(f"{client}:{language}"), LANGUAGE_RATE_LIMITS[language], RATE_LIMIT_BURST, count
+                ))
+        self._take(rates)
+
+    def check_batch_rate(self, client: str, count: int) -> None:
+        """Take `count` tokens from `client`'s batch bucket; raises Rejected (429) if too few are left"""
+        self._take([(BATCH_BUCKET_KEY.format(client), BATCH_RATE_LIMIT_PER_MINUTE, BATCH_RATE_LIMIT_BURST, count)])
+
+    def _take(self, rates: List[Tuple[str, float, float, int]]) -> None:
+        """Run the token bucket script over (key, rate per minute, burst, count) buckets"""
+        rates = [bucket for bucket in rates if bucket[1] > 0 and bucket[3] > 0]
+        if not rates:
+            return
+        args = [time.time()]
+        for _, rate, burst, count in rates:
+            args += [rate / 60.0, burst, count]
+        try:
+            wait = float(self.conn.register_script(TOKEN_BUCKET_SCRIPT)(
+                keys=[key for key, _, _, _ in rates], args=args
+            ))
+        except Exception as e:
+            logger.warning(f"Rate limit check failed, admitting request: {e}")
+            return
+        if wait < 0:
+            burst = min(burst for _, _, burst, _ in rates)
+            raise Rejected(
+                429,
+                f"{max(count for _, _, _, count in rates)} submissions exceed the rate limit burst of "
+                f"{burst:g}, send smaller batches",
+                max(burst / (rate / 60.0) for _, rate, burst, _ in rates)
+            )
+        if wait > 0:
+            raise Rejected(429, "Rate limit exceeded, retry later", wait)
+
+    def check_capacity(self, queue: Queue, incoming: int = 1) -> None:
+        """Raises Rejected (503) when `queue` is too deep or too slow to take `incoming` more jobs"""
+        try:
+            depth = queue.count
+            # Jobs ahead of the last one admitted
+            ahead = depth + incoming - 1
+            if ahead <= 0:
+                return
+            job_seconds = self.conn.hget(JOB_SECONDS_KEY, queue.name)
+            job_seconds = float(job_seconds) if job_seconds else DEFAULT_JOB_SECONDS
+            slots = max(self._slots(queue), 1)
+        except Exception as e:
+            logger.warning(f"Admission check failed for {queue.name}, admitting request: {e}")
+            return
+
+        drain_rate = slots / job_seconds
+        estimated_wait = ahead / drain_rate
+        if ahead >= MAX_QUEUE_DEPTH:
+            retry_after = (ahead - MAX_QUEUE_DEPTH + 1) / drain_rate
+        elif estimated_wait > MAX_ESTIMATED_WAIT:
+            retry_after = estimated_wait - MAX_ESTIMATED_WAIT
+        else:
+            return
+        raise Rejected(
+            503,
+            f"Queue {queue.name} is overloaded ({depth} jobs, ~{estimated_wait:.0f}s wait), retry later",
+            retry_after
+        )
+
+    def _slots(self, queue: Queue) -> int:
+        """Job slots of the workers serving `queue`, cached briefly"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._capacity.get(queue.name)
+        if cached is not None and now - cached[0] < CAPACITY_CACHE_SECONDS:
+            return cached[1]
+        keys = Worker.all_keys(connection=self.conn, queue=queue)
+        slots = 0
+        if keys:
+            pipe = self.conn.pipeline(transaction=False)
+            for key in keys:
+                pipe.hget(key, "slots")
+            slots = sum(int(value or 1) for value in pipe.execute())
+        with self._lock:
+            self._capacity[queue.name] = (now, slots)
+        return slots
+
+
+def user_id(request) -> Optional[str]:
+    """X-User-Id of a request that came through a trusted proxy, else None"""
+    if request.remote_addr in TRUSTED_PROXIES:
+        return request.headers.get("X-User-Id")
+    return None
+
+
+def client_id(request) -> str:
+    """
+    Rate limit identity of a request: the user id set by a trusted gateway
+    in X-User-Id when present, otherwise the client address
+    """
+    user = user_id(request)
+    if user:
+        return f"user:{user}"
+    return f"ip:{request.remote_addr}"
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Port the resident agent (docker/agent/agent.py) listens on inside each
+# language container. Containers are reached by name on the compose network.
+AGENT_PORT = int(os.getenv("AGENT_PORT", "7100"))
+CONNECT_TIMEOUT = float(os.getenv("AGENT_CONNECT_TIMEOUT", "2"))
+
+HEADER = struct.Struct(">I")
+
+
+class AgentError(Exception):
+    """The agent could not be reached or answered with an error"""
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("Agent closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class AgentClient:
+    """Keeps idle connections to each agent and reuses them across calls"""
+
+    def __init__(self, port: int = AGENT_PORT):
+        self.port = port
+        self._idle: Dict[str, List[socket.socket]] = {}
+        self._lock = threading.Lock()
+
+    def _checkout(self, container: str):
+        with self._lock:
+            idle = self._idle.get(container)
+            if idle:
+                return idle.pop(), True
+        return socket.create_connection((container, self.port), timeout=CONNECT_TIMEOUT), False
+
+    def _checkin(self, container: str, sock: socket.socket) -> None:
+        with self._lock:
+            self._idle.setdefault(container, []).append(sock)
+
+    def call(self, container: str, request: Dict[str, Any], timeout: float,
+             on_chunk: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """
+        Send `request` and return the agent's response.
+
+        Streaming requests are answered with {"chunk": stream, "data"} frames
+        while the program runs; those are passed to `on_chunk` and the final
+        frame is returned.
+        """
+        payload = json.dumps(request).encode("utf-8")
+        # A reused connection may have been closed by an agent restart; retry
+        # once on a fresh connection in that case
+        for _ in range(2):
+            try:
+                sock, reused = self._checkout(container)
+            except OSError as e:
+                raise AgentError(f"Cannot connect to agent in {container}: {e}")
+            try:
+                sock.settimeout(timeout)
+                sock.sendall(HEADER.pack(len(payload)) + payload)
+                while True:
+                    (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+                    response = json.loads(_recv_exact(sock, length).decode("utf-8"))
+                    if "chunk" not in response:
+                        break
+                    if on_chunk:
+                        on_chunk(response["chunk"], response["data"])
+            except socket.timeout:
+                sock.close()
+                raise
+            except (OSError, ValueError) as e:
+                sock.close()
+                if reused:
+                    continue
+                raise AgentError(f"Agent call to {container} failed: {e}")
+            self._checkin(container, sock)
+            if "error" in response:
+                raise AgentError(response["error"])
+            return response
+        raise AgentError(f"Agent call to {container} failed")
+
+    def ping(self, container: str) -> bool:
+        try:
+            return bool(self.call(container, {"op": "ping"}, CONNECT_TIMEOUT).get("ok"))
+        except (AgentError, socket.timeout):
+            return False
+
+
+agent_client = AgentClient()
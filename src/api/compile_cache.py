@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import secrets
+import shlex
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api.redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Compiled artifacts live inside the language containers, one directory per
+# content hash. The workers keep the LRU bookkeeping in Redis, shared by all
+# of them, and tell the container which directories to drop once the size
+# budget is exceeded.
+CACHE_ROOT = os.getenv("COMPILE_CACHE_DIR", "/tmp/compile_cache")
+CACHE_MAX_BYTES = int(os.getenv("COMPILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_ENABLED = os.getenv("COMPILE_CACHE_ENABLED", "1") != "0"
+
+# Artifacts are built and owned by CACHE_USER and are read-only to RUN_USER,
+# the user submissions run as, so a submission cannot replace the binary a
+# later submission with the same hash runs. Cached executions therefore exec
+# into the container as root and switch users with runuser.
+CACHE_USER = os.getenv("COMPILE_CACHE_USER", "compiler")
+RUN_USER = os.getenv("CONTAINER_RUN_USER", "executor")
+
+# Compiler versions are queried once per container and kept this long, so a
+# rebuilt image is noticed
+VERSION_TTL = int(os.getenv("COMPILE_CACHE_VERSION_TTL", "3600"))
+
+# Last use of each artifact (ZSET) and its size (hash, plus a "total"
+# field) per container, evicted artifacts not yet removed from the container
+# (list), compiler versions and the hit/miss counters
+LRU_KEY = "compile_cache:lru:{}"
+SIZES_KEY = "compile_cache:sizes:{}"
+EVICTED_KEY = "compile_cache:evicted:{}"
+VERSION_KEY = "compile_cache:version:{}:{}"
+STATS_KEY = "compile_cache:stats"
+
+# Records a lookup of artifact ARGV[2] at time ARGV[1]. ARGV[3] is the size
+# stored by a miss ("" for a hit, 0 for a failed compile) and ARGV[4] the
+# size budget; the least recently used artifacts past it move to the
+# eviction list. Returns {hit, hits, misses}.
+RECORD_SCRIPT = """
+local lru, sizes, evicted, stats = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local now, key = tonumber(ARGV[1]), ARGV[2]
+if ARGV[3] == '' then
+    if redis.call('ZSCORE', lru, key) then
+        redis.call('ZADD', lru, now, key)
+    end
+    local hits = redis.call('HINCRBY', stats, 'hits', 1)
+    return {1, hits, tonumber(redis.call('HGET', stats, 'misses') or 0)}
+end
+local misses = redis.call('HINCRBY', stats, 'misses', 1)
+local hits = tonumber(redis.call('HGET', stats, 'hits') or 0)
+local stored = tonumber(ARGV[3])
+if stored > 0 then
+    local previous = tonumber(redis.call('HGET', sizes, key) or 0)
+    redis.call('ZADD', lru, now, key)
+    redis.call('HSET', sizes, key, stored)
+    local total = redis.call('HINCRBY', sizes, 'total', stored - previous)
+    while total > tonumber(ARGV[4]) and redis.call('ZCARD', lru) > 1 do
+        local oldest = redis.call('ZRANGE', lru, 0, 0)[1]
+        total = redis.call('HINCRBY', sizes, 'total', -tonumber(redis.call('HGET', sizes, oldest) or 0))
+        redis.call('ZREM', lru, oldest)
+        redis.call('HDEL', sizes, oldest)
+        redis.call('RPUSH', evicted, oldest)
+    end
+end
+return {0, hits, misses}
+"""
+
+# Marker the compile step writes to stderr on a miss ("stored <kb>" or
+# "failed"), followed by a per-execution nonce from the NONCE_ENV variable.
+# The nonce is only visible to root and CACHE_USER, so the program cannot
+# forge the marker; lines without it are left in the user's stderr.
+MARKER = "__COMPILE_CACHE__"
+NONCE_ENV = "COMPILE_CACHE_NONCE"
+
+COMPILED_LANGUAGES = ("cpp", "java")
+
+# Exit code of coreutils `timeout` when the time limit was hit
+TIMEOUT_EXIT_CODE = 124
+
+COMPILE_FLAGS = {
+    "cpp": os.getenv("CPP_COMPILE_FLAGS", ""),
+    "java": os.getenv("JAVA_COMPILE_FLAGS", ""),
+}
+
+VERSION_COMMANDS = {
+    "cpp": ["g++", "-dumpfullversion"],
+    "java": ["javac", "-version"],
+}
+
+
+def cache_key(code: str, language: str, compiler_version: str, flags: str) -> str:
+    """Content hash identifying a compiled artifact"""
+    digest = hashlib.sha256()
+    for part in (language, compiler_version, flags, code):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def artifact_dir(key: str) -> str:
+    return f"{CACHE_ROOT}/{key}"
+
+
+def new_nonce() -> str:
+    return secrets.token_hex(16)
+
+
+def as_user(user: str, script: str, keep_nonce: bool = False) -> str:
+    """Shell snippet running `script` as `user`; the marker nonce is dropped unless `keep_nonce`"""
+    env = "" if keep_nonce else f"env -u {NONCE_ENV} "
+    return f"runuser -u {user} -- {env}sh -c {shlex.quote(script)}"
+
+
+def run_step(script: str) -> str:
+    """Shell snippet running the program part of a cached execution as RUN_USER"""
+    return as_user(RUN_USER, script)
+
+
+def compile_step(language: str, key: str, encoded_code: Optional[str], execution_id: str,
+                 source_path: Optional[str] = None, limit: str = "") -> str:
+    """
+    Shell snippet that makes sure the artifact for `key` exists. It runs as
+    root and builds as CACHE_USER; NONCE_ENV must be set.
+
+    The source is either inlined as base64 (`encoded_code`) or copied from a
+    file already in the container (`source_path`). The artifact is compiled
+    into a private staging directory and moved into place atomically, so
+    concurrent misses for the same key never observe a half-written binary.
+    When nothing is stored (cache hit) the snippet is a no-op apart from a
+    `test -f`. `limit` prefixes the compiler, e.g. a `timeout` command; a
+    compile it cuts off fails with "Compilation timed out".
+    """
+    target = artifact_dir(key)
+    staging = f"{target}.{execution_id}"
+    marker = f"{MARKER} ${NONCE_ENV}"
+    flags = COMPILE_FLAGS[language]
+    compiler = f"{limit} " if limit else ""
+    source_file = "Main.java" if language == "java" else "prog.cpp"
+    if source_path:
+        write_source = f"cp {source_path} {source_file}"
+    else:
+        write_source = f"echo '{encoded_code}' | base64 -d > {source_file}"
+    if language == "java":
+        build = f"{write_source} && {compiler}javac {flags} -d . Main.java && rm -f Main.java"
+    else:
+        build = f"{write_source} && {compiler}g++ {flags} -o prog prog.cpp && rm -f prog.cpp"
+    step = (
+        f"if [ ! -f {target}/.ok ]; then "
+        f"mkdir -p {staging} && cd {staging} && "
+        f"{{ {build} || {{ rc=$?; cd /tmp; rm -rf {staging}; "
+        f"[ $rc -eq {TIMEOUT_EXIT_CODE} ] && echo 'Compilation timed out' >&2; "
+        f"echo \"{marker} failed\" >&2; false; }}; }} && "
+        f"touch .ok && chmod -R go-w {staging} && cd /tmp && "
+        f"echo \"{marker} stored $(du -sk {staging} | cut -f1)\" >&2 && "
+        f"{{ mv -T {staging} {target} 2>/dev/null || rm -rf {staging}; }}; "
+        f"fi"
+    )
+    return as_user(CACHE_USER, step, keep_nonce=True)
+
+
+def run_command(language: str, key: str) -> str:
+    target = artifact_dir(key)
+    if language == "java":
+        return f"java -cp {target} Main"
+    return f"{target}/prog"
+
+
+def split_marker(stderr: str, nonce: str) -> Tuple[str, Optional[int]]:
+    """
+    Strip the cache marker carrying `nonce` from stderr.
+
+    Returns the cleaned stderr and the stored artifact size in bytes: None
+    for a hit (no marker), 0 for a failed compile.
+    """
+    prefix = f"{MARKER} {nonce} "
+    if prefix not in stderr:
+        return stderr, None
+    kept = []
+    stored = 0
+    for line in stderr.splitlines():
+        if line.startswith(prefix):
+            parts = line.split()
+            if len(parts) == 4 and parts[2] == "stored" and parts[3].isdigit():
+                stored = int(parts[3]) * 1024
+        else:
+            kept.append(line)
+    return "\n".join(kept), stored
+
+
+def _docker_exec(container: str, argv: List[str]) -> Tuple[int, str]:
+    result = subprocess.run(
+        ["docker", "exec", container] + argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        timeout=10
+    )
+    return result.returncode, result.stdout
+
+
+class CompileCache:
+    """
+    Size-bounded LRU index over the artifacts stored in each container.
+
+    The index lives in Redis; without Redis it is kept in this process,
+    which only lasts as long as the process does.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # Counters across all workers as of this process's last lookup
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, "OrderedDict[str, int]"] = {}
+        self._evicted: Dict[str, List[str]] = {}
+        self._versions: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def compiler_version(self, container: str, language: str,
+                         run: Optional[Callable[[str, List[str]], Tuple[int, str]]] = None) -> str:
+        """
+        Compiler version of a container, queried once per VERSION_TTL for
+        all workers.
+
+        `run(container, argv)` returns (exit code, output); it defaults to
+        `docker exec`.
+        """
+        cache_id = (container, language)
+        version = self._versions.get(cache_id)
+        if version is not None:
+            return version
+        conn = get_redis()
+        if conn is not None:
+            try:
+                stored = conn.get(VERSION_KEY.format(container, language))
+                if stored is not None:
+                    version = stored.decode()
+                    self._versions[cache_id] = version
+                    return version
+            except Exception:
+                logger.warning(f"Could not read compiler version: container={container}", exc_info=True)
+        try:
+            returncode, output = (run or _docker_exec)(container, VERSION_COMMANDS[language])
+        except Exception:
+            logger.warning(f"Could not query compiler version: container={container}")
+            return "unknown"
+        if returncode != 0:
+            return "unknown"
+        version = output.strip()
+        self._versions[cache_id] = version
+        if conn is not None:
+            try:
+                conn.set(VERSION_KEY.format(container, language), version, ex=VERSION_TTL)
+            except Exception:
+                logger.warning(f"Could not store compiler version: container={container}", exc_info=True)
+        return version
+
+    def record(self, container: str, key: str, stored_bytes: Optional[int]) -> bool:
+        """
+        Record a lookup for `key` and return True if it was a hit.
+
+        `stored_bytes` is the artifact size reported by the compile step,
+        0 when compilation failed and nothing was stored, or None when the
+        container already had the artifact.
+        """
+        conn = get_redis()
+        if conn is not None:
+            try:
+                hit, hits, misses = conn.register_script(RECORD_SCRIPT)(
+                    keys=[LRU_KEY.format(container), SIZES_KEY.format(container),
+                          EVICTED_KEY.format(container), STATS_KEY],
+                    args=[time.time(), key, "" if stored_bytes is None else stored_bytes, self.max_bytes]
+                )
+                self.hits, self.misses = int(hits), int(misses)
+                return bool(hit)
+            except Exception:
+                logger.warning(f"Could not record compile cache lookup: container={container}", exc_info=True)
+        return self._record_local(container, key, stored_bytes)
+
+    def _record_local(self, container: str, key: str, stored_bytes: Optional[int]) -> bool:
+        with self._lock:
+            entries = self._entries.setdefault(container, OrderedDict())
+            if stored_bytes is None:
+                self.hits += 1
+                if key in entries:
+                    entries.move_to_end(key)
+                return True
+
+            self.misses += 1
+            if not stored_bytes:
+                return False
+            entries[key] = stored_bytes
+            entries.move_to_end(key)
+            total = sum(entries.values())
+            while total > self.max_bytes and len(entries) > 1:
+                old_key, size = entries.popitem(last=False)
+                total -= size
+                self._evicted.setdefault(container, []).append(old_key)
+            return False
+
+    def take_evictions(self, container: str) -> List[str]:
+        """Keys evicted for `container` since the last call by any worker"""
+        with self._lock:
+            keys = self._evicted.pop(container, [])
+        conn = get_redis()
+        if conn is not None:
+            try:
+                pipeline = conn.pipeline(transaction=True)
+                pipeline.lrange(EVICTED_KEY.format(container), 0, -1)
+                pipeline.delete(EVICTED_KEY.format(container))
+                keys += [k.decode() for k in pipeline.execute()[0]]
+            except Exception:
+                logger.warning(f"Could not read compile cache evictions: container={container}", exc_info=True)
+        return keys
+
+    def eviction_step(self, container: str) -> str:
+        """Shell snippet removing artifacts evicted since the last run"""
+        keys = self.take_evictions(container)
+        if not keys:
+            return ""
+        return "rm -rf " + " ".join(artifact_dir(k) for k in keys) + "; "
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+compile_cache = CompileCache()
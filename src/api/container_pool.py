@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import random
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from api.agent_client import agent_client
+from api.redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Replicas are the containers docker compose starts for each language service
+# (`docker compose up --scale python=4` or `deploy.replicas`), named
+# <project>-<service>-<n>
+COMPOSE_PROJECT = os.getenv("COMPOSE_PROJECT_NAME", "leetcodecompiler")
+POOL_SIZE = int(os.getenv("CONTAINER_POOL_SIZE", "1"))
+
+LANGUAGE_SERVICES = {
+    "python": "python",
+    "nodejs": "node",
+    "cpp": "cpp",
+    "java": "java",
+}
+
+# A lease outlives the longest job (RQ timeout is 60s) so that in-flight
+# counts of crashed workers drain on their own
+LEASE_TTL = int(os.getenv("CONTAINER_LEASE_TTL", "120"))
+QUARANTINE_SECONDS = int(os.getenv("CONTAINER_QUARANTINE_SECONDS", "30"))
+PROBE_INTERVAL = int(os.getenv("CONTAINER_PROBE_INTERVAL", "10"))
+
+# With the agent backend executions never go through `docker exec`, so
+# replicas are probed by pinging their agent instead
+EXECUTION_BACKEND = os.getenv("EXECUTION_BACKEND", "cli")
+
+# Executions one replica is sized to run at once; a concurrent worker opens
+# no more slots than the replicas of its languages can take
+CONTAINER_SLOTS = int(os.getenv("CONTAINER_SLOTS", "4"))
+
+# Cheap commands that prove a replica can run code and page in the runtime
+WARMUP_COMMANDS = {
+    "python": ["python3", "-c", "import collections, heapq, bisect"],
+    "nodejs": ["node", "-e", "0"],
+    "cpp": ["g++", "--version"],
+    "java": ["java", "-version"],
+}
+
+LEASES_KEY = "pool:leases:{}"
+UNHEALTHY_KEY = "pool:unhealthy"
+
+# Scratch area usage per replica as last measured by the workspace reaper
+SCRATCH_KEY = "pool:scratch"
+
+# Picks the healthy replica with the fewest live leases and leases it.
+# KEYS[1] is the unhealthy hash, KEYS[2..] the lease sets; ARGV holds now,
+# the lease expiry, the lease member and then the replica names.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local best, best_load = nil, nil
+for i = 2, #KEYS do
+    local name = ARGV[i + 2]
+    local quarantined_until = tonumber(redis.call('HGET', KEYS[1], name) or '0')
+    if quarantined_until <= now then
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+        local load = redis.call('ZCARD', KEYS[i])
+        if best_load == nil or load < best_load then
+            best, best_load = i, load
+        end
+    end
+end
+if not best then
+    return nil
+end
+redis.call('ZADD', KEYS[best], ARGV[2], ARGV[3])
+return ARGV[best + 2]
+"""
+
+
+class NoHealthyContainer(Exception):
+    pass
+
+
+def replica_names(language: str) -> List[str]:
+    service = LANGUAGE_SERVICES[language]
+    size = int(os.getenv(f"CONTAINER_POOL_SIZE_{language.upper()}", str(POOL_SIZE)))
+    return [f"{COMPOSE_PROJECT}-{service}-{i}" for i in range(1, size + 1)]
+
+
+class ContainerPool:
+    """
+    Warm replicas per language with least-loaded dispatch.
+
+    In-flight executions and replica health are kept in Redis so every worker
+    process sees the same load. Without Redis the pool falls back to
+    process-local bookkeeping.
+    """
+
+    def __init__(self):
+        self._local_leases: Dict[str, set] = {}
+        self._local_unhealthy: Dict[str, float] = {}
+        self._local_scratch: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._monitor: Optional[threading.Thread] = None
+
+    def acquire(self, language: str, execution_id: str) -> str:
+        names = replica_names(language)
+        # Shuffle so ties between equally loaded replicas are spread out
+        random.shuffle(names)
+        now = time.time()
+        conn = get_redis()
+        if conn is not None:
+            name = conn.register_script(ACQUIRE_SCRIPT)(
+                keys=[UNHEALTHY_KEY] + [LEASES_KEY.format(n) for n in names],
+                args=[now, now + LEASE_TTL, execution_id] + names
+            )
+            name = name.decode() if isinstance(name, bytes) else name
+        else:
+            name = self._acquire_local(names, execution_id, now)
+        if not name:
+            raise NoHealthyContainer(f"No healthy container for language: {language}")
+        return name
+
+    def _acquire_local(self, names: List[str], execution_id: str, now: float) -> Optional[str]:
+        with self._lock:
+            healthy = [n for n in names if self._local_unhealthy.get(n, 0) <= now]
+            if not healthy:
+                return None
+            name = min(healthy, key=lambda n: len(self._local_leases.get(n, ())))
+            self._local_leases.setdefault(name, set()).add(execution_id)
+            return name
+
+    def release(self, container: str, execution_id: str) -> None:
+        conn = get_redis()
+        if conn is not None:
+            try:
+                conn.zrem(LEASES_KEY.format(container), execution_id)
+            except Exception:
+                logger.warning(f"Failed to release lease: container={container}", exc_info=True)
+        with self._lock:
+            self._local_leases.get(container, set()).discard(execution_id)
+
+    @contextmanager
+    def lease(self, language: str, execution_id: str) -> Iterator[str]:
+        container = self.acquire(language, execution_id)
+        try:
+            yield container
+        finally:
+            self.release(container, execution_id)
+
+    def mark_unhealthy(self, container: str, reason: str = "") -> None:
+        logger.warning(f"Taking container out of rotation: container={container}, reason={reason}")
+        until = time.time() + QUARANTINE_SECONDS
+        conn = get_redis()
+        if conn is not None:
+            conn.hset(UNHEALTHY_KEY, container, until)
+        with self._lock:
+            self._local_unhealthy[container] = until
+
+    def mark_healthy(self, container: str) -> None:
+        conn = get_redis()
+        if conn is not None:
+            conn.hdel(UNHEALTHY_KEY, container)
+        with self._lock:
+            self._local_unhealthy.pop(container, None)
+
+    def probe(self, container: str, language: str) -> bool:
+        """Run the warm-up command in a replica; also serves as health check"""
+        if EXECUTION_BACKEND == "agent":
+            return agent_client.ping(container)
+        try:
+            result = subprocess.run(
+                ["docker", "exec", container] + WARMUP_COMMANDS[language],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=10
+            )
+            return result.returncode == 0
+        except (subprocess.TimeoutExpired, OSError):
+            return False
+
+    def probe_all(self) -> Dict[str, bool]:
+        results = {}
+        for language in LANGUAGE_SERVICES:
+            for container in replica_names(language):
+                healthy = self.probe(container, language)
+                if healthy:
+                    self.mark_healthy(container)
+                else:
+                    self.mark_unhealthy(container, "health probe failed")
+                results[container] = healthy
+        return results
+
+    def utilization(self) -> Dict[str, Dict[str, int]]:
+        """In-flight executions per replica, grouped by language"""
+        conn = get_redis()
+        now = time.time()
+        usage = {}
+        for language in LANGUAGE_SERVICES:
+            usage[language] = {}
+            for container in replica_names(language):
+                if conn is not None:
+                    count = conn.zcount(LEASES_KEY.format(container), now, "+inf")
+                else:
+                    count = len(self._local_leases.get(container, ()))
+                usage[language][container] = count
+        return usage
+
+    def leased(self, container: str) -> set:
+        """Execution ids holding a live lease on `container`"""
+        conn = get_redis()
+        if conn is not None:
+            members = conn.zrangebyscore(LEASES_KEY.format(container), time.time(), "+inf")
+            return {m.decode() if isinstance(m, bytes) else m for m in members}
+        with self._lock:
+            return set(self._local_leases.get(container, ()))
+
+    def record_scratch(self, container: str, used_bytes: int, workspaces: int) -> None:
+        usage = {"bytes": used_bytes, "workspaces": workspaces, "measured_at": time.time()}
+        conn = get_redis()
+        if conn is not None:
+            conn.hset(SCRATCH_KEY, container, json.dumps(usage))
+        with self._lock:
+            self._local_scratch[container] = usage
+
+    def scratch_usage(self) -> Dict[str, Dict[str, dict]]:
+        """Last measured scratch area usage per replica, grouped by language"""
+        conn = get_redis()
+        if conn is not None:
+            stored = {k.decode() if isinstance(k, bytes) else k: json.loads(v)
+                      for k, v in conn.hgetall(SCRATCH_KEY).items()}
+        else:
+            with self._lock:
+                stored = dict(self._local_scratch)
+        return {
+            language: {c: stored[c] for c in replica_names(language) if c in stored}
+            for language in LANGUAGE_SERVICES
+        }
+
+    def capacity(self, languages: Optional[List[str]] = None) -> int:
+        """Concurrent executions the replicas of `languages` can take"""
+        languages = languages or list(LANGUAGE_SERVICES)
+        return sum(len(replica_names(language)) for language in languages) * CONTAINER_SLOTS
+
+    def start_health_monitor(self, interval: int = PROBE_INTERVAL) -> threading.Thread:
+        """Warm every replica now and keep probing them in the background"""
+        if self._monitor is not None:
+            return self._monitor
+
+        def run():
+            while True:
+                try:
+                    self.probe_all()
+                except Exception:
+                    logger.error("Container health probe failed", exc_info=True)
+                time.sleep(interval)
+
+        self._monitor = threading.Thread(target=run, name="container-health", daemon=True)
+        self._monitor.start()
+        return self._monitor
+
+
+container_pool = ContainerPool()
@@ -0,0 +1,210 @@
+import http.client
+import io
+import json
+import logging
+import os
+import socket
+import struct
+import tarfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+from api.output_stream import OutputSink
+
+logger = logging.getLogger(__name__)
+
+# Same variable the docker CLI reads, e.g. tcp://host.docker.internal:2375
+DOCKER_HOST = os.getenv("DOCKER_HOST", "unix:///var/run/docker.sock")
+DOCKER_API_VERSION = os.getenv("DOCKER_API_VERSION", "1.41")
+MAX_IDLE_CONNECTIONS = int(os.getenv("DOCKER_MAX_IDLE_CONNECTIONS", "16"))
+
+# Multiplexed exec output: 1 byte stream type, 3 padding, 4 byte length
+FRAME_HEADER = struct.Struct(">BxxxI")
+STDOUT_STREAM = 1
+STDERR_STREAM = 2
+
+
+class DockerEngineError(Exception):
+    """The Engine API rejected a request (container missing, not running, ...)"""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class DockerEngineClient:
+    """
+    Minimal Docker Engine API client over keep-alive HTTP connections.
+
+    Idle connections are pooled and reused, so creating an exec, inspecting
+    it or uploading an archive costs one request instead of a docker CLI
+    fork/exec plus a fresh TCP handshake.
+    """
+
+    def __init__(self, docker_host: str = DOCKER_HOST, api_version: str = DOCKER_API_VERSION):
+        self.url = urlparse(docker_host)
+        self.prefix = f"/v{api_version}"
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self, timeout: Optional[float]) -> http.client.HTTPConnection:
+        if self.url.scheme == "unix":
+            return UnixHTTPConnection(self.url.path, timeout=timeout)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port or 2375, timeout=timeout)
+
+    def _checkout(self, timeout: Optional[float]) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return self._new_connection(timeout), False
+
+    def _checkin(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _request(self, method: str, path: str, body=None, headers=None,
+                 timeout: Optional[float] = 10, stream: bool = False):
+        """
+        Send a request and return (status, body bytes).
+
+        With `stream=True` the open response and its connection are returned
+        instead; the caller reads it to the end and closes the connection.
+        """
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for _ in range(2):
+            conn, reused = self._checkout(timeout)
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, ConnectionError) as e:
+                # The daemon may have closed an idle keep-alive connection
+                conn.close()
+                if reused:
+                    continue
+                raise DockerEngineError(f"{method} {path} failed: {e}")
+            except OSError:
+                conn.close()
+                raise
+            if stream:
+                return response, conn
+            data = response.read()
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+            return response.status, data
+        raise DockerEngineError(f"{method} {path} failed")
+
+    def _check(self, status: int, data: bytes, expected=(200, 201, 204)) -> bytes:
+        if status not in expected:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode("utf-8", "replace")
+            raise DockerEngineError(f"Docker Engine API error {status}: {message}")
+        return data
+
+    def put_archive(self, container: str, path: str, files: Dict[str, Optional[bytes]]) -> None:
+        """
+        Upload `files` (relative name -> content) into `path` as one tar.
+
+        A None content creates a world-writable directory.
+        """
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            now = time.time()
+            for name, content in files.items():
+                info = tarfile.TarInfo(name.rstrip("/"))
+                info.mtime = now
+                if content is None:
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o777
+                    tar.addfile(info)
+                else:
+                    info.size = len(content)
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(content))
+        status, data = self._request(
+            "PUT",
+            f"/containers/{quote(container)}/archive?path={quote(path)}",
+            body=buffer.getvalue(),
+            headers={"Content-Type": "application/x-tar"}
+        )
+        self._check(status, data)
+
+    def exec_run(self, container: str, cmd: List[str], timeout: float,
+                 workdir: Optional[str] = None,
+                 sink: Optional[OutputSink] = None,
+                 user: Optional[str] = None,
+                 env: Optional[List[str]] = None) -> Tuple[Optional[int], str, str]:
+        """
+        Run `cmd` in `container` and return (exit code, stdout, stderr).
+        `user` and `env` ("NAME=value" entries) override the container's.
+
+        Output is collected into `sink` as it streams in. Once the sink's
+        byte cap is exceeded the attach connection is dropped, which cuts the
+        program off with SIGPIPE; the exit code is then None if it has not
+        exited yet.
+        """
+        sink = sink or OutputSink(limit=None)
+        config = {"AttachStdout": True, "AttachStderr": True, "Cmd": cmd}
+        if workdir:
+            config["WorkingDir"] = workdir
+        if user:
+            config["User"] = user
+        if env:
+            config["Env"] = env
+        status, data = self._request("POST", f"/containers/{quote(container)}/exec", body=config)
+        exec_id = json.loads(self._check(status, data))["Id"]
+
+        # The attached start call streams the output until the process exits,
+        # after which the daemon closes that connection
+        response, conn = self._request(
+            "POST", f"/exec/{exec_id}/start",
+            body={"Detach": False, "Tty": False},
+            timeout=timeout,
+            stream=True
+        )
+        try:
+            if response.status != 200:
+                self._check(response.status, response.read())
+            self._demux(response, sink)
+        finally:
+            conn.close()
+
+        status, data = self._request("GET", f"/exec/{exec_id}/json")
+        exit_code = json.loads(self._check(status, data))["ExitCode"]
+        return exit_code, sink.text("stdout"), sink.text("stderr")
+
+    @staticmethod
+    def _demux(response, sink: OutputSink) -> None:
+        while True:
+            header = response.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            stream_type, length = FRAME_HEADER.unpack(header)
+            payload = response.read(length)
+            if not sink.write("stderr" if stream_type == STDERR_STREAM else "stdout", payload):
+                break
+
+
+docker_engine = DockerEngineClient()
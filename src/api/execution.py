@@ -1,130 +1,673 @@
-import subprocess
+import os
+import signal
+import socket
 import time
 import logging
 import uuid
 import base64
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from api.agent_client import AgentError, agent_client
+from api.docker_engine import DockerEngineError, docker_engine
+from api import native_sandbox
+from api.container_pool import NoHealthyContainer, container_pool
+from api.compile_cache import (
+    CACHE_ENABLED, COMPILE_FLAGS, COMPILED_LANGUAGES, NONCE_ENV, TIMEOUT_EXIT_CODE,
+    cache_key, compile_cache, compile_step, new_nonce, run_command, run_step, split_marker,
+)
+from api import metrics, tracing
+from api.output_stream import MAX_OUTPUT_BYTES, OutputSink, sink_for_current_job, stream_process
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def execute_code_simple(code: str, language: str) -> Dict[str, Any]:
+SUPPORTED_LANGUAGES = ["python", "nodejs", "cpp", "java"]
+
+# How executions reach the language containers: "cli" runs `docker exec`
+# per execution, "engine" calls the Docker Engine API over pooled
+# connections, "agent" talks to the resident agent in each container.
+# "native" runs submissions on the worker host itself in a rlimit/namespace
+# sandbox, bypassing Docker (trusted deployments only). "stub" runs
+# nothing, for benchmarking the API and queue layers without Docker.
+EXECUTION_BACKEND = os.getenv("EXECUTION_BACKEND", "cli")
+
+# Backends that execute in the language containers, which workers warm and
+# health-check, and backends that run on this host without leasing one
+CONTAINER_BACKENDS = ("cli", "engine", "agent")
+HOST_BACKENDS = ("native",)
+
+# Pretend run time of one execution with the stub backend
+STUB_RUN_SECONDS = float(os.getenv("STUB_RUN_SECONDS", "0.05"))
+
+# Wall-clock limit for running a program, and the extra allowance for
+# compiling it first
+TIME_LIMIT = 30
+COMPILE_TIME_LIMIT = 30
+
+# `docker exec` exit code when the daemon itself failed (container missing,
+# not running, ...) rather than the submitted program
+DOCKER_ERROR_EXIT_CODE = 125
+
+# Extra wall-clock time the cli backend gives `docker exec` beyond the
+# compile and run limits enforced inside the container
+EXEC_GRACE_SECONDS = 5
+
+# Per-execution workspaces of the cli backend, removed in batches by the
+# workspace reaper. Compose mounts a tmpfs here in the language containers.
+WORK_ROOT = os.getenv("EXECUTION_WORK_ROOT", "/tmp/workspace")
+
+# Uploaded workspaces for the engine backend. The directory is created
+# world-writable (without sticky bit) by the upload itself, so the
+# unprivileged user in the container can compile into it and remove it.
+ENGINE_WORK_ROOT = "/tmp/engine"
+
+SOURCE_FILES = {
+    "python": "script.py",
+    "nodejs": "script.js",
+    "cpp": "prog.cpp",
+    "java": "Main.java",
+}
+
+def _cache_info(container_name: str, artifact_key: str, stored_bytes: Optional[int]) -> Dict[str, Any]:
+    return {
+        "hit": compile_cache.record(container_name, artifact_key, stored_bytes),
+        **compile_cache.stats()
+    }
+
+def _run_with_cli(code: str, language: str, stdin: Optional[str],
+                  execution_id: str, container_name: str,
+                  time_limit: int = TIME_LIMIT,
+                  sink: Optional[OutputSink] = None,
+                  force_cache: bool = False) -> Dict[str, Any]:
+    """Run through `docker exec ... sh -c` in a private workspace directory"""
+    sink = sink or OutputSink()
+
+    # Use base64 encoding to safely transfer code
+    encoded_code = base64.b64encode(code.encode('utf-8')).decode('ascii')
+
+    # Keep stdin attached only when there is input to feed the program
+    exec_options = ["-i"] if stdin else []
+
+    # Compiled languages go through the compile cache: the artifact is
+    # built once per content hash and reused by later runs. The exec runs as
+    # root to build as the cache user and run as the run user.
+    artifact_key = None
+    nonce = None
+    if (CACHE_ENABLED or force_cache) and language in COMPILED_LANGUAGES:
+        compiler_version = compile_cache.compiler_version(container_name, language)
+        artifact_key = cache_key(code, language, compiler_version, COMPILE_FLAGS[language])
+        nonce = new_nonce()
+        exec_options += ["-u", "root", "-e", f"{NONCE_ENV}={nonce}"]
+    exec_prefix = ["docker", "exec", *exec_options, container_name]
+
+    # Every execution compiles and runs in its own workspace, so concurrent
+    # runs in one container (e.g. two Main.java) never share files. It is
+    # left for the workspace reaper rather than removed on the run's path.
+    workdir = f"{WORK_ROOT}/exec_{execution_id}"
+    setup = f"mkdir -p {workdir} && cd {workdir}"
+    write_source = f"echo '{encoded_code}' | base64 -d > {SOURCE_FILES[language]}"
+    ready = tracing.mark_step("ready")
+    compiled = tracing.mark_step("compiled")
+    # Compiling and running have budgets of their own, enforced inside the
+    # container so the program dies with its time limit (killing the local
+    # `docker exec` client would leave it running)
+    compile_limit = f"timeout -k 1 {COMPILE_TIME_LIMIT}"
+    run_limit = f"timeout -k 1 {time_limit}"
+
+    # Build execution command based on language
+    if artifact_key:
+        run = f"{setup} && {run_limit} {run_command(language, artifact_key)}"
+        script = (
+            f"{compile_cache.eviction_step(container_name)}{ready} && "
+            f"{compile_step(language, artifact_key, encoded_code, execution_id, limit=compile_limit)} && "
+            f"{compiled} && {run_step(run)}"
+        )
+    elif language == "java":
+        # Java requires the filename to match the public class name
+        # For simplicity, we'll always use "Main.java" and expect the class to be named "Main"
+        script = (
+            f"{setup} && {write_source} && {ready} && {compile_limit} javac Main.java && "
+            f"{compiled} && {run_limit} java Main"
+        )
+    elif language == "cpp":
+        script = (
+            f"{setup} && {write_source} && {ready} && {compile_limit} g++ -o prog prog.cpp && "
+            f"{compiled} && {run_limit} ./prog"
+        )
+    elif language == "nodejs":
+        script = f"{setup} && {write_source} && {ready} && {run_limit} node script.js"
+    else:  # python
+        script = f"{setup} && {write_source} && {ready} && {run_limit} python3 script.py"
+    command = [*exec_prefix, "sh", "-c", script]
+
+    logger.info(f"Executing command: {' '.join(command)}")
+
+    # Output is read incrementally so a chatty program is cut off at the
+    # sink's byte cap instead of growing the worker's memory. The deadline
+    # only backs up the limits inside the container.
+    launched = time.time()
+    compiles = language in COMPILED_LANGUAGES
+    deadline = time_limit + (COMPILE_TIME_LIMIT if compiles else 0) + EXEC_GRACE_SECONDS
+    returncode = stream_process(command, stdin, deadline, sink)
+    if returncode is None:
+        return {"status": "timeout", "error": "Execution timed out"}
+
+    # Step marks split the single exec into transfer, compile and run
+    stderr, marks = tracing.split_marks(sink.text("stderr"))
+    tracing.record_script_phases(launched, time.time(), marks, compiles)
+    if returncode == TIMEOUT_EXIT_CODE:
+        if compiles and "compiled" not in marks:
+            # The compiler hit its limit, not the program
+            return {"status": "failure", "output": "", "error": "Compilation timed out", "compile_failed": True}
+        return {"status": "timeout", "error": "Execution timed out"}
+    if returncode == 0:
+        status = "success"
+    elif returncode == DOCKER_ERROR_EXIT_CODE or stderr.startswith("Error response from daemon"):
+        status = "error"
+    else:
+        status = "failure"
+
+    cache_info = None
+    stored_bytes = None
+    if artifact_key and status != "error":
+        stderr, stored_bytes = split_marker(stderr, nonce)
+        cache_info = _cache_info(container_name, artifact_key, stored_bytes)
+
+    response = {
+        "status": status,
+        "output": sink.text("stdout").strip(),
+        "error": stderr.strip() if stderr else None,
+    }
+    if cache_info:
+        response["compile_cache"] = cache_info
+    if stored_bytes == 0:
+        response["compile_failed"] = True
+    return sink.apply(response)
+
+def _run_with_agent(code: str, language: str, stdin: Optional[str],
+                    execution_id: str, container_name: str,
+                    time_limit: int = TIME_LIMIT,
+                    sink: Optional[OutputSink] = None,
+                    force_cache: bool = False) -> Dict[str, Any]:
+    """Send the submission to the resident agent in the container"""
+    sink = sink or OutputSink()
+    request = {
+        "op": "execute",
+        "id": execution_id,
+        "language": language,
+        "source": code,
+        "stdin": stdin or "",
+        "time_limit": time_limit,
+        "max_output": sink.limit,
+        # Ask for chunk frames while the program runs when someone can
+        # follow them
+        "stream": sink.publishing,
+    }
+    if language in COMPILED_LANGUAGES:
+        request["compile_cache"] = CACHE_ENABLED or force_cache
+        request["compile_flags"] = COMPILE_FLAGS[language]
+        request["evict"] = compile_cache.take_evictions(container_name)
+
+    called = time.time()
+    try:
+        result = agent_client.call(
+            container_name, request, timeout=time_limit + COMPILE_TIME_LIMIT, on_chunk=sink.publish
+        )
+    except socket.timeout:
+        return {"status": "timeout", "error": "Execution timed out"}
+    except AgentError as e:
+        return {"status": "error", "error": str(e)}
+    _record_agent_phases(called, time.time(), result["timings"])
+
+    if result["timed_out"]:
+        return {"status": "timeout", "error": "Execution timed out"}
+
+    response = {
+        "status": "success" if result["exit_code"] == 0 else "failure",
+        "output": result["stdout"].strip(),
+        "error": result["stderr"].strip() or None,
+        "resources": result.get("resources", {}),
+    }
+    _apply_agent_compile_info(response, result, container_name)
+    sink.truncated = result.get("truncated", False)
+    return sink.apply(response)
+
+def _record_agent_phases(called: float, returned: float, timings: Dict[str, float]) -> None:
     """
-    Simplified code execution that works directly in /tmp
+    Trace an agent round trip. The agent reports how long it compiled and
+    ran; the rest of its time (workspace setup and removal) is "cleanup" and
+    the rest of the round trip is "transfer" of the request and result.
     """
-    execution_id = str(uuid.uuid4())
-    start_time = time.time()
+    at = max(called, returned - timings.get("total", 0.0))
+    tracing.record_phase("transfer", called, at)
+    for step in ("compile", "run"):
+        if step in timings:
+            tracing.record_phase(step, at, at + timings[step])
+            at += timings[step]
+    tracing.record_phase("cleanup", at, returned)
+
+def _apply_agent_compile_info(response: Dict[str, Any], result: Dict[str, Any], container_name: str) -> None:
+    """Copy compile cache and compile failure details from an agent result"""
+    outcome = result.get("compile_cache")
+    if outcome:
+        stored_bytes = {"hit": None, "failed": 0}.get(outcome, result.get("stored_bytes", 0))
+        response["compile_cache"] = _cache_info(container_name, result["artifact_key"], stored_bytes)
+    if result.get("compile_failed"):
+        response["compile_failed"] = True
 
+def _run_cases_with_agent(code: str, language: str, cases: List[str],
+                          execution_id: str, container_name: str,
+                          time_limit: int) -> Dict[str, Any]:
+    """One agent round trip: compile once, run every case in the container"""
+    request = {
+        "op": "execute",
+        "id": execution_id,
+        "language": language,
+        "source": code,
+        "cases": cases,
+        "time_limit": time_limit,
+        "max_output": MAX_OUTPUT_BYTES,
+    }
+    if language in COMPILED_LANGUAGES:
+        request["compile_cache"] = CACHE_ENABLED
+        request["compile_flags"] = COMPILE_FLAGS[language]
+        request["evict"] = compile_cache.take_evictions(container_name)
+
+    called = time.time()
     try:
-        # Validate language
-        supported_languages = ["python", "nodejs", "cpp", "java"]
-        if language not in supported_languages:
-            return {
-                "status": "failure", 
-                "error": f"Unsupported language: {language}. Supported: {supported_languages}",
-                "execution_id": execution_id
-            }
-
-        # Container mapping
-        container_map = {
-            "python": "leetcodecompiler-python-1",
-            "nodejs": "leetcodecompiler-node-1", 
-            "cpp": "leetcodecompiler-cpp-1",
-            "java": "leetcodecompiler-java-1"
+        result = agent_client.call(
+            container_name, request, timeout=COMPILE_TIME_LIMIT + len(cases) * (time_limit + 1)
+        )
+    except socket.timeout:
+        return {"status": "timeout", "error": "Execution timed out", "cases": []}
+    except AgentError as e:
+        return {"status": "error", "error": str(e), "cases": []}
+    _record_agent_phases(called, time.time(), result["timings"])
+
+    response = {
+        "status": "failure",
+        "error": None,
+        "resources": result.get("resources", {}),
+    }
+    _apply_agent_compile_info(response, result, container_name)
+    if response.get("compile_failed"):
+        response["error"] = result["stderr"].strip() or None
+        response["cases"] = []
+        return response
+
+    response["cases"] = []
+    for case in result["cases"]:
+        if case["timed_out"]:
+            status = "timeout"
+        else:
+            status = "success" if case["exit_code"] == 0 else "failure"
+        sink = OutputSink()
+        sink.truncated = case.get("truncated", False)
+        response["cases"].append(sink.apply({
+            "status": status,
+            "output": case["stdout"].strip(),
+            "error": case["stderr"].strip() or None,
+            "time": case["time"],
+            "resources": case.get("resources"),
+        }))
+    return response
+
+def _run_cases_sequentially(code: str, language: str, cases: List[str],
+                            execution_id: str, container_name: str,
+                            time_limit: int) -> Dict[str, Any]:
+    """
+    Run every case through the configured backend in the same container.
+
+    The first case compiles into the compile cache and the remaining cases
+    reuse the artifact, so compiled languages still build only once. This
+    holds with COMPILE_CACHE_ENABLED=0 too: the artifact then serves the
+    cases only and is left to the cache's LRU budget.
+    """
+    backend = BACKENDS[EXECUTION_BACKEND]
+    response = {"status": "failure", "error": None, "cases": []}
+    for index, stdin in enumerate(cases):
+        started = time.time()
+        result = backend(code, language, stdin, f"{execution_id}-{index}", container_name, time_limit,
+                         force_cache=True)
+        if index == 0 and "compile_cache" in result and CACHE_ENABLED:
+            response["compile_cache"] = result["compile_cache"]
+        if result.get("compile_failed"):
+            response.update({"compile_failed": True, "error": result["error"]})
+            return response
+        if result["status"] == "error":
+            response.update({"status": "error", "error": result["error"]})
+            return response
+        case = {
+            "status": result["status"],
+            "output": result.get("output", ""),
+            "error": result.get("error"),
+            "time": time.time() - started,
         }
+        if result.get("truncated"):
+            case["truncated"] = True
+        if "resources" in result:
+            case["resources"] = result["resources"].get("run")
+        response["cases"].append(case)
+    return response
+
+def _engine_version_probe(container_name: str, argv):
+    returncode, stdout, stderr = docker_engine.exec_run(container_name, argv, timeout=10)
+    return returncode, stdout + stderr
+
+def _run_with_engine(code: str, language: str, stdin: Optional[str],
+                     execution_id: str, container_name: str,
+                     time_limit: int = TIME_LIMIT,
+                     sink: Optional[OutputSink] = None,
+                     force_cache: bool = False) -> Dict[str, Any]:
+    """Upload the workspace and exec through the Docker Engine HTTP API"""
+    sink = sink or OutputSink()
+    workspace = f"exec_{execution_id}"
+    workdir = f"{ENGINE_WORK_ROOT}/{workspace}"
+    source_path = f"{workdir}/{SOURCE_FILES[language]}"
+    # As with the cli backend, the limits are enforced inside the container
+    compile_limit = f"timeout -k 1 {COMPILE_TIME_LIMIT}"
+    run_limit = f"timeout -k 1 {time_limit}"
 
-        container_name = container_map.get(language)
-        if not container_name:
-            return {"status": "failure", "error": f"No container for language: {language}"}
-
-        logger.info(f"Executing code: id={execution_id}, language={language}, container={container_name}")
-
-        # Use base64 encoding to safely transfer code
-        encoded_code = base64.b64encode(code.encode('utf-8')).decode('ascii')
-        
-        # Create unique filename in /tmp
-        script_name = f"script_{execution_id}"
-        
-        # Build execution command based on language - work directly in /tmp
-        if language == "java":
-            # Java requires the filename to match the public class name
-            # For simplicity, we'll always use "Main.java" and expect the class to be named "Main"
-            command = [
-                "docker", "exec", container_name,
-                "sh", "-c", 
-                f"cd /tmp && echo '{encoded_code}' | base64 -d > Main.java && javac Main.java && java Main"
-            ]
-        elif language == "cpp":
-            command = [
-                "docker", "exec", container_name,
-                "sh", "-c", 
-                f"cd /tmp && echo '{encoded_code}' | base64 -d > {script_name}.cpp && g++ -o {script_name} {script_name}.cpp && ./{script_name}"
-            ]
-        elif language == "nodejs":
-            command = [
-                "docker", "exec", container_name,
-                "sh", "-c", 
-                f"cd /tmp && echo '{encoded_code}' | base64 -d > {script_name}.js && node {script_name}.js"
-            ]
-        else:  # python
-            command = [
-                "docker", "exec", container_name,
-                "sh", "-c", 
-                f"cd /tmp && echo '{encoded_code}' | base64 -d > {script_name}.py && python3 {script_name}.py"
-            ]
-
-        logger.info(f"Executing command: {' '.join(command)}")
-
-        result = subprocess.run(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=30
+    artifact_key = None
+    nonce = None
+    exec_options = {}
+    if (CACHE_ENABLED or force_cache) and language in COMPILED_LANGUAGES:
+        compiler_version = compile_cache.compiler_version(container_name, language, _engine_version_probe)
+        artifact_key = cache_key(code, language, compiler_version, COMPILE_FLAGS[language])
+        # As with the cli backend, root builds as the cache user and runs as the run user
+        nonce = new_nonce()
+        exec_options = {"user": "root", "env": [f"{NONCE_ENV}={nonce}"]}
+
+    ready = tracing.mark_step("ready")
+    compiled = tracing.mark_step("compiled")
+    if artifact_key:
+        run = f"cd {workdir} && {run_limit} {run_command(language, artifact_key)} < stdin"
+        build = compile_step(language, artifact_key, None, execution_id, source_path=source_path, limit=compile_limit)
+        script = (
+            f"{compile_cache.eviction_step(container_name)}cd /tmp && {ready} && "
+            f"{build} && {compiled} && {run_step(run)}"
+        )
+    elif language == "java":
+        script = (
+            f"cd {workdir} && {ready} && {compile_limit} javac Main.java && "
+            f"{compiled} && {run_limit} java Main < stdin"
+        )
+    elif language == "cpp":
+        script = (
+            f"cd {workdir} && {ready} && {compile_limit} g++ -o prog prog.cpp && "
+            f"{compiled} && {run_limit} ./prog < stdin"
+        )
+    elif language == "nodejs":
+        script = f"cd {workdir} && {ready} && {run_limit} node script.js < stdin"
+    else:  # python
+        script = f"cd {workdir} && {ready} && {run_limit} python3 script.py < stdin"
+    # Cleanup rides along in the same exec
+    script = f"{script}; rc=$?; {tracing.mark_step('ran')}; cd /tmp && rm -rf {workdir}; exit $rc"
+
+    launched = time.time()
+    try:
+        docker_engine.put_archive(container_name, "/tmp", {
+            "engine/": None,
+            f"engine/{workspace}/": None,
+            f"engine/{workspace}/{SOURCE_FILES[language]}": code.encode("utf-8"),
+            f"engine/{workspace}/stdin": (stdin or "").encode("utf-8"),
+        })
+        returncode, stdout, stderr = docker_engine.exec_run(
+            container_name, ["sh", "-c", script], timeout=time_limit + COMPILE_TIME_LIMIT, sink=sink,
+            **exec_options
         )
+    except socket.timeout:
+        return {"status": "timeout", "error": "Execution timed out"}
+    except (DockerEngineError, OSError) as e:
+        return {"status": "error", "error": str(e)}
+
+    finished = time.time()
+    compiles = language in COMPILED_LANGUAGES
+    stderr, marks = tracing.split_marks(stderr)
+    ran = marks.get("ran", finished)
+    tracing.record_script_phases(launched, ran, marks, compiles)
+    tracing.record_phase("cleanup", ran, finished)
+    if returncode == TIMEOUT_EXIT_CODE:
+        if compiles and "compiled" not in marks:
+            return {"status": "failure", "output": "", "error": "Compilation timed out", "compile_failed": True}
+        return {"status": "timeout", "error": "Execution timed out"}
+
+    cache_info = None
+    stored_bytes = None
+    if artifact_key:
+        stderr, stored_bytes = split_marker(stderr, nonce)
+        cache_info = _cache_info(container_name, artifact_key, stored_bytes)
+
+    response = {
+        "status": "success" if returncode == 0 else "failure",
+        "output": stdout.strip(),
+        "error": stderr.strip() or None,
+    }
+    if cache_info:
+        response["compile_cache"] = cache_info
+    if stored_bytes == 0:
+        response["compile_failed"] = True
+    return sink.apply(response)
+
+def _run_with_stub(code: str, language: str, stdin: Optional[str],
+                   execution_id: str, container_name: str,
+                   time_limit: int = TIME_LIMIT,
+                   sink: Optional[OutputSink] = None,
+                   force_cache: bool = False) -> Dict[str, Any]:
+    """Succeed after STUB_RUN_SECONDS with stdin echoed as the output"""
+    sink = sink or OutputSink()
+    with tracing.phase("run"):
+        time.sleep(STUB_RUN_SECONDS)
+        sink.write("stdout", (stdin or "").encode("utf-8"))
+    return sink.apply({"status": "success", "output": sink.text("stdout").strip(), "error": None})
+
+def _run_with_native(code: str, language: str, stdin: Optional[str],
+                     execution_id: str, container_name: str,
+                     time_limit: int = TIME_LIMIT,
+                     sink: Optional[OutputSink] = None,
+                     force_cache: bool = False) -> Dict[str, Any]:
+    """Run on the worker host in a native sandbox, in a private directory"""
+    sink = sink or OutputSink()
+    sandbox = native_sandbox.get_sandbox()
+    workdir = sandbox.workspace(execution_id)
+    try:
+        with tracing.phase("transfer"):
+            source = os.path.join(workdir, SOURCE_FILES[language])
+            with open(source, "w") as f:
+                f.write(code)
 
-        execution_time = time.time() - start_time
+        response = {}
+        artifact_dir = None
+        if language in COMPILED_LANGUAGES:
+            artifact_dir, response = _compile_native(code, language, execution_id, workdir, container_name,
+                                                     CACHE_ENABLED or force_cache)
+            if artifact_dir is None:
+                return response
+
+        with tracing.phase("run"):
+            returncode = sandbox.run(
+                native_sandbox.run_command(language, source, artifact_dir), workdir, stdin, time_limit, sink,
+                memory_bytes=native_sandbox.memory_limit(language)
+            )
+        if returncode is None or returncode == -signal.SIGXCPU:
+            return {**response, "status": "timeout", "error": "Execution timed out"}
+
+        response.update({
+            "status": "success" if returncode == 0 else "failure",
+            "output": sink.text("stdout").strip(),
+            "error": sink.text("stderr").strip() or None,
+        })
+        return sink.apply(response)
+    finally:
+        with tracing.phase("cleanup"):
+            sandbox.remove(workdir)
+
+def _compile_native(code: str, language: str, execution_id: str, workdir: str,
+                    host: str, use_cache: bool) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Build the submission in the sandbox, through the host's compile cache
+    when `use_cache`. Returns the artifact directory (None if the build failed)
+    and the result fields so far.
+    """
+    sandbox = native_sandbox.get_sandbox()
+    artifact_key = None
+    if use_cache:
+        for key in compile_cache.take_evictions(host):
+            sandbox.remove(os.path.join(native_sandbox.NATIVE_CACHE_DIR, key))
+        compiler_version = compile_cache.compiler_version(host, language, native_sandbox.local_version)
+        artifact_key = cache_key(code, language, compiler_version, COMPILE_FLAGS[language])
+        target = os.path.join(native_sandbox.NATIVE_CACHE_DIR, artifact_key)
+        if os.path.isdir(target):
+            return target, {"compile_cache": _cache_info(host, artifact_key, None)}
+
+    build_dir = os.path.join(workdir, "build")
+    os.mkdir(build_dir)
+    sandbox.give(build_dir)
+    sink = OutputSink()
+    with tracing.phase("compile"):
+        returncode = sandbox.run(
+            native_sandbox.compile_command(language, COMPILE_FLAGS[language], build_dir),
+            workdir, None, COMPILE_TIME_LIMIT, sink,
+            memory_bytes=native_sandbox.memory_limit(language, native_sandbox.COMPILE_MEMORY_BYTES)
+        )
+    if returncode is None:
+        return None, {"status": "timeout", "error": "Compilation timed out"}
+    if returncode != 0:
         response = {
-            "status": "success" if result.returncode == 0 else "failure",
-            "output": result.stdout.strip(),
-            "error": result.stderr.strip() if result.stderr else None,
-            "execution_time": execution_time,
-            "execution_id": execution_id,
-            "container_used": container_name
+            "status": "failure",
+            "output": "",
+            "error": (sink.text("stderr") or sink.text("stdout")).strip() or None,
+            "compile_failed": True,
         }
+        if artifact_key:
+            response["compile_cache"] = _cache_info(host, artifact_key, 0)
+        return None, response
+
+    if not artifact_key:
+        return build_dir, {}
+    stored_bytes = native_sandbox.tree_size(build_dir)
+    if not sandbox.publish(build_dir, target):
+        # Another execution stored the same artifact meanwhile
+        stored_bytes = None
+    return target, {"compile_cache": _cache_info(host, artifact_key, stored_bytes)}
+
+# An execution backend runs one submission and returns its result fields:
+# backend(code, language, stdin, execution_id, container_name, time_limit,
+# sink, force_cache) -> {"status", "output", "error", ...}. `container_name`
+# is the leased replica, or the host name for HOST_BACKENDS. `force_cache`
+# builds compiled languages through the compile cache even when it is
+# disabled, so several runs can share one build.
+BACKENDS = {
+    "cli": _run_with_cli,
+    "engine": _run_with_engine,
+    "agent": _run_with_agent,
+    "stub": _run_with_stub,
+    "native": _run_with_native,
+}
 
-        # Cleanup
+def _execute_leased(language: str, execution_id: str,
+                    run: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Lease a container for `language`, call `run(container_name)` and add the
+    common result fields
+    """
+    start_time = time.time()
+    container_name = None
+    leased = False
+
+    with tracing.span("execute", execution_id=execution_id, language=language) as span, \
+            tracing.collect_timings() as timings:
         try:
-            if language == "java":
-                # Clean up Java files (source and class files)
-                subprocess.run(
-                    ["docker", "exec", container_name, "sh", "-c", "cd /tmp && rm -f Main.java Main.class"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=5
-                )
+            # Validate language
+            if language not in SUPPORTED_LANGUAGES:
+                return {
+                    "status": "failure",
+                    "error": f"Unsupported language: {language}. Supported: {SUPPORTED_LANGUAGES}",
+                    "execution_id": execution_id
+                }
+
+            if EXECUTION_BACKEND in HOST_BACKENDS:
+                container_name = native_sandbox.HOST_NAME
             else:
-                subprocess.run(
-                    ["docker", "exec", container_name, "sh", "-c", f"cd /tmp && rm -f {script_name}.*"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=5
-                )
-        except:
-            pass  # Ignore cleanup errors
-
-        logger.info(f"Execution completed: id={execution_id}, status={response['status']}")
-        return response
+                # Lease the least-loaded healthy replica for this language
+                try:
+                    with tracing.phase("lease"):
+                        container_name = container_pool.acquire(language, execution_id)
+                        leased = True
+                except NoHealthyContainer as e:
+                    return {"status": "error", "error": str(e), "execution_id": execution_id}
+            span.set(container=container_name)
+
+            logger.info(f"Executing code: id={execution_id}, language={language}, container={container_name}")
+
+            response = run(container_name)
+            if response["status"] == "timeout":
+                logger.error(f"Code execution timed out: id={execution_id}")
+            elif response["status"] == "error" and leased:
+                container_pool.mark_unhealthy(container_name, response["error"])
+
+            response.update({
+                "execution_time": time.time() - start_time,
+                "execution_id": execution_id,
+                "container_used": container_name,
+                "timings": {**timings, "total": time.time() - start_time},
+            })
+            span.set(status=response["status"])
+
+            logger.info(f"Execution completed: id={execution_id}, status={response['status']}")
+            metrics.observe_execution(language, response["status"], response["execution_time"])
+            return response
+
+        except Exception as e:
+            logger.error(f"Execution failed: id={execution_id}", exc_info=True)
+            metrics.observe_execution(language, "error", time.time() - start_time)
+            span.set(status="error")
+            span.error = f"{type(e).__name__}: {e}"
+            return {"status": "error", "error": str(e), "execution_id": execution_id}
+
+        finally:
+            if leased:
+                container_pool.release(container_name, execution_id)
+
+def execute_code_simple(code: str, language: str, stdin: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Execute a submission in a leased language container
+    """
+    execution_id = str(uuid.uuid4())
+    sink = sink_for_current_job()
+    try:
+        return _execute_leased(
+            language, execution_id,
+            lambda container_name: BACKENDS[EXECUTION_BACKEND](
+                code, language, stdin, execution_id, container_name, sink=sink
+            )
+        )
+    finally:
+        sink.close()
 
-    except subprocess.TimeoutExpired:
-        logger.error(f"Code execution timed out: id={execution_id}")
-        return {"status": "timeout", "error": "Execution timed out", "execution_id": execution_id}
+def execute_cases(code: str, language: str, cases: List[str],
+                  time_limit: int = TIME_LIMIT) -> Dict[str, Any]:
+    """
+    Compile once and run the submission against every stdin in `cases`,
+    all in the same container, with `time_limit` seconds per case
+    """
+    execution_id = str(uuid.uuid4())
+    run_cases = _run_cases_with_agent if EXECUTION_BACKEND == "agent" else _run_cases_sequentially
 
-    except Exception as e:
-        logger.error(f"Execution failed: id={execution_id}", exc_info=True)
-        return {"status": "error", "error": str(e), "execution_id": execution_id}
+    def run(container_name: str) -> Dict[str, Any]:
+        response = run_cases(code, language, cases, execution_id, container_name, time_limit)
+        if response["status"] != "error" and response["cases"] and \
+                all(case["status"] == "success" for case in response["cases"]):
+            response["status"] = "success"
+        return response
 
-def main(code: str, language: str) -> Dict[str, Any]:
+    return _execute_leased(language, execution_id, run)
+
+def main(code: str, language: str, stdin: Optional[str] = None) -> Dict[str, Any]:
     """Main execution interface"""
-    return execute_code_simple(code, language)
+    return execute_code_simple(code, language, stdin)
+
+def main_cases(code: str, language: str, cases: List[str], time_limit: int = TIME_LIMIT) -> Dict[str, Any]:
+    """Batch execution interface: one compile, one run per test case"""
+    return execute_cases(code, language, cases, time_limit)
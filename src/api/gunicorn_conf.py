@@ -0,0 +1,10 @@
+"""Gunicorn hooks for the API, loaded with `-c python:api.gunicorn_conf`"""
+from api import metrics
+
+
+def on_starting(server):
+    metrics.reset_multiproc_dir()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from db.models import Execution, get_engine, init_db
+
+logger = logging.getLogger(__name__)
+
+# Finished queued executions are recorded in the `executions` table. A job
+# only pushes its row onto a Redis list; a writer thread in each worker
+# process drains the list with one multi-row INSERT per HISTORY_BATCH_SIZE
+# rows or every HISTORY_FLUSH_MS milliseconds, so no job waits on
+# PostgreSQL. Going through Redis also lets rows from every worker process
+# share the same batches.
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") != "0" and bool(os.getenv("DATABASE_URL"))
+BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))
+FLUSH_MS = int(os.getenv("HISTORY_FLUSH_MS", "500"))
+
+# Rows kept while the database is unreachable; the oldest are dropped
+MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "100000"))
+
+# Rows the database rejects are moved here for inspection instead of being
+# retried; the oldest are dropped past HISTORY_MAX_DEAD
+MAX_DEAD = int(os.getenv("HISTORY_MAX_DEAD", "10000"))
+
+PENDING_KEY = "history:pending"
+DEAD_KEY = "history:dead"
+
+# Job meta entry holding a finished job's row until its flight is released
+ROW_META = "history_row"
+
+# Errors that writing the same rows again won't fix: a value the column
+# can't hold, a violated constraint, or a malformed payload
+ROW_ERRORS = (DataError, IntegrityError, ValueError, KeyError, TypeError)
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def record(conn, job, code: str, language: str, result: Dict[str, Any],
+           cases: Optional[int] = None) -> None:
+    """Queue a finished job's row for the history writer"""
+    if not HISTORY_ENABLED or job is None:
+        return
+    row = {
+        "job_id": job.id,
+        "user_id": job.meta.get("user_id"),
+        "problem_id": job.meta.get("problem_id"),
+        "language": language,
+        "code_hash": code_hash(code),
+        "status": result.get("status", "error"),
+        "cases": cases,
+        "timings": result.get("timings"),
+        "resources": result.get("resources"),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if job.meta.get("flight"):
+        # Kept in memory for the requests coalesced onto the job, whose rows
+        # are written once the worker releases its flight
+        job.meta[ROW_META] = row
+    _push(conn, [row])
+
+
+def record_waiters(conn, job, waiters: List[Dict[str, Any]]) -> None:
+    """Queue a row per request coalesced onto `job`, copied from the job's own row"""
+    row = job.meta.get(ROW_META)
+    if not HISTORY_ENABLED or row is None or not waiters:
+        return
+    _push(conn, [
+        dict(row, user_id=waiter.get("user_id"), problem_id=waiter.get("problem_id"))
+        for waiter in waiters
+    ])
+
+
+def _push(conn, rows: List[Dict[str, Any]]) -> None:
+    try:
+        pipeline = conn.pipeline(transaction=False)
+        pipeline.rpush(PENDING_KEY, *[json.dumps(row) for row in rows])
+        pipeline.ltrim(PENDING_KEY, -MAX_PENDING, -1)
+        pipeline.execute()
+    except Exception:
+        logger.warning(f"Could not queue {len(rows)} execution history rows", exc_info=True)
+
+
+class HistoryWriter:
+    """Moves queued history rows into PostgreSQL in batches"""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+
+    def take(self, conn) -> List[bytes]:
+        """Remove up to BATCH_SIZE rows from the list; atomic across workers"""
+        pipeline = conn.pipeline(transaction=True)
+        pipeline.lrange(PENDING_KEY, 0, BATCH_SIZE - 1)
+        pipeline.ltrim(PENDING_KEY, BATCH_SIZE, -1)
+        rows, _ = pipeline.execute()
+        return rows
+
+    def write(self, payloads: List[bytes]) -> None:
+        rows = []
+        for payload in payloads:
+            row = json.loads(payload)
+            row["finished_at"] = datetime.fromisoformat(row["finished_at"])
+            rows.append(row)
+        with get_engine().begin() as db:
+            db.execute(Execution.__table__.insert().values(rows))
+
+    def flush(self, conn) -> int:
+        """
+        Write one batch; returns its size. Rows the database rejects go to
+        the dead-letter list, the rest back to the pending list when the
+        database can't be reached.
+        """
+        payloads = self.take(conn)
+        if not payloads:
+            return 0
+        # Halve a rejected batch until the bad rows are on their own
+        batches = [payloads]
+        while batches:
+            batch = batches.pop()
+            try:
+                self.write(batch)
+            except ROW_ERRORS:
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    batches += [batch[middle:], batch[:middle]]
+                else:
+                    self.dead_letter(conn, batch[0])
+            except Exception:
+                conn.rpush(PENDING_KEY, *[p for b in batches + [batch] for p in b])
+                raise
+        return len(payloads)
+
+    def dead_letter(self, conn, payload: bytes) -> None:
+        logger.error(f"Execution history row rejected, moved to {DEAD_KEY}: {payload[:500]!r}",
+                     exc_info=True)
+        pipeline = conn.pipeline(transaction=False)
+        pipeline.rpush(DEAD_KEY, payload)
+        pipeline.ltrim(DEAD_KEY, -MAX_DEAD, -1)
+        pipeline.execute()
+
+    def start(self, conn, interval_ms: int = FLUSH_MS) -> Optional[threading.Thread]:
+        """Create missing tables and keep draining the list in the background"""
+        if not HISTORY_ENABLED:
+            return None
+        if self._thread is not None:
+            return self._thread
+
+        def run():
+            while True:
+                try:
+                    init_db()
+                    break
+                except Exception as e:
+                    logger.warning(f"Execution history database unavailable: {e}")
+                    time.sleep(5)
+            while True:
+                try:
+                    # A full batch means more are waiting
+                    if self.flush(conn) == BATCH_SIZE:
+                        continue
+                except Exception:
+                    logger.error("Could not write execution history", exc_info=True)
+                time.sleep(interval_ms / 1000.0)
+
+        self._thread = threading.Thread(target=run, name="history-writer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+history_writer = HistoryWriter()
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+logger = logging.getLogger(__name__)
+
+# Workers publish the id of every job that finishes or fails here
+CHANNEL = "jobs:completed"
+
+# Upper bound in seconds for `?wait=` on job status requests
+MAX_WAIT = float(os.getenv("JOB_WAIT_MAX", "30"))
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_KEEPALIVE = 15
+
+# How long a waiter waits for the listener to (re)subscribe before falling
+# back to its own timeout
+SUBSCRIBE_TIMEOUT = 2
+
+
+def publish_completion(conn, job_id: str) -> None:
+    """Announce that `job_id` has a final status; best effort"""
+    try:
+        conn.publish(CHANNEL, job_id)
+    except Exception as e:
+        logger.warning(f"Could not publish completion of job {job_id}: {e}")
+
+
+class CompletionListener:
+    """
+    Single pub/sub subscription per API process, fanned out to local waiters.
+
+    Long-poll requests and event streams register an Event for their job and
+    sleep on it instead of re-fetching the job from Redis. Under the gevent
+    server the listener and the waiters are greenlets, so idle waiters cost
+    no OS thread.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._waiters: Dict[str, Set[threading.Event]] = {}
+        self._lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-completions", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                pubsub = self.conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Read the subscribe confirmation so publishes from here on
+                # are guaranteed to reach us
+                pubsub.get_message(timeout=SUBSCRIBE_TIMEOUT)
+                self._subscribed.set()
+                # Completions published while we were disconnected were
+                # missed; let every waiter re-check its job
+                self._wake_all()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._wake(message["data"].decode("utf-8"))
+            except Exception as e:
+                self._subscribed.clear()
+                logger.warning(f"Job completion subscription lost: {e}")
+                time.sleep(1)
+
+    def _wake(self, job_id: str) -> None:
+        with self._lock:
+            events = list(self._waiters.get(job_id, ()))
+        for event in events:
+            event.set()
+
+    def _wake_all(self) -> None:
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+    @contextmanager
+    def waiter(self, job_id: str) -> Iterator[threading.Event]:
+        """
+        Event set when `job_id` completes.
+
+        Register before checking the job's status so a completion between
+        the check and the wait is not lost.
+        """
+        self._ensure_started()
+        self._subscribed.wait(SUBSCRIBE_TIMEOUT)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            with self._lock:
+                events = self._waiters.get(job_id)
+                if events is not None:
+                    events.discard(event)
+                    if not events:
+                        del self._waiters[job_id]
@@ -0,0 +1,48 @@
+from typing import Any, Dict, List, Optional
+
+from rq import get_current_connection, get_current_job
+
+from api.execution import main, main_cases
+from api import history, result_cache, result_store
+
+
+def execute_job(code: str, language: str, stdin: Optional[str] = None,
+                cache_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    RQ entry point for queued executions.
+
+    Runs the submission and, when the API asked for it by passing a
+    `cache_key`, memoizes the result for identical submissions.
+    """
+    result = _with_queue_wait(main(code, language, stdin))
+    if cache_key:
+        result_cache.store(get_current_connection(), cache_key, code, language, result)
+    history.record(get_current_connection(), get_current_job(), code, language, result)
+    return _store_result(result)
+
+
+def execute_cases_job(code: str, language: str, cases: List[str], time_limit: int) -> Dict[str, Any]:
+    """RQ entry point for batched test-case executions"""
+    result = _with_queue_wait(main_cases(code, language, cases, time_limit))
+    history.record(get_current_connection(), get_current_job(), code, language, result, cases=len(cases))
+    return _store_result(result)
+
+
+def _with_queue_wait(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the time the job spent queued to the result's timings"""
+    job = get_current_job()
+    if job is not None and job.enqueued_at and job.started_at and "timings" in result:
+        result["timings"]["queue_wait"] = (job.started_at - job.enqueued_at).total_seconds()
+    return result
+
+
+def _store_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Put the result in the result store and give RQ only a reference to keep,
+    for as long as the result's status says
+    """
+    job = get_current_job()
+    if job is None:
+        return result
+    job.result_ttl = result_store.ttl_for(result)
+    return result_store.save(get_current_connection(), job.id, result, job.result_ttl)
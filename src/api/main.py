@@ -1,29 +1,53 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import json
 import sys
 import os
+import time
+import uuid
 sys.path.append('/app/src')
 
 # Clear any cached imports
 if 'api.execution' in sys.modules:
     del sys.modules['api.execution']
 
-from api.execution import main
-from db.models import SessionLocal, User
+from api.execution import main, main_cases, COMPILE_TIME_LIMIT, TIME_LIMIT
+from api.jobs import execute_cases_job, execute_job
+from api import metrics, result_cache, result_store, single_flight, tracing
+from api.admission import AdmissionController, Rejected, client_id, user_id
+from api.job_events import CompletionListener, MAX_WAIT, SSE_KEEPALIVE
+from api.output_stream import read_stream
+from api.queues import InvalidPriority, fetch_job, get_queue, queue_name
+from db.models import ID_LENGTH, SessionLocal, User
 from rq import Queue
+from rq.job import Job, JobStatus
 from redis import Redis
 
 app = Flask(__name__)
+metrics.instrument(app)
+
+# Upper bound on test cases accepted by one batch request
+MAX_CASES = int(os.getenv("MAX_CASES", "200"))
+
+# Upper bound on submissions per bulk submission and on ids per bulk status
+# request
+MAX_BATCH_JOBS = int(os.getenv("MAX_BATCH_JOBS", "1000"))
 
 # Redis connection with error handling
 try:
-    r = Redis(host='redis', port=6379)
+    r = Redis(host=os.getenv('REDIS_HOST', 'redis'), port=6379)
     r.ping()  # Test connection
     q = Queue(connection=r)
+    completions = CompletionListener(r)
+    admission = AdmissionController(r)
     print("Successfully connected to Redis")
 except Exception as e:
     print(f"Redis connection failed: {e}")
     r = None
     q = None
+    completions = None
+    admission = None
+
+metrics_registry = metrics.build_registry(r)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -41,50 +65,246 @@ def health_check():
         "redis": redis_status
     }), 200
 
+def rejected(e):
+    response = jsonify({"status": "failure", "error": str(e)})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    body, content_type = metrics.render(metrics_registry)
+    return Response(body, mimetype=content_type)
+
 @app.route('/api/execute', methods=['POST'])
 def execute_code_endpoint():
     data = request.get_json()
     code = data.get("code")
     language = data.get("language")
+    stdin = data.get("stdin")
+    priority = data.get("priority")
+    problem_id = data.get("problem_id")
+    # Opt in to following the job's output live at /api/job/<id>/output
+    stream_output = bool(data.get("stream"))
     
     if not code or not language:
         return jsonify({"status": "failure", "error": "Code and language are required"}), 400
+    error = id_error(problem_id)
+    if error:
+        return jsonify({"status": "failure", "error": error}), 400
+    try:
+        queue_name(language, priority)
+    except InvalidPriority as e:
+        return jsonify({"status": "failure", "error": str(e)}), 400
 
     try:
         if q:
+            admission.check_rate(client_id(request), language)
+            cache_key = None
+            if result_cache.RESULT_CACHE_ENABLED:
+                cache_key = result_cache.result_key(code, language, stdin)
+                cached = result_cache.lookup(r, cache_key)
+                if cached is not None:
+                    return jsonify({
+                        "status": "success",
+                        "job_id": result_cache.CACHED_JOB_PREFIX + cache_key,
+                        "cached": True,
+                        "result": cached
+                    }), 200
+
+            # Attach to an identical job already queued or running, unless
+            # the client wants to follow a run of its own
+            job_id = str(uuid.uuid4())
+            flight = None
+            if not stream_output:
+                flight = single_flight.flight_key(code, language, stdin, queue_name(language, priority))
+            if flight:
+                leader = single_flight.join(r, flight, job_id, requester(problem_id))
+                if leader:
+                    metrics.requests_coalesced.labels(language).inc()
+                    return jsonify({"status": "success", "job_id": leader, "coalesced": True}), 200
+
             # Enqueue the task for the worker
-            job_id = enqueue_code_execution(language, code)
+            try:
+                admission.check_capacity(get_queue(r, language, priority))
+                enqueue_code_execution(language, code, stdin, cache_key, priority, problem_id,
+                                       job_id=job_id, flight=flight, stream_output=stream_output)
+            except Exception:
+                if flight:
+                    single_flight.release(r, flight, job_id)
+                raise
             return jsonify({"status": "success", "job_id": job_id}), 200
         else:
             # Fallback to direct execution if Redis is unavailable
-            result = main(code, language)
+            result = main(code, language, stdin)
             return jsonify(result), 200
+    except Rejected as e:
+        return rejected(e)
     except Exception as e:
         return jsonify({"status": "failure", "error": str(e)}), 500
 
+def job_status(job_id):
+    """Current status of a job as (response body, HTTP status)"""
+    if job_id.startswith(result_cache.CACHED_JOB_PREFIX):
+        cached = result_cache.lookup(r, job_id[len(result_cache.CACHED_JOB_PREFIX):])
+        if cached is None:
+            return {"error": "Job not found"}, 404
+        return {"status": "completed", "result": cached}, 200
+
+    job = fetch_job(r, job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+
+    if job.is_finished:
+        # Large outputs are read from their own keys only here
+        result = result_store.resolve(r, job_id, job.result)
+        if result is None:
+            return {"error": "Job not found"}, 404
+        return {
+            "status": "completed",
+            "result": result
+        }, 200
+    elif job.is_failed:
+        return {
+            "status": "failed",
+            "error": str(job.exc_info) if job.exc_info else "Job execution failed"
+        }, 200
+    else:
+        return {"status": "pending"}, 200
+
 @app.route('/api/job/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     if not q:
         return jsonify({"error": "Queue service unavailable"}), 503
-        
+
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
     try:
-        job = q.fetch_job(job_id)
-        if not job:
-            return jsonify({"error": "Job not found"}), 404
-
-        if job.is_finished:
-            return jsonify({
-                "status": "completed",
-                "result": job.result
-            }), 200
-        elif job.is_failed:
-            return jsonify({
-                "status": "failed",
-                "error": str(job.exc_info) if job.exc_info else "Job execution failed"
-            }), 200
+        if wait <= 0:
+            body, code = job_status(job_id)
+            return jsonify(body), code
+
+        # Long poll: sleep until the worker announces completion
+        deadline = time.time() + wait
+        with completions.waiter(job_id) as done:
+            body, code = job_status(job_id)
+            while code == 200 and body["status"] == "pending":
+                remaining = deadline - time.time()
+                if remaining <= 0 or not done.wait(remaining):
+                    break
+                done.clear()
+                body, code = job_status(job_id)
+        return jsonify(body), code
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def completed(result):
+    return {"status": "completed", "result": result} if result is not None else {"error": "Job not found"}
+
+def job_statuses(job_ids):
+    """
+    `job_status` for many jobs in a fixed number of pipelined round trips:
+    cached results, the job hashes, then the stored results of finished jobs
+    """
+    statuses = {}
+    cached_ids = [j for j in job_ids if j.startswith(result_cache.CACHED_JOB_PREFIX)]
+    cached = result_cache.lookup_many(r, [j[len(result_cache.CACHED_JOB_PREFIX):] for j in cached_ids])
+    for job_id, result in zip(cached_ids, cached):
+        statuses[job_id] = completed(result)
+
+    job_ids = [j for j in job_ids if j not in statuses]
+    finished = []
+    for job_id, job in zip(job_ids, Job.fetch_many(job_ids, connection=r)):
+        status = job.get_status(refresh=False) if job else None
+        if status is None:
+            statuses[job_id] = {"error": "Job not found"}
+        elif status == JobStatus.FINISHED:
+            finished.append(job)
+        elif status == JobStatus.FAILED:
+            # The traceback is left to GET /api/job/<job_id>
+            statuses[job_id] = {"status": "failed", "error": "Job execution failed"}
         else:
-            return jsonify({"status": "pending"}), 200
-            
+            statuses[job_id] = {"status": "pending"}
+
+    for job, result in zip(finished, result_store.load_many(r, [job.id for job in finished])):
+        if result is None and not result_store.is_reference(job.result):
+            result = job.result
+        statuses[job.id] = completed(result)
+    return statuses
+
+@app.route('/api/jobs', methods=['GET', 'POST'])
+def get_job_statuses():
+    """
+    Status of many jobs: ids as `?ids=a,b,c`, or as a JSON list `ids` in a
+    POST body when they do not fit in a URL
+    """
+    if not q:
+        return jsonify({"error": "Queue service unavailable"}), 503
+
+    if request.method == 'POST':
+        ids = (request.get_json(silent=True) or {}).get("ids")
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            return jsonify({"error": "ids must be a list of job ids"}), 400
+    else:
+        ids = [i for value in request.args.getlist("ids") for i in value.split(",") if i]
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return jsonify({"error": "ids are required"}), 400
+    if len(ids) > MAX_BATCH_JOBS:
+        return jsonify({"error": f"At most {MAX_BATCH_JOBS} ids per request"}), 400
+
+    try:
+        return jsonify({"jobs": job_statuses(ids)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/job/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Server-Sent Events: a `status` event, then `result` once the job is done"""
+    if not q:
+        return jsonify({"error": "Queue service unavailable"}), 503
+
+    def sse(event, body):
+        return f"event: {event}\ndata: {json.dumps(body)}\n\n"
+
+    def stream():
+        with completions.waiter(job_id) as done:
+            body, code = job_status(job_id)
+            if code == 200 and body["status"] == "pending":
+                yield sse("status", body)
+            while code == 200 and body["status"] == "pending":
+                if not done.wait(SSE_KEEPALIVE):
+                    yield ": keep-alive\n\n"
+                done.clear()
+                body, code = job_status(job_id)
+            yield sse("result" if code == 200 else "error", body)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/api/job/<job_id>/output', methods=['GET'])
+def get_job_output(job_id):
+    """
+    Output a queued job has produced so far, as chunks after stream entry
+    `after`; `wait` blocks up to that many seconds for new output
+    """
+    if not r:
+        return jsonify({"error": "Queue service unavailable"}), 503
+
+    after = request.args.get("after", "0-0")
+    try:
+        wait = min(float(request.args.get("wait", 0)), MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    try:
+        chunks, last_id, done = read_stream(r, job_id, after, int(wait * 1000) if wait > 0 else None)
+        return jsonify({"chunks": chunks, "last_id": last_id, "done": done}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -98,22 +318,248 @@ def execute_direct():
             
         code = data.get("code", "").strip()
         language = data.get("language", "").lower()
+        stdin = data.get("stdin")
         
         if not code or not language:
             return jsonify({"error": "Code and language are required"}), 400
+        if admission:
+            admission.check_rate(client_id(request), language)
+
+        cache_key = None
+        if result_cache.RESULT_CACHE_ENABLED and r:
+            cache_key = result_cache.result_key(code, language, stdin)
+            cached = result_cache.lookup(r, cache_key)
+            if cached is not None:
+                return jsonify({**cached, "cached": True}), 200
             
         print(f"Direct execution request: language={language}, code_length={len(code)}")
-        result = main(code, language)
+        result = main(code, language, stdin)
         print(f"Direct execution result: {result}")
+        if cache_key:
+            result_cache.store(r, cache_key, code, language, result)
         return jsonify(result), 200
         
+    except Rejected as e:
+        return rejected(e)
     except Exception as e:
         print(f"Direct execution error: {e}")
         return jsonify({"error": str(e)}), 500
 
-def enqueue_code_execution(language, code):
-    """Enqueues code execution task and returns job ID."""
-    job = q.enqueue(main, code, language, timeout=60)
+@app.route('/api/execute/cases', methods=['POST'])
+def execute_cases_endpoint():
+    """Compile once and run the code against a list of stdin payloads"""
+    data = request.get_json()
+    if not data:
+        return jsonify({"status": "failure", "error": "No JSON data provided"}), 400
+
+    code = data.get("code")
+    language = data.get("language")
+    cases = data.get("cases")
+    time_limit = data.get("time_limit", TIME_LIMIT)
+    priority = data.get("priority")
+    problem_id = data.get("problem_id")
+
+    if not code or not language:
+        return jsonify({"status": "failure", "error": "Code and language are required"}), 400
+    if not isinstance(cases, list) or not cases or not all(isinstance(c, str) for c in cases):
+        return jsonify({"status": "failure", "error": "cases must be a non-empty list of strings"}), 400
+    if len(cases) > MAX_CASES:
+        return jsonify({"status": "failure", "error": f"At most {MAX_CASES} cases per request"}), 400
+    if not isinstance(time_limit, (int, float)) or not 0 < time_limit <= TIME_LIMIT:
+        return jsonify({"status": "failure", "error": f"time_limit must be between 0 and {TIME_LIMIT} seconds"}), 400
+    error = id_error(problem_id)
+    if error:
+        return jsonify({"status": "failure", "error": error}), 400
+    try:
+        queue_name(language, priority)
+    except InvalidPriority as e:
+        return jsonify({"status": "failure", "error": str(e)}), 400
+
+    try:
+        if q:
+            admission.check_rate(client_id(request), language)
+            queue = get_queue(r, language, priority)
+            admission.check_capacity(queue)
+            with tracing.span("enqueue", language=language, queue=queue.name) as span:
+                job = queue.enqueue(
+                    execute_cases_job, code, language, cases, time_limit,
+                    job_timeout=COMPILE_TIME_LIMIT + len(cases) * (time_limit + 1) + 30,
+                    failure_ttl=result_store.FAILURE_TTL,
+                    meta=job_meta(problem_id)
+                )
+                span.set(job_id=job.get_id())
+            return jsonify({"status": "success", "job_id": job.get_id()}), 200
+        else:
+            # Fallback to direct execution if Redis is unavailable
+            return jsonify(main_cases(code, language, cases, time_limit)), 200
+    except Rejected as e:
+        return rejected(e)
+    except Exception as e:
+        return jsonify({"status": "failure", "error": str(e)}), 500
+
+@app.route('/api/execute/batch', methods=['POST'])
+def execute_batch_endpoint():
+    """
+    Queue many submissions with one request. Entries of `submissions` take
+    the fields of /api/execute; `priority` at the top level is the default.
+    The answer lists one result per entry, in order, and an invalid entry
+    fails on its own.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"status": "failure", "error": "No JSON data provided"}), 400
+    submissions = data.get("submissions")
+    if not isinstance(submissions, list) or not submissions:
+        return jsonify({"status": "failure", "error": "submissions must be a non-empty list"}), 400
+    if len(submissions) > MAX_BATCH_JOBS:
+        return jsonify({"status": "failure", "error": f"At most {MAX_BATCH_JOBS} submissions per request"}), 400
+    error = id_error()
+    if error:
+        return jsonify({"status": "failure", "error": error}), 400
+    if not q:
+        return jsonify({"status": "failure", "error": "Queue service unavailable"}), 503
+
+    results = [None] * len(submissions)
+    valid = []
+    for index, entry in enumerate(submissions):
+        if not isinstance(entry, dict) or not entry.get("code") or not entry.get("language"):
+            results[index] = {"status": "failure", "error": "Code and language are required"}
+            continue
+        error = id_error(entry.get("problem_id"))
+        if error:
+            results[index] = {"status": "failure", "error": error}
+            continue
+        priority = entry.get("priority", data.get("priority"))
+        try:
+            queue = queue_name(entry["language"], priority)
+        except InvalidPriority as e:
+            results[index] = {"status": "failure", "error": str(e)}
+            continue
+        valid.append({
+            "index": index, "code": entry["code"], "language": entry["language"],
+            "stdin": entry.get("stdin"), "queue": queue, "problem_id": entry.get("problem_id"),
+        })
+
+    try:
+        # Every submission costs a token of the client's batch bucket, which
+        # is sized for batches rather than single requests
+        if valid:
+            admission.check_batch_rate(client_id(request), len(valid))
+        enqueue_batch(valid, results)
+    except Rejected as e:
+        return rejected(e)
+    except Exception as e:
+        return jsonify({"status": "failure", "error": str(e)}), 500
+    return jsonify({"status": "success", "jobs": results}), 200
+
+def enqueue_batch(entries, results):
+    """
+    Answer `entries` from the result cache, coalesce them onto jobs in flight
+    and queue the rest, each step one pipelined round trip. Fills
+    `results[entry["index"]]` for every entry. Raises Rejected, with nothing
+    queued, if a queue cannot take its share of the batch.
+    """
+    if result_cache.RESULT_CACHE_ENABLED:
+        for entry in entries:
+            entry["cache_key"] = result_cache.result_key(entry["code"], entry["language"], entry["stdin"])
+        cached = result_cache.lookup_many(r, [entry["cache_key"] for entry in entries])
+        for entry, result in zip(entries, cached):
+            if result is not None:
+                results[entry["index"]] = {
+                    "status": "success",
+                    "job_id": result_cache.CACHED_JOB_PREFIX + entry["cache_key"],
+                    "cached": True,
+                    "result": result
+                }
+        entries = [entry for entry in entries if results[entry["index"]] is None]
+
+    for entry in entries:
+        entry["job_id"] = str(uuid.uuid4())
+        entry["flight"] = single_flight.flight_key(entry["code"], entry["language"], entry["stdin"], entry["queue"])
+    # Identical entries within the batch coalesce onto the first as well
+    claims = [entry for entry in entries if entry["flight"]]
+    joined = single_flight.join_many(r, [(e["flight"], e["job_id"], requester(e["problem_id"])) for e in claims])
+    for entry, leader in zip(claims, joined):
+        if leader:
+            metrics.requests_coalesced.labels(entry["language"]).inc()
+            results[entry["index"]] = {"status": "success", "job_id": leader, "coalesced": True}
+    entries = [entry for entry in entries if results[entry["index"]] is None]
+    if not entries:
+        return
+
+    by_queue = {}
+    for entry in entries:
+        meta = job_meta(entry["problem_id"])
+        if entry["flight"]:
+            meta["flight"] = entry["flight"]
+        by_queue.setdefault(entry["queue"], []).append(Queue.prepare_data(
+            execute_job, (entry["code"], entry["language"], entry["stdin"], entry.get("cache_key")),
+            timeout=60, job_id=entry["job_id"], failure_ttl=result_store.FAILURE_TTL, meta=meta
+        ))
+    with tracing.span("enqueue", jobs=len(entries)):
+        try:
+            for name, jobs in by_queue.items():
+                admission.check_capacity(Queue(name, connection=r), incoming=len(jobs))
+            with r.pipeline() as pipeline:
+                for name, jobs in by_queue.items():
+                    Queue(name, connection=r).enqueue_many(jobs, pipeline=pipeline)
+                pipeline.execute()
+        except Exception:
+            single_flight.release_many(r, [(e["flight"], e["job_id"]) for e in entries if e["flight"]])
+            raise
+    for entry in entries:
+        results[entry["index"]] = {"status": "success", "job_id": entry["job_id"]}
+
+def id_error(problem_id=None):
+    """
+    Why the request's X-User-Id or `problem_id` can't be kept in the
+    execution history, or None when both fit
+    """
+    user = user_id(request)
+    if user is not None and len(user) > ID_LENGTH:
+        return f"X-User-Id must be at most {ID_LENGTH} characters"
+    if problem_id is None:
+        return None
+    if isinstance(problem_id, bool) or not isinstance(problem_id, (str, int)):
+        return "problem_id must be a string or an integer"
+    if len(str(problem_id)) > ID_LENGTH:
+        return f"problem_id must be at most {ID_LENGTH} characters"
+    return None
+
+def requester(problem_id=None):
+    """Who sent the current request for which problem, for the execution history"""
+    return {
+        "user_id": user_id(request),
+        "problem_id": str(problem_id) if problem_id is not None else None,
+    }
+
+def job_meta(problem_id=None):
+    """
+    Meta of a job queued by the current request: the trace to continue and
+    its requester
+    """
+    return {"traceparent": tracing.traceparent(), **requester(problem_id)}
+
+def enqueue_code_execution(language, code, stdin=None, cache_key=None, priority=None, problem_id=None,
+                           job_id=None, flight=None, stream_output=False):
+    """
+    Enqueues code execution task on its language/priority queue and returns job ID.
+    `flight` is the coalescing key the job holds, released when it finishes;
+    `stream_output` has the worker publish the job's output as it runs.
+    """
+    queue = get_queue(r, language, priority)
+    meta = job_meta(problem_id)
+    if flight:
+        meta["flight"] = flight
+    if stream_output:
+        meta["stream_output"] = True
+    # The worker continues this trace from the job's meta
+    with tracing.span("enqueue", language=language, queue=queue.name) as span:
+        job = queue.enqueue(
+            execute_job, code, language, stdin, cache_key, job_timeout=60,
+            job_id=job_id, failure_ttl=result_store.FAILURE_TTL, meta=meta
+        )
+        span.set(job_id=job.get_id())
     return job.get_id()
 
 if __name__ == '__main__':
@@ -0,0 +1,176 @@
+import glob
+import logging
+import os
+import time
+from typing import Optional, Tuple
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from rq import Queue
+
+from api.container_pool import LANGUAGE_SERVICES, container_pool
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the processes of one service (e.g. the gunicorn
+# workers). Each process writes its samples there and a scrape merges them;
+# without it every process only reports its own.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Port the RQ worker serves /metrics on
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests served", ["method", "route", "status"]
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce an HTTP response", ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+requests_coalesced = Counter(
+    "requests_coalesced_total", "Queued requests attached to an identical job in flight", ["language"]
+)
+job_queue_wait = Histogram(
+    "job_queue_wait_seconds", "Time from enqueue until a worker started the job", ["queue"],
+    buckets=QUEUE_WAIT_BUCKETS
+)
+# Timeouts are executions_total{status="timeout"}
+executions = Counter(
+    "executions_total", "Finished executions", ["language", "status"]
+)
+execution_duration = Histogram(
+    "execution_duration_seconds", "Execution time including container lease", ["language", "status"],
+    buckets=LATENCY_BUCKETS
+)
+workspaces_reaped = Counter(
+    "workspaces_reaped_total", "Execution workspaces removed by the reaper", ["reason"]
+)
+
+
+def reset_multiproc_dir() -> None:
+    """Drop samples left by a previous run; call before any process starts recording"""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+        os.remove(path)
+
+
+def mark_process_dead(pid: int) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+class StateCollector:
+    """Container pool, queue depth and Redis round trip, read at scrape time"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def collect(self):
+        rtt = GaugeMetricFamily("redis_ping_seconds", "Round trip of a Redis PING from this process")
+        try:
+            started = time.perf_counter()
+            self.conn.ping()
+            rtt.add_metric([], time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Redis ping failed during scrape: {e}")
+            return
+        yield rtt
+
+        leases = GaugeMetricFamily(
+            "container_pool_leases", "In-flight executions per replica", labels=["language", "container"]
+        )
+        capacity = GaugeMetricFamily(
+            "container_pool_capacity", "Concurrent executions the replicas are sized for", labels=["language"]
+        )
+        try:
+            for language, usage in container_pool.utilization().items():
+                for container, count in usage.items():
+                    leases.add_metric([language, container], count)
+            for language in LANGUAGE_SERVICES:
+                capacity.add_metric([language], container_pool.capacity([language]))
+            yield leases
+            yield capacity
+        except Exception as e:
+            logger.warning(f"Could not read container pool usage: {e}")
+
+        scratch = GaugeMetricFamily(
+            "container_scratch_bytes", "Disk used by execution workspaces per replica",
+            labels=["language", "container"]
+        )
+        workspaces = GaugeMetricFamily(
+            "container_scratch_workspaces", "Execution workspaces present per replica",
+            labels=["language", "container"]
+        )
+        try:
+            for language, usage in container_pool.scratch_usage().items():
+                for container, measured in usage.items():
+                    scratch.add_metric([language, container], measured["bytes"])
+                    workspaces.add_metric([language, container], measured["workspaces"])
+            yield scratch
+            yield workspaces
+        except Exception as e:
+            logger.warning(f"Could not read scratch area usage: {e}")
+
+        depth = GaugeMetricFamily("rq_queue_depth", "Jobs waiting per queue", labels=["queue"])
+        try:
+            for queue in Queue.all(connection=self.conn):
+                depth.add_metric([queue.name], queue.count)
+            yield depth
+        except Exception as e:
+            logger.warning(f"Could not read queue depths: {e}")
+
+
+def build_registry(conn=None) -> CollectorRegistry:
+    """
+    Registry to expose: the merged samples of all processes in multiprocess
+    mode, plus live system state when a Redis connection is given
+    """
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    if conn is not None:
+        registry.register(StateCollector(conn))
+    return registry
+
+
+def render(registry: CollectorRegistry) -> Tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def instrument(app) -> None:
+    """Count and time every request of a Flask app by route template"""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = getattr(g, "metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            http_requests.labels(request.method, route, response.status_code).inc()
+            http_request_duration.labels(request.method, route).observe(time.perf_counter() - started)
+        return response
+
+
+def observe_execution(language: str, status: str, seconds: float) -> None:
+    if language in LANGUAGE_SERVICES:
+        executions.labels(language, status).inc()
+        execution_duration.labels(language, status).observe(seconds)
+
+
+def observe_queue_wait(queue: str, seconds: Optional[float]) -> None:
+    if seconds is not None and seconds >= 0:
+        job_queue_wait.labels(queue).observe(seconds)
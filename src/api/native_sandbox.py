@@ -0,0 +1,261 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import pwd
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+from typing import List, Optional
+
+from api.output_stream import OutputSink, stream_process
+
+logger = logging.getLogger(__name__)
+
+# Submissions run as processes of the worker host, for trusted deployments
+# where the Docker daemon is the bottleneck. Each execution gets a private
+# directory under NATIVE_WORK_ROOT; compiled artifacts are kept per content
+# hash under NATIVE_CACHE_DIR.
+NATIVE_WORK_ROOT = os.getenv("NATIVE_WORK_ROOT", "/tmp/native")
+NATIVE_CACHE_DIR = os.getenv("NATIVE_CACHE_DIR", "/tmp/native_cache")
+
+# Name reported as `container_used`
+HOST_NAME = f"native:{socket.gethostname()}"
+
+# Unprivileged account submissions run as when the worker runs as root
+SANDBOX_USER = os.getenv("NATIVE_SANDBOX_USER", "nobody")
+
+# Per-process limits. NPROC counts every process of the sandbox user, so it
+# is shared by concurrent executions.
+MEMORY_BYTES = int(os.getenv("NATIVE_MEMORY_BYTES", str(512 * 1024 * 1024)))
+MAX_PROCESSES = int(os.getenv("NATIVE_MAX_PROCESSES", "512"))
+MAX_FILE_BYTES = int(os.getenv("NATIVE_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+
+# Compilers get more room than the programs they build
+COMPILE_MEMORY_BYTES = int(os.getenv("NATIVE_COMPILE_MEMORY_BYTES", str(2048 * 1024 * 1024)))
+
+# The JVM and V8 reserve large address ranges up front, so instead of
+# RLIMIT_AS they get a heap cap of the same size
+HEAP_LIMITED = ("java", "nodejs")
+
+# Isolation beyond rlimits, applied when the kernel allows it: private
+# network/IPC/UTS namespaces and a seccomp filter. Set to 0 to disable.
+NAMESPACES_ENABLED = os.getenv("NATIVE_NAMESPACES", "1") != "0"
+SECCOMP_ENABLED = os.getenv("NATIVE_SECCOMP", "1") != "0"
+
+CLONE_NEWUTS = 0x04000000
+CLONE_NEWIPC = 0x08000000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+SCMP_ACT_ALLOW = 0x7fff0000
+SCMP_ACT_ERRNO_EPERM = 0x00050000 | 1
+
+# Calls a submission has no business making; they fail with EPERM. Denying
+# setsid/setpgid keeps every process it starts in its process group, which
+# is killed when the run ends.
+DENIED_SYSCALLS = [
+    "setsid", "setpgid",
+    "ptrace", "process_vm_readv", "process_vm_writev", "mount", "umount2",
+    "pivot_root", "chroot", "unshare", "setns", "reboot", "kexec_load",
+    "init_module", "finit_module", "delete_module", "bpf", "perf_event_open",
+    "keyctl", "add_key", "request_key", "swapon", "swapoff", "acct",
+    "settimeofday", "clock_settime", "sethostname", "setdomainname",
+]
+
+SANDBOX_ENV = {
+    "PATH": "/usr/local/bin:/usr/bin:/bin",
+    "LANG": "C.UTF-8",
+}
+
+
+def _load_libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.unshare.argtypes = [ctypes.c_int]
+    return libc
+
+
+def _build_seccomp_filter():
+    """libseccomp filter denying DENIED_SYSCALLS, or None if unavailable"""
+    path = ctypes.util.find_library("seccomp")
+    if not SECCOMP_ENABLED or not path:
+        return None, None
+    try:
+        lib = ctypes.CDLL(path)
+        lib.seccomp_init.restype = ctypes.c_void_p
+        lib.seccomp_init.argtypes = [ctypes.c_uint32]
+        lib.seccomp_rule_add.argtypes = [ctypes.c_void_p, ctypes.c_uint32, ctypes.c_int, ctypes.c_uint]
+        lib.seccomp_syscall_resolve_name.argtypes = [ctypes.c_char_p]
+        lib.seccomp_load.argtypes = [ctypes.c_void_p]
+        context = lib.seccomp_init(SCMP_ACT_ALLOW)
+        for name in DENIED_SYSCALLS:
+            number = lib.seccomp_syscall_resolve_name(name.encode())
+            if number >= 0:
+                lib.seccomp_rule_add(context, SCMP_ACT_ERRNO_EPERM, number, 0)
+        return lib, context
+    except (OSError, AttributeError) as e:
+        logger.warning(f"seccomp unavailable, running without a syscall filter: {e}")
+        return None, None
+
+
+class NativeSandbox:
+    """
+    Runs commands on this host under rlimits as an unprivileged user, in
+    private namespaces and behind a seccomp filter where available.
+
+    Everything the forked child does is prepared beforehand: between fork
+    and exec it only makes system calls, which is safe in the threaded
+    worker and API processes.
+    """
+
+    def __init__(self):
+        self._libc = _load_libc()
+        self._seccomp, self._seccomp_filter = _build_seccomp_filter()
+        self._ids = None
+        if os.geteuid() == 0:
+            try:
+                account = pwd.getpwnam(SANDBOX_USER)
+                self._ids = (account.pw_uid, account.pw_gid)
+            except KeyError:
+                logger.error(f"Sandbox user {SANDBOX_USER} does not exist")
+                raise
+        else:
+            logger.warning("Worker is not root; native submissions run as the worker's own user")
+
+    def workspace(self, execution_id: str) -> str:
+        """Private directory for one execution, writable by the sandbox user"""
+        os.makedirs(NATIVE_WORK_ROOT, exist_ok=True)
+        workdir = tempfile.mkdtemp(prefix=f"{os.path.basename(execution_id)}.", dir=NATIVE_WORK_ROOT)
+        self.give(workdir)
+        return workdir
+
+    def give(self, path: str) -> None:
+        """Hand a file or directory the worker created to the sandbox user"""
+        if self._ids:
+            os.chown(path, *self._ids)
+
+    def publish(self, build_dir: str, target: str) -> bool:
+        """
+        Move a build into the artifact cache at `target`. The files are taken
+        back from the sandbox user first so later submissions cannot alter
+        them. Returns False if another execution published it first.
+        """
+        for root, dirs, files in os.walk(build_dir):
+            for name in [root] + [os.path.join(root, entry) for entry in dirs + files]:
+                os.lchown(name, os.getuid(), os.getgid())
+                if not os.path.islink(name):
+                    os.chmod(name, os.lstat(name).st_mode & ~0o022)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.rename(build_dir, target)
+            return True
+        except OSError:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            return False
+
+    def remove(self, path: str) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+
+    def run(self, argv: List[str], workdir: str, stdin: Optional[str], time_limit: float,
+            sink: OutputSink, memory_bytes: Optional[int] = MEMORY_BYTES) -> Optional[int]:
+        """
+        Run `argv` in `workdir`; returns its exit status (negative for a
+        signal) or None when it ran past `time_limit` seconds. `memory_bytes`
+        None leaves the address space unlimited.
+        """
+        # SIGXCPU at the soft CPU limit, SIGKILL a second later
+        cpu_seconds = int(time_limit) + 1
+        limits = [
+            (resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1)),
+            (resource.RLIMIT_NPROC, (MAX_PROCESSES, MAX_PROCESSES)),
+            (resource.RLIMIT_FSIZE, (MAX_FILE_BYTES, MAX_FILE_BYTES)),
+            (resource.RLIMIT_CORE, (0, 0)),
+        ]
+        if memory_bytes:
+            limits.append((resource.RLIMIT_AS, (memory_bytes, memory_bytes)))
+        env = dict(SANDBOX_ENV, HOME=workdir, TMPDIR=workdir)
+        return stream_process(
+            argv, stdin, time_limit, sink,
+            cwd=workdir, env=env, preexec_fn=self._preexec(limits), start_new_session=True
+        )
+
+    def _preexec(self, limits):
+        libc = self._libc
+        ids = self._ids
+        seccomp, seccomp_filter = self._seccomp, self._seccomp_filter
+        # As root the namespaces come from our own privileges; otherwise an
+        # unprivileged user namespace is needed to create them
+        flags = CLONE_NEWNET | CLONE_NEWIPC | CLONE_NEWUTS
+        if ids is None:
+            flags |= CLONE_NEWUSER
+
+        def preexec():
+            if NAMESPACES_ENABLED:
+                # Best effort: without namespaces the run keeps host networking
+                libc.unshare(flags)
+            for limit, values in limits:
+                resource.setrlimit(limit, values)
+            if ids:
+                uid, gid = ids
+                os.setgroups([])
+                os.setgid(gid)
+                os.setuid(uid)
+            if seccomp_filter:
+                seccomp.seccomp_load(seccomp_filter)
+
+        return preexec
+
+
+def memory_limit(language: str, memory_bytes: int = MEMORY_BYTES) -> Optional[int]:
+    """RLIMIT_AS for `language`, None where a heap cap is used instead"""
+    return None if language in HEAP_LIMITED else memory_bytes
+
+
+def compile_command(language: str, flags: str, build_dir: str) -> List[str]:
+    if language == "java":
+        return ["javac", *flags.split(), "-d", build_dir, "Main.java"]
+    return ["g++", *flags.split(), "-o", os.path.join(build_dir, "prog"), "prog.cpp"]
+
+
+def run_command(language: str, source: str, artifact_dir: Optional[str]) -> List[str]:
+    megabytes = max(MEMORY_BYTES // (1024 * 1024), 16)
+    if language == "java":
+        return ["java", f"-Xmx{megabytes}m", "-cp", artifact_dir, "Main"]
+    if language == "cpp":
+        return [os.path.join(artifact_dir, "prog")]
+    if language == "nodejs":
+        return ["node", f"--max-old-space-size={megabytes}", source]
+    return ["python3", source]
+
+
+def local_version(_host: str, argv: List[str]):
+    """compile_cache version probe that runs the compiler on this host"""
+    result = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=10)
+    return result.returncode, result.stdout
+
+
+def tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+_sandbox: Optional[NativeSandbox] = None
+_lock = threading.Lock()
+
+
+def get_sandbox() -> NativeSandbox:
+    """The process-wide sandbox, set up on first use"""
+    global _sandbox
+    with _lock:
+        if _sandbox is None:
+            _sandbox = NativeSandbox()
+        return _sandbox
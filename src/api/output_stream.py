@@ -0,0 +1,276 @@
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from rq import get_current_job
+
+from api import compile_cache, tracing
+from api.redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Combined stdout + stderr a program may produce before it is killed and
+# its result marked truncated
+MAX_OUTPUT_BYTES = int(os.getenv("MAX_OUTPUT_BYTES", str(1024 * 1024)))
+
+READ_CHUNK_BYTES = 64 * 1024
+
+# How often a process group is checked for its leader having exited
+GROUP_POLL_SECONDS = 0.1
+
+# Live output of a queued job that asked for it (job meta `stream_output`)
+# is appended to the Redis stream `output:<job_id>` as entries
+# {stream: stdout|stderr|end, data}. Chunks are gathered for up to
+# OUTPUT_FLUSH_MS milliseconds and written together, one entry per stream
+# switch, so a chatty program costs a few Redis writes per second.
+STREAM_PREFIX = "output:"
+STREAM_TTL = int(os.getenv("OUTPUT_STREAM_TTL", "300"))
+STREAM_MAXLEN = 1000
+END_STREAM = "end"
+FLUSH_SECONDS = int(os.getenv("OUTPUT_FLUSH_MS", "100")) / 1000.0
+
+# Lines the execution scripts write to stderr for the worker; they are
+# stripped from results and never published
+INTERNAL_MARKERS = (tracing.MARKER.encode(), compile_cache.MARKER.encode())
+
+
+def stream_key(job_id: str) -> str:
+    return STREAM_PREFIX + job_id
+
+
+class OutputSink:
+    """
+    Collects a program's output up to a byte cap.
+
+    With a Redis connection and job id, chunks are also published to the
+    job's output stream as they arrive so clients can follow it live.
+    """
+
+    def __init__(self, limit: Optional[int] = MAX_OUTPUT_BYTES, conn=None, job_id: Optional[str] = None):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self.buffers = {"stdout": bytearray(), "stderr": bytearray()}
+        self.conn = conn
+        self.key = stream_key(job_id) if conn is not None and job_id else None
+        # Chunks waiting for the next flush, as [stream, data] runs
+        self._pending: List[list] = []
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Held across a write so flushes reach the stream in order
+        self._flush_lock = threading.Lock()
+        # Unfinished stderr line that may still turn out to be a marker, and
+        # whether the next stderr byte starts a line
+        self._held = b""
+        self._line_start = True
+
+    @property
+    def publishing(self) -> bool:
+        return self.key is not None
+
+    def write(self, stream: str, data: bytes) -> bool:
+        """Append a chunk; returns False once the cap has been exceeded"""
+        if self.limit is not None and self.size + len(data) > self.limit:
+            data = data[:max(self.limit - self.size, 0)]
+            self.truncated = True
+        self.buffers[stream] += data
+        self.size += len(data)
+        if data:
+            self.publish(stream, data)
+        return not self.truncated
+
+    def publish(self, stream: str, data) -> None:
+        """Queue a chunk for the job's output stream; flushed within FLUSH_SECONDS"""
+        if self.key is None:
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self._lock:
+            if stream == "stderr":
+                data = self._strip_markers(data)
+            if not data:
+                return
+            if self._pending and self._pending[-1][0] == stream:
+                self._pending[-1][1] += data
+            else:
+                self._pending.append([stream, bytearray(data)])
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(FLUSH_SECONDS, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _strip_markers(self, data: bytes) -> bytes:
+        """Drop whole marker lines; an unfinished line is held while it could still be one"""
+        data = self._held + data
+        self._held = b""
+        kept = bytearray()
+        *lines, rest = data.split(b"\n")
+        for line in [line + b"\n" for line in lines] + ([rest] if rest else []):
+            line_start, self._line_start = self._line_start, line.endswith(b"\n")
+            if line_start and not self._line_start and \
+                    any(line.startswith(marker) or marker.startswith(line) for marker in INTERNAL_MARKERS):
+                self._held, self._line_start = line, True
+            elif not (line_start and line.startswith(INTERNAL_MARKERS)):
+                kept += line
+        return bytes(kept)
+
+    def flush(self) -> None:
+        """Write the queued chunks in one round trip"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._flush_timer = None
+                key = self.key
+            if key is None or not pending:
+                return
+            try:
+                pipe = self.conn.pipeline(transaction=False)
+                for stream, data in pending:
+                    pipe.xadd(key, {"stream": stream, "data": bytes(data)}, maxlen=STREAM_MAXLEN)
+                pipe.expire(key, STREAM_TTL)
+                pipe.execute()
+            except Exception as e:
+                # Live output is best effort; stop trying for this execution
+                logger.warning(f"Could not publish output to {key}: {e}")
+                self.key = None
+
+    def close(self) -> None:
+        if self.key is None:
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            # What is left unfinished is no marker: those end with a newline
+            held, self._held = self._held, b""
+            if held and not held.startswith(INTERNAL_MARKERS):
+                self._pending.append(["stderr", bytearray(held)])
+            self._pending.append([END_STREAM, bytearray()])
+        self.flush()
+
+    def text(self, stream: str) -> str:
+        return bytes(self.buffers[stream]).decode("utf-8", "replace")
+
+    def apply(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Flag a truncated result as a failure with an explanatory error"""
+        if self.truncated and response.get("status") not in ("error", "timeout"):
+            message = f"Output limit of {self.limit} bytes exceeded"
+            response["status"] = "failure"
+            response["error"] = f"{response['error']}\n{message}" if response.get("error") else message
+            response["truncated"] = True
+        return response
+
+
+def sink_for_current_job() -> OutputSink:
+    """Sink that publishes live output when running inside an RQ job that asked for it"""
+    job = get_current_job()
+    if job is None or not job.meta.get("stream_output"):
+        return OutputSink()
+    return OutputSink(conn=get_redis(), job_id=job.id)
+
+
+def stream_process(command: List[str], stdin: Optional[str], timeout: float,
+                   sink: OutputSink, **popen_kwargs) -> Optional[int]:
+    """
+    Run `command`, reading its stdout/stderr into `sink` chunk by chunk.
+
+    The process is killed when `timeout` passes (returns None) or when the
+    sink's byte cap is exceeded (returns the exit status after the kill).
+    Extra keyword arguments go to Popen; with `start_new_session` kills hit
+    the whole process group, which is also killed once the process exits so
+    nothing it started outlives it.
+    """
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **popen_kwargs
+    )
+    group = popen_kwargs.get("start_new_session", False)
+    kill = _kill_group if group else subprocess.Popen.kill
+    if stdin:
+        # A program that never reads its input must not block the reader
+        threading.Thread(target=_feed, args=(process.stdin, stdin.encode("utf-8")), daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    try:
+        while selector.get_map() and not sink.truncated:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            # A group is watched so that children holding the pipes open
+            # are killed as soon as the process itself exits
+            for key, _ in selector.select(min(remaining, GROUP_POLL_SECONDS) if group else remaining):
+                data = os.read(key.fd, READ_CHUNK_BYTES)
+                if not data:
+                    selector.unregister(key.fileobj)
+                elif not sink.write(key.data, data):
+                    break
+            if group and process.poll() is not None:
+                _kill_group(process)
+        if timed_out or sink.truncated:
+            kill(process)
+        try:
+            process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            kill(process)
+            process.wait()
+    finally:
+        if group:
+            _kill_group(process)
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+    return None if timed_out else process.returncode
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _feed(pipe, data: bytes) -> None:
+    try:
+        pipe.write(data)
+        pipe.close()
+    except OSError:
+        pass
+
+
+def read_stream(conn, job_id: str, after: str = "0-0",
+                block_ms: Optional[int] = None) -> Tuple[List[Dict[str, str]], str, bool]:
+    """
+    Output chunks of `job_id` after entry `after`.
+
+    Returns (chunks, last entry id, whether the end marker was seen).
+    """
+    entries = conn.xread({stream_key(job_id): after}, block=block_ms) or []
+    chunks = []
+    done = False
+    last_id = after
+    for _, items in entries:
+        for entry_id, fields in items:
+            last_id = entry_id.decode("utf-8")
+            stream = fields[b"stream"].decode("utf-8")
+            if stream == END_STREAM:
+                done = True
+                continue
+            chunks.append({
+                "id": last_id,
+                "stream": stream,
+                "data": fields[b"data"].decode("utf-8", "replace"),
+            })
+    return chunks, last_id, done
@@ -0,0 +1,90 @@
+import os
+import random
+from typing import List, Optional, Tuple
+
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+
+from api.execution import SUPPORTED_LANGUAGES
+
+# Priority classes: interactive "run" requests, graded "submit" requests and
+# bulk "rejudge" batches. Each gets one queue per language, named
+# "<priority>:<language>", so slow work never sits in front of quick runs.
+PRIORITIES = ("run", "submit", "rejudge")
+DEFAULT_PRIORITY = "run"
+
+# Queue used before jobs were routed; workers keep draining it
+LEGACY_QUEUE = "default"
+
+# Queue sets a worker serves, as comma-separated "<queue>=<weight>" entries.
+# `*` in a queue name stands for every language, e.g. "run:*=10,submit:*=3"
+# or "run:java=1" for a Java-only worker.
+DEFAULT_WORKER_QUEUES = "run:*=10,submit:*=3,rejudge:*=1,default=1"
+WORKER_QUEUES = os.getenv("WORKER_QUEUES") or DEFAULT_WORKER_QUEUES
+
+
+class InvalidPriority(ValueError):
+    """The request named a priority class that does not exist"""
+
+
+def queue_name(language: str, priority: Optional[str] = None) -> str:
+    """
+    Queue for a request. Unknown languages go to the legacy queue, where the
+    worker reports them as unsupported, rather than creating new queues.
+    """
+    priority = priority or DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        raise InvalidPriority(f"Unknown priority: {priority}. Supported: {list(PRIORITIES)}")
+    if language not in SUPPORTED_LANGUAGES:
+        return LEGACY_QUEUE
+    return f"{priority}:{language}"
+
+
+def get_queue(conn, language: str, priority: Optional[str] = None) -> Queue:
+    return Queue(queue_name(language, priority), connection=conn)
+
+
+def fetch_job(conn, job_id: str) -> Optional[Job]:
+    """Job by id whichever queue it was enqueued on, or None"""
+    try:
+        return Job.fetch(job_id, connection=conn)
+    except NoSuchJobError:
+        return None
+
+
+def parse_queue_weights(spec: str = WORKER_QUEUES) -> List[Tuple[str, float]]:
+    """Expand a WORKER_QUEUES spec into (queue name, weight) pairs"""
+    weights = []
+    seen = set()
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, weight = entry.partition("=")
+        weight = float(weight) if weight else 1.0
+        if weight <= 0:
+            raise ValueError(f"Queue weight must be positive: {entry}")
+        names = [name.replace("*", language) for language in SUPPORTED_LANGUAGES] if "*" in name else [name]
+        for expanded in names:
+            if expanded not in seen:
+                seen.add(expanded)
+                weights.append((expanded, weight))
+    return weights
+
+
+def queue_languages(names: List[str]) -> List[str]:
+    """Languages whose jobs can arrive on the given queues"""
+    if LEGACY_QUEUE in names:
+        return list(SUPPORTED_LANGUAGES)
+    languages = {name.partition(":")[2] for name in names}
+    return [language for language in SUPPORTED_LANGUAGES if language in languages]
+
+
+def weighted_order(weights: List[float]) -> List[int]:
+    """
+    Indices of `weights` in a random order where heavier entries tend to
+    come first (weighted sampling without replacement).
+    """
+    keys = [random.random() ** (1.0 / weight) for weight in weights]
+    return sorted(range(len(weights)), key=lambda i: keys[i], reverse=True)
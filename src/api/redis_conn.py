@@ -0,0 +1,41 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Redis connection settings
+redis_host = os.getenv('REDIS_HOST', 'redis')
+redis_url = os.getenv('REDIS_URL', f'redis://{redis_host}:6379/0')
+
+# Seconds to wait before retrying after a failed connection attempt
+RETRY_INTERVAL = 5
+
+_connection = None
+_last_failure = 0.0
+_lock = threading.Lock()
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Shared Redis client for the execution layer, or None when Redis is
+    unreachable. Failed connection attempts are retried every
+    RETRY_INTERVAL seconds.
+    """
+    global _connection, _last_failure
+    if _connection is not None:
+        return _connection
+    with _lock:
+        if _connection is None and time.time() - _last_failure >= RETRY_INTERVAL:
+            try:
+                conn = redis.from_url(redis_url)
+                conn.ping()
+                _connection = conn
+            except Exception as e:
+                _last_failure = time.time()
+                logger.warning(f"Redis unavailable at {redis_url}: {e}")
+    return _connection
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Opt-in memoization of finished executions, keyed by (code, language, stdin)
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "0") == "1"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+KEY_PREFIX = "result_cache:"
+INDEX_KEY = "result_cache:index"
+SIZES_KEY = "result_cache:sizes"
+BYTES_KEY = "result_cache:bytes"
+
+# Job ids handed out for cache hits, resolvable through /api/job/<job_id>
+CACHED_JOB_PREFIX = "cached-"
+
+# Only clean program outcomes are reused; timeouts and system errors may
+# succeed on a retry
+CACHEABLE_STATUSES = ("success", "failure")
+
+# Sources touching clocks, randomness or threads can produce a different
+# result on every run
+NONDETERMINISTIC_PATTERNS = {
+    "python": re.compile(r"\b(random|time|datetime|uuid|secrets|threading|urandom)\b"),
+    "nodejs": re.compile(r"Math\.random|\bDate\b|performance\.now|process\.hrtime|\bcrypto\b"),
+    "cpp": re.compile(r"\brand\s*\(|random_device|\btime\s*\(|chrono|\bclock\s*\(|<thread>|<random>"),
+    "java": re.compile(r"\bRandom\b|Math\.random|currentTimeMillis|nanoTime|\bUUID\b|\bInstant\b|LocalDate|\bThread\b"),
+}
+
+# Stores the entry, forgets index entries whose TTL lapsed and evicts the
+# oldest entries until the byte budget holds again
+STORE_SCRIPT = """
+local payload = ARGV[1]
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local max_bytes = tonumber(ARGV[4])
+
+local function drop(key)
+    local size = tonumber(redis.call('HGET', KEYS[3], key) or '0')
+    redis.call('HDEL', KEYS[3], key)
+    redis.call('ZREM', KEYS[2], key)
+    redis.call('DECRBY', KEYS[4], size)
+end
+
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now - ttl)) do
+    drop(key)
+end
+
+if redis.call('ZSCORE', KEYS[2], KEYS[1]) then
+    drop(KEYS[1])
+end
+
+redis.call('SET', KEYS[1], payload, 'EX', ttl)
+redis.call('ZADD', KEYS[2], now, KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], string.len(payload))
+local total = redis.call('INCRBY', KEYS[4], string.len(payload))
+
+while total > max_bytes do
+    local candidates = redis.call('ZRANGE', KEYS[2], 0, 1)
+    local oldest = candidates[1]
+    if oldest == KEYS[1] then
+        oldest = candidates[2]
+    end
+    if not oldest then
+        break
+    end
+    redis.call('DEL', oldest)
+    drop(oldest)
+    total = tonumber(redis.call('GET', KEYS[4]))
+end
+return total
+"""
+
+
+def result_key(code: str, language: str, stdin: Optional[str]) -> str:
+    """Content hash of a submission"""
+    digest = hashlib.sha256()
+    for part in (language, stdin or "", code):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def is_deterministic(code: str, language: str) -> bool:
+    pattern = NONDETERMINISTIC_PATTERNS.get(language)
+    return pattern is not None and not pattern.search(code)
+
+
+def is_cacheable(code: str, language: str, result: Dict[str, Any]) -> bool:
+    return result.get("status") in CACHEABLE_STATUSES and is_deterministic(code, language)
+
+
+def lookup(conn, key: str) -> Optional[Dict[str, Any]]:
+    """Return the memoized result for `key`, if any"""
+    try:
+        payload = conn.get(KEY_PREFIX + key)
+    except Exception:
+        logger.warning("Result cache lookup failed", exc_info=True)
+        return None
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+def lookup_many(conn, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """`lookup` for many keys in one round trip"""
+    if not keys:
+        return []
+    try:
+        payloads = conn.mget([KEY_PREFIX + key for key in keys])
+    except Exception:
+        logger.warning("Result cache lookup failed", exc_info=True)
+        return [None] * len(keys)
+    return [json.loads(payload) if payload is not None else None for payload in payloads]
+
+
+def store(conn, key: str, code: str, language: str, result: Dict[str, Any]) -> bool:
+    """Memoize `result` if it is safe to reuse; returns True when stored"""
+    if not is_cacheable(code, language, result):
+        return False
+    payload = json.dumps(result)
+    if len(payload) > RESULT_CACHE_MAX_BYTES:
+        return False
+    try:
+        conn.register_script(STORE_SCRIPT)(
+            keys=[KEY_PREFIX + key, INDEX_KEY, SIZES_KEY, BYTES_KEY],
+            args=[payload, RESULT_CACHE_TTL, time.time(), RESULT_CACHE_MAX_BYTES]
+        )
+    except Exception:
+        logger.warning("Result cache store failed", exc_info=True)
+        return False
+    return True
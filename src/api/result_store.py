@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import zlib
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Results of queued jobs are kept under keys of their own rather than as
+# RQ's pickled return value, which only holds a small reference. Each
+# result lives for a TTL chosen by its status, so Redis memory is bounded by
+# the completion rate times these TTLs.
+SUCCESS_TTL = int(os.getenv("RESULT_TTL_SUCCESS", "600"))
+FAILURE_TTL = int(os.getenv("RESULT_TTL_FAILURE", "600"))
+TIMEOUT_TTL = int(os.getenv("RESULT_TTL_TIMEOUT", "300"))
+
+# Stored values are compact JSON, zlib-compressed from this size up
+COMPRESS_MIN_BYTES = int(os.getenv("RESULT_COMPRESS_MIN_BYTES", "1024"))
+
+# Strings longer than this (stdout, stderr, per-case output) are split out
+# of the record into keys of their own and only read when the full result
+# is served
+INLINE_MAX_BYTES = int(os.getenv("RESULT_INLINE_MAX_BYTES", "4096"))
+
+KEY = "result:{}"
+PART_KEY = "result:{}:{}"
+
+# First byte of every stored value
+RAW = b"j"
+COMPRESSED = b"z"
+
+# What RQ stores as the job's return value instead of the result
+REFERENCE_FIELD = "stored_result"
+
+# Stands in for a split-out string inside the record
+PART_FIELD = "__result_part__"
+
+
+def encode(value: Any) -> bytes:
+    payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            return COMPRESSED + compressed
+    return RAW + payload
+
+
+def decode(data: bytes) -> Any:
+    tag, payload = data[:1], data[1:]
+    if tag == COMPRESSED:
+        payload = zlib.decompress(payload)
+    elif tag != RAW:
+        raise ValueError(f"Unknown result encoding: {tag!r}")
+    return json.loads(payload)
+
+
+def ttl_for(result: Dict[str, Any]) -> int:
+    status = result.get("status")
+    if status == "success":
+        return SUCCESS_TTL
+    if status == "timeout":
+        return TIMEOUT_TTL
+    return FAILURE_TTL
+
+
+def _split(value: Any, parts: List[str]) -> Any:
+    """Copy of `value` with long strings moved to `parts`"""
+    if isinstance(value, str) and len(value) > INLINE_MAX_BYTES:
+        parts.append(value)
+        return {PART_FIELD: len(parts) - 1}
+    if isinstance(value, dict):
+        return {k: _split(v, parts) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_split(v, parts) for v in value]
+    return value
+
+
+def _join(value: Any, parts: List[Optional[str]]) -> Any:
+    if isinstance(value, dict):
+        if PART_FIELD in value and len(value) == 1:
+            return parts[value[PART_FIELD]]
+        return {k: _join(v, parts) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_join(v, parts) for v in value]
+    return value
+
+
+def save(conn, job_id: str, result: Dict[str, Any], ttl: int) -> Dict[str, Any]:
+    """Store a job's result; returns the reference to hand to RQ instead"""
+    parts: List[str] = []
+    record = _split(result, parts)
+    pipeline = conn.pipeline(transaction=False)
+    pipeline.set(KEY.format(job_id), encode([record, len(parts)]), ex=ttl)
+    for i, part in enumerate(parts):
+        pipeline.set(PART_KEY.format(job_id, i), encode(part), ex=ttl)
+    pipeline.execute()
+    return {REFERENCE_FIELD: True, "status": result.get("status")}
+
+
+def load(conn, job_id: str) -> Optional[Dict[str, Any]]:
+    """A stored result with its split-out strings, or None once it expired"""
+    return load_many(conn, [job_id])[0]
+
+
+def load_many(conn, job_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    `load` for many jobs in at most two round trips: the records, then the
+    split-out strings of those that have any
+    """
+    if not job_ids:
+        return []
+    records = [decode(data) if data is not None else None
+               for data in conn.mget([KEY.format(job_id) for job_id in job_ids])]
+    part_keys = []
+    for job_id, record in zip(job_ids, records):
+        if record is not None:
+            part_keys += [PART_KEY.format(job_id, i) for i in range(record[1])]
+    # Parts expire with the record; one that is missing reads as None
+    parts = iter(conn.mget(part_keys) if part_keys else [])
+    results = []
+    for record in records:
+        if record is None:
+            results.append(None)
+            continue
+        stored = [next(parts) for _ in range(record[1])]
+        results.append(_join(record[0], [decode(part) if part is not None else None for part in stored]))
+    return results
+
+
+def is_reference(value: Any) -> bool:
+    return isinstance(value, dict) and value.get(REFERENCE_FIELD) is True
+
+
+def resolve(conn, job_id: str, value: Any) -> Any:
+    """The result behind a job's return value (jobs from before the store return it directly)"""
+    if is_reference(value):
+        return load(conn, job_id)
+    return value
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from api import result_cache
+
+logger = logging.getLogger(__name__)
+
+# Identical queued submissions (code, language, stdin and queue) that
+# arrive while a matching job is queued or running get that job's id
+# instead of a job of their own. The in-flight job and the requests waiting
+# on it live in Redis, so every API process coalesces onto the same job.
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") != "0"
+
+# Upper bound on how long a job counts as in flight, in case its worker
+# died before releasing it
+COALESCE_TTL = int(os.getenv("COALESCE_TTL", "300"))
+
+KEY_PREFIX = "inflight:"
+
+# Returns the in-flight job for KEYS[1], appending the caller's meta
+# (ARGV[3]) to its waiters in KEYS[2], or claims the key for job ARGV[1]
+# and returns nothing
+JOIN_SCRIPT = """
+local job = redis.call('HGET', KEYS[1], 'job_id')
+if job then
+    redis.call('RPUSH', KEYS[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], math.max(redis.call('TTL', KEYS[1]), 1))
+    return job
+end
+redis.call('HSET', KEYS[1], 'job_id', ARGV[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+redis.call('DEL', KEYS[2])
+return false
+"""
+
+# Frees KEYS[1] if job ARGV[1] still holds it; returns its waiters' metas
+# from KEYS[2]
+RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'job_id') ~= ARGV[1] then
+    return false
+end
+local waiters = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return waiters
+"""
+
+
+def flight_key(code: str, language: str, stdin: Optional[str], queue: str) -> Optional[str]:
+    """Coalescing key of a submission, or None if it must run on its own"""
+    if not COALESCE_ENABLED or not result_cache.is_deterministic(code, language):
+        return None
+    return f"{KEY_PREFIX}{queue}:{result_cache.result_key(code, language, stdin)}"
+
+
+def waiters_key(key: str) -> str:
+    return f"{key}:waiters"
+
+
+def join(conn, key: str, job_id: str, meta: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Id of the job already in flight for `key`, attaching the caller with its
+    `meta`, or None after claiming it for `job_id`
+    """
+    existing = conn.register_script(JOIN_SCRIPT)(
+        keys=[key, waiters_key(key)], args=[job_id, COALESCE_TTL, json.dumps(meta or {})]
+    )
+    if existing is None:
+        return None
+    return existing.decode() if isinstance(existing, bytes) else existing
+
+
+def join_many(conn, claims: List[Tuple[str, str, Optional[Dict[str, Any]]]]) -> List[Optional[str]]:
+    """`join` for many (key, job id, meta) claims in one round trip, applied in order"""
+    if not claims:
+        return []
+    script = conn.register_script(JOIN_SCRIPT)
+    pipeline = conn.pipeline(transaction=False)
+    for key, job_id, meta in claims:
+        script(keys=[key, waiters_key(key)], args=[job_id, COALESCE_TTL, json.dumps(meta or {})], client=pipeline)
+    return [
+        existing.decode() if isinstance(existing, bytes) else existing
+        for existing in pipeline.execute()
+    ]
+
+
+def release_many(conn, claims: List[Tuple[str, str]]) -> None:
+    """Free the keys of jobs that were never queued"""
+    try:
+        script = conn.register_script(RELEASE_SCRIPT)
+        pipeline = conn.pipeline(transaction=False)
+        for key, job_id in claims:
+            script(keys=[key, waiters_key(key)], args=[job_id], client=pipeline)
+        pipeline.execute()
+    except Exception:
+        logger.warning(f"Could not release {len(claims)} in-flight jobs", exc_info=True)
+
+
+def release(conn, key: str, job_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Stop coalescing onto `job_id` once it finished (or was never queued);
+    returns the metas of the requests that were attached to it
+    """
+    try:
+        waiters = conn.register_script(RELEASE_SCRIPT)(keys=[key, waiters_key(key)], args=[job_id])
+    except Exception:
+        logger.warning(f"Could not release in-flight job {job_id}", exc_info=True)
+        return None
+    if waiters is None:
+        return None
+    return [json.loads(meta) for meta in waiters]
@@ -0,0 +1,310 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Finished spans are exported as OTLP/JSON: appended to TRACE_FILE one
+# export request per line (readable by the collector's otlpjsonfile
+# receiver) and/or posted to an OTLP/HTTP collector at TRACE_OTLP_ENDPOINT,
+# e.g. http://otel-collector:4318. Without either, spans are only used for
+# the "timings" breakdown of results.
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "leetcode-compiler")
+
+# Spans sent per export request
+EXPORT_BATCH_SIZE = 512
+
+# Attributes a span passes down to the spans started inside it
+INHERITED_ATTRIBUTES = ("execution_id", "language", "container")
+
+# Line a traced shell script writes to stderr when it reaches a step:
+# "__TRACE_MARK__ <step> <epoch seconds>". Stripped from the user's stderr.
+MARKER = "__TRACE_MARK__"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+class Span:
+    """One timed operation of a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, start: Optional[float] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time() if start is None else start
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)),
+            "endTimeUnixNano": str(int(self.end * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _RemoteParent:
+    """Span context received from another process; never exported"""
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.attributes: Dict[str, Any] = {}
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Exporter:
+    """
+    Ships finished spans from a background thread so tracing never blocks
+    the request or job that produced them. The thread is (re)started lazily
+    per process, which covers forked gunicorn workers.
+    """
+
+    def __init__(self):
+        self.enabled = bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+        self._queue: "queue.Queue[Span]" = queue.Queue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._pid = None
+
+    def export(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        with self._idle:
+            self._pending += 1
+        self._queue.put(span)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until spans handed over so far are exported"""
+        if not self.enabled or self._pid != os.getpid():
+            return
+        with self._idle:
+            self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _start(self) -> None:
+        # State inherited from a parent process belongs to its thread
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            spans = [self._queue.get()]
+            while len(spans) < EXPORT_BATCH_SIZE:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(spans)
+            except Exception as e:
+                logger.warning(f"Could not export {len(spans)} spans: {e}")
+            with self._idle:
+                self._pending -= len(spans)
+                self._idle.notify_all()
+
+    def _send(self, spans: List[Span]) -> None:
+        body = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "api.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]})
+        if TRACE_FILE:
+            # One write per batch keeps lines whole across processes
+            with open(TRACE_FILE, "a") as f:
+                f.write(body + "\n")
+        if TRACE_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT.rstrip("/") + "/v1/traces",
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+exporter = Exporter()
+
+
+def _child(name: str, attributes: Dict[str, Any], start: Optional[float] = None) -> Span:
+    parent = _current_span.get()
+    if parent is None:
+        return Span(name, secrets.token_hex(16), attributes=attributes, start=start)
+    inherited = {k: parent.attributes[k] for k in INHERITED_ATTRIBUTES if k in parent.attributes}
+    return Span(name, parent.trace_id, parent.span_id, {**inherited, **attributes}, start)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time the enclosed block as a child of the current span"""
+    current = _child(name, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end = time.time()
+        exporter.export(current)
+
+
+@contextmanager
+def phase(name: str, **attributes) -> Iterator[Span]:
+    """A span whose duration is also added to the current timings breakdown"""
+    with span(name, **attributes) as current:
+        try:
+            yield current
+        finally:
+            _add_timing(name, current.duration)
+
+
+def record_phase(name: str, start: float, end: float, **attributes) -> None:
+    """Add a phase that was measured elsewhere, from its epoch bounds"""
+    if end < start:
+        return
+    current = _child(name, attributes, start)
+    current.end = end
+    exporter.export(current)
+    _add_timing(name, end - start)
+
+
+def _add_timing(name: str, seconds: float) -> None:
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect the seconds spent per phase inside the block; repeats add up"""
+    timings: Dict[str, float] = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def traceparent() -> Optional[str]:
+    """W3C traceparent header value for the current span"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+@contextmanager
+def continue_trace(header: Optional[str]) -> Iterator[None]:
+    """Make spans inside the block children of a span from another process"""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        yield
+        return
+    token = _current_span.set(_RemoteParent(parts[1], parts[2]))
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def flush(timeout: float = 5.0) -> None:
+    exporter.flush(timeout)
+
+
+def epoch(moment: Optional[datetime]) -> Optional[float]:
+    """Epoch seconds of an RQ timestamp (naive datetimes are UTC)"""
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def mark_step(step: str) -> str:
+    """Shell snippet reporting that a script reached `step`"""
+    return f'echo "{MARKER} {step} $(date +%s.%N)" >&2'
+
+
+def split_marks(stderr: str) -> Tuple[str, Dict[str, float]]:
+    """Strip step marks from stderr; returns it with the epoch time of each step"""
+    if MARKER not in stderr:
+        return stderr, {}
+    kept = []
+    marks = {}
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            parts = line.split()
+            try:
+                marks[parts[1]] = float(parts[2])
+            except (IndexError, ValueError):
+                pass
+        else:
+            kept.append(line)
+    return "\n".join(kept), marks
+
+
+def record_script_phases(launched: float, finished: float, marks: Dict[str, float],
+                         compiles: bool) -> None:
+    """
+    Phases of a traced `sh -c` script from its step marks: "transfer" until
+    the source was written in the container, "compile" until it was built
+    and "run" until the process exited. Container and worker share the host
+    clock.
+    """
+    ready = marks.get("ready")
+    if ready is None:
+        return
+    record_phase("transfer", launched, ready)
+    if not compiles:
+        record_phase("run", ready, finished)
+    elif "compiled" in marks:
+        record_phase("compile", ready, marks["compiled"])
+        record_phase("run", marks["compiled"], finished)
+    else:
+        # The build failed
+        record_phase("compile", ready, finished)
@@ -1,15 +1,219 @@
 import os
 import sys
+import threading
+import time
 import redis
+from prometheus_client import start_http_server
 from rq import Worker, Queue, Connection
+from rq.timeouts import TimerDeathPenalty
+from rq.utils import utcnow
+from rq.worker import StopRequested, WorkerStatus
 
 # Add src to path
 sys.path.append('/app/src')
 
+from api import metrics, tracing
+from api.admission import record_job_time
+from api.container_pool import container_pool
+from api.execution import CONTAINER_BACKENDS, EXECUTION_BACKEND, HOST_BACKENDS
+from api.history import history_writer, record_waiters
+from api.job_events import publish_completion
+from api.single_flight import release as release_flight
+from api.queues import parse_queue_weights, queue_languages, weighted_order
+from api.workspace_reaper import workspace_reaper
+
 # Redis connection settings
 redis_host = os.getenv('REDIS_HOST', 'redis')
 redis_url = f'redis://{redis_host}:6379/0'
 
+# Jobs one worker process runs at once, on threads, capped by the container
+# pool capacity. Jobs run in the worker process itself rather than a forked
+# work horse, so the warm container leases and compile cache state survive
+# from one job to the next.
+WORKER_SLOTS = int(os.getenv('WORKER_SLOTS', '4'))
+
+class NotifyingWorker(Worker):
+    """
+    Publishes each job's completion once its result is stored, and reports
+    its run time for admission control's wait estimates and its queue wait
+    to metrics. Jobs are traced as part of the API request that queued them.
+    """
+
+    def perform_job(self, job, queue):
+        with tracing.continue_trace(job.meta.get("traceparent")):
+            try:
+                with tracing.span("job", job_id=job.id, queue=job.origin):
+                    return super().perform_job(job, queue)
+            finally:
+                enqueued_at, started_at = tracing.epoch(job.enqueued_at), tracing.epoch(job.started_at)
+                if enqueued_at and started_at:
+                    tracing.record_phase("queue_wait", enqueued_at, started_at, job_id=job.id)
+
+    def handle_job_success(self, job, *args, **kwargs):
+        # Serializing and storing the result
+        with tracing.span("result_write", job_id=job.id):
+            super().handle_job_success(job, *args, **kwargs)
+        self._job_finished(job)
+
+    def handle_job_failure(self, job, *args, **kwargs):
+        with tracing.span("result_write", job_id=job.id):
+            super().handle_job_failure(job, *args, **kwargs)
+        self._job_finished(job)
+
+    def _job_finished(self, job):
+        # New identical submissions start a job of their own from here on;
+        # those already attached read this job's result and get a history
+        # row of their own
+        if job.meta.get("flight"):
+            waiters = release_flight(self.connection, job.meta["flight"], job.id)
+            if waiters:
+                record_waiters(self.connection, job, waiters)
+        publish_completion(self.connection, job.id)
+        if job.enqueued_at and job.started_at:
+            metrics.observe_queue_wait(job.origin, (job.started_at - job.enqueued_at).total_seconds())
+        if job.started_at and job.ended_at:
+            record_job_time(self.connection, job.origin, (job.ended_at - job.started_at).total_seconds())
+
+class WeightedWorker(NotifyingWorker):
+    """
+    Checks its queues in a weighted random order on every dequeue, so
+    heavier queues are served first under contention without starving the
+    lighter ones
+    """
+
+    def __init__(self, queues, *args, weights=None, **kwargs):
+        super().__init__(queues, *args, **kwargs)
+        self.weighted_queues = list(self.queues)
+        self.weights = weights or [1.0] * len(self.weighted_queues)
+
+    def dequeue_job_and_maintain_ttl(self, *args, **kwargs):
+        ordered = [self.weighted_queues[i] for i in weighted_order(self.weights)]
+        self.queues = ordered
+        if hasattr(self, "_ordered_queues"):
+            self._ordered_queues = ordered
+        return super().dequeue_job_and_maintain_ttl(*args, **kwargs)
+
+class ConcurrentWorker(WeightedWorker):
+    """
+    Runs up to `slots` jobs at once on threads of this process.
+
+    Jobs spend nearly all their time waiting on a container, so one process
+    can keep many replicas busy. A job is only dequeued once a slot is free,
+    every running job is heartbeated from a monitor thread, and a warm
+    shutdown stops dequeuing and waits for the running jobs to finish.
+    """
+
+    # SIGALRM only reaches the main thread
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, queues, *args, slots=1, **kwargs):
+        super().__init__(queues, *args, **kwargs)
+        self.slots = slots
+        self._free_slots = threading.BoundedSemaphore(slots)
+        self._running = {}
+        self._running_lock = threading.Lock()
+        self._dispatching = False
+        self._monitor = None
+
+    def register_birth(self):
+        super().register_birth()
+        # Read by admission control to size the queues' drain rate
+        self.connection.hset(self.key, 'slots', self.slots)
+
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        while not self._free_slots.acquire(timeout=self.job_monitoring_interval):
+            self.heartbeat()
+        result = super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+        if result is None:
+            self._free_slots.release()
+        else:
+            # A stop signal from here until the job is handed to its thread
+            # is deferred so the job is not dropped
+            self._dispatching = True
+        return result
+
+    def execute_job(self, job, queue):
+        try:
+            thread = threading.Thread(
+                target=self._run_slot, args=(job, queue), name=f'job-{job.id}', daemon=True
+            )
+            with self._running_lock:
+                self._running[job.id] = (job, thread)
+                self.set_state(WorkerStatus.BUSY)
+            thread.start()
+            self._start_monitor()
+        finally:
+            self._dispatching = False
+
+    def _run_slot(self, job, queue):
+        try:
+            self.perform_job(job, queue)
+        except Exception:
+            self.log.error('Job %s: unhandled error in worker slot', job.id, exc_info=True)
+        finally:
+            with self._running_lock:
+                self._running.pop(job.id, None)
+                if not self._running:
+                    self.set_state(WorkerStatus.IDLE)
+            self._free_slots.release()
+
+    def get_heartbeat_ttl(self, job):
+        return self.job_monitoring_interval + 60
+
+    def _start_monitor(self):
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._maintain_heartbeats, name='job-heartbeats', daemon=True)
+            self._monitor.start()
+
+    def _maintain_heartbeats(self):
+        while True:
+            time.sleep(self.job_monitoring_interval)
+            with self._running_lock:
+                jobs = [job for job, _ in self._running.values()]
+            if not jobs:
+                continue
+            try:
+                with self.connection.pipeline() as pipeline:
+                    self.heartbeat(self.job_monitoring_interval + 60, pipeline=pipeline)
+                    for job in jobs:
+                        job.heartbeat(utcnow(), self.get_heartbeat_ttl(job), pipeline=pipeline, xx=True)
+                    results = pipeline.execute()
+                # As in Worker.maintain_heartbeats: a job deleted meanwhile
+                # (result_ttl=0) was recreated by the HSET; remove it again
+                for i, job in enumerate(jobs):
+                    if results[2 + 2 * i] == 1:
+                        self.connection.delete(job.key)
+            except Exception:
+                self.log.warning('Failed to heartbeat running jobs', exc_info=True)
+
+    def _shutdown(self):
+        self._stop_requested = True
+        self.set_shutdown_requested_date()
+        if self.scheduler:
+            self.stop_scheduler()
+        if not self._dispatching:
+            # Interrupts the wait for a slot or a job; running jobs are
+            # awaited in teardown
+            raise StopRequested()
+
+    def teardown(self):
+        try:
+            while True:
+                with self._running_lock:
+                    threads = [thread for _, thread in self._running.values()]
+                if not threads:
+                    break
+                self.log.info('Worker %s: waiting for %d running jobs', self.key, len(threads))
+                for thread in threads:
+                    thread.join()
+        except SystemExit:
+            # Cold shutdown: jobs left in the started registry are failed
+            # by RQ once their heartbeats expire
+            self.log.warning('Worker %s: abandoning %d running jobs', self.key, len(self._running))
+            super().teardown()
+            raise
+        super().teardown()
+
 def main():
     try:
         conn = redis.from_url(redis_url)
@@ -20,11 +224,33 @@ def main():
         print(f"Failed to connect to Redis: {e}")
         return
 
+    # Warm every language replica and keep probing their health, and clear
+    # finished executions' workspaces out of them in the background
+    if EXECUTION_BACKEND in CONTAINER_BACKENDS:
+        container_pool.start_health_monitor()
+        workspace_reaper.start()
+
+    # Finished jobs' history rows are written to PostgreSQL in batches
+    history_writer.start(conn)
+
+    metrics.reset_multiproc_dir()
+    start_http_server(metrics.WORKER_METRICS_PORT, registry=metrics.build_registry())
+    print(f"Serving metrics on port {metrics.WORKER_METRICS_PORT}")
+
     with Connection(conn):
         print("Worker is starting...")
-        q = Queue()  # Default queue
-        worker = Worker([q])
+        weights = parse_queue_weights()
+        print(f"Serving queues: {', '.join(f'{name}={weight:g}' for name, weight in weights)}")
+        queues = [Queue(name) for name, _ in weights]
+        slots = WORKER_SLOTS
+        if EXECUTION_BACKEND not in HOST_BACKENDS:
+            slots = min(slots, container_pool.capacity(queue_languages([name for name, _ in weights])))
+        slots = max(slots, 1)
+        print(f"Running up to {slots} jobs concurrently")
+        worker = ConcurrentWorker(queues, weights=[weight for _, weight in weights], slots=slots)
         worker.work()
+        # Ship the spans of the last jobs before the process exits
+        tracing.flush()
 
 if __name__ == '__main__':
     main()
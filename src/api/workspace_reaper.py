@@ -0,0 +1,180 @@
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from api import metrics
+from api.container_pool import LANGUAGE_SERVICES, LEASE_TTL, container_pool, replica_names
+from api.execution import ENGINE_WORK_ROOT, WORK_ROOT
+from api.redis_conn import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Execution workspaces are not removed on the execution's own path: a
+# background reaper in the worker scans every replica's scratch area and
+# deletes the workspaces of finished executions in batches, one `docker
+# exec` per replica and pass.
+REAP_INTERVAL = int(os.getenv("WORKSPACE_REAP_INTERVAL", "15"))
+
+# Age budget: a workspace older than this is removed even if its execution
+# still appears to hold a lease (a worker that died mid-run)
+MAX_AGE = int(os.getenv("WORKSPACE_MAX_AGE", str(5 * LEASE_TTL)))
+
+# Size budget per replica: when the scratch area is larger after finished
+# workspaces are gone, the oldest remaining ones are removed until it fits,
+# so one runaway program cannot fill the tmpfs for every other run
+MAX_BYTES = int(os.getenv("WORKSPACE_MAX_BYTES", str(192 * 1024 * 1024)))
+
+# Paths per `rm -rf`, to keep the command line bounded
+REMOVE_BATCH_SIZE = 200
+
+# Held by the worker reaping a replica, so workers sharing replicas do not
+# scan and delete the same workspaces
+REAP_LOCK_KEY = "pool:reaping:{}"
+
+# Prefix of a workspace directory name before the execution id
+WORKSPACE_PREFIX = "exec_"
+
+
+def scratch_patterns() -> List[str]:
+    """Globs matching one workspace each: cli and engine runs, agent leftovers"""
+    return [
+        f"{WORK_ROOT}/{WORKSPACE_PREFIX}*",
+        f"{WORK_ROOT}/agent/*",
+        f"{ENGINE_WORK_ROOT}/{WORKSPACE_PREFIX}*",
+    ]
+
+
+def scan_script() -> str:
+    """Shell loop printing "<mtime> <KiB> <path>" per workspace"""
+    patterns = " ".join(scratch_patterns())
+    return (
+        f'for d in {patterns}; do [ -d "$d" ] && '
+        f'echo "$(stat -c %Y "$d") $(du -sk "$d" | cut -f1) $d"; done; true'
+    )
+
+
+def execution_id(path: str) -> str:
+    name = os.path.basename(path)
+    return name[len(WORKSPACE_PREFIX):] if name.startswith(WORKSPACE_PREFIX) else name
+
+
+def lease_ids(path: str) -> Tuple[str, ...]:
+    """
+    Ids whose lease keeps a workspace alive: its own, and for a case of a
+    batched run (`<execution id>-<case index>`) the run's. Execution ids
+    contain dashes themselves, so both are checked.
+    """
+    name = execution_id(path)
+    run, _, index = name.rpartition("-")
+    return (name, run) if run and index.isdigit() else (name,)
+
+
+class WorkspaceReaper:
+    """Removes expired execution workspaces from the language replicas"""
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+
+    def scan(self, container: str) -> List[Tuple[float, int, str]]:
+        """(mtime, bytes, path) of every workspace in a replica"""
+        result = subprocess.run(
+            ["docker", "exec", container, "sh", "-c", scan_script()],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=30
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"exit code {result.returncode}")
+        workspaces = []
+        for line in result.stdout.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                workspaces.append((float(parts[0]), int(parts[1]) * 1024, parts[2]))
+        return workspaces
+
+    def select(self, workspaces: List[Tuple[float, int, str]], leased: set,
+               now: float) -> Dict[str, List[str]]:
+        """Paths to remove by reason: finished, expired and over_budget"""
+        selected = {"finished": [], "expired": [], "over_budget": []}
+        kept = []
+        for mtime, size, path in sorted(workspaces):
+            if now - mtime > MAX_AGE:
+                selected["expired"].append(path)
+            elif not any(i in leased for i in lease_ids(path)):
+                selected["finished"].append(path)
+            else:
+                kept.append((size, path))
+        total = sum(size for size, _ in kept)
+        for size, path in kept:
+            if total <= MAX_BYTES:
+                break
+            selected["over_budget"].append(path)
+            total -= size
+        return selected
+
+    def remove(self, container: str, paths: List[str]) -> None:
+        for i in range(0, len(paths), REMOVE_BATCH_SIZE):
+            subprocess.run(
+                ["docker", "exec", container, "rm", "-rf", *paths[i:i + REMOVE_BATCH_SIZE]],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=60
+            )
+
+    def reap(self, container: str) -> Dict[str, int]:
+        """One pass over a replica; returns the number of workspaces removed by reason"""
+        now = time.time()
+        workspaces = self.scan(container)
+        selected = self.select(workspaces, container_pool.leased(container), now)
+        removed = [path for paths in selected.values() for path in paths]
+        if removed:
+            self.remove(container, removed)
+        for reason, paths in selected.items():
+            if paths:
+                metrics.workspaces_reaped.labels(reason).inc(len(paths))
+        if selected["over_budget"]:
+            logger.warning(
+                f"Scratch area of {container} over {MAX_BYTES} bytes; "
+                f"removed {len(selected['over_budget'])} running workspaces"
+            )
+        removed_set = set(removed)
+        remaining = [(size, path) for _, size, path in workspaces if path not in removed_set]
+        container_pool.record_scratch(container, sum(size for size, _ in remaining), len(remaining))
+        return {reason: len(paths) for reason, paths in selected.items()}
+
+    def reap_all(self) -> None:
+        conn = get_redis()
+        for language in LANGUAGE_SERVICES:
+            for container in replica_names(language):
+                if conn is not None and not conn.set(
+                    REAP_LOCK_KEY.format(container), os.getpid(), nx=True, ex=max(REAP_INTERVAL - 1, 1)
+                ):
+                    continue
+                try:
+                    self.reap(container)
+                except Exception as e:
+                    logger.warning(f"Could not reap workspaces of {container}: {e}")
+
+    def start(self, interval: int = REAP_INTERVAL) -> threading.Thread:
+        """Reap every replica now and every `interval` seconds in the background"""
+        if self._thread is not None:
+            return self._thread
+
+        def run():
+            while True:
+                try:
+                    self.reap_all()
+                except Exception:
+                    logger.error("Workspace reaper pass failed", exc_info=True)
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name="workspace-reaper", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+workspace_reaper = WorkspaceReaper()
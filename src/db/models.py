@@ -1,13 +1,46 @@
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, Column, DateTime, Index, Integer, BigInteger, JSON, String
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import inspect 
+from sqlalchemy import inspect
 import os
+import threading
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Connection pool per process. The API's gevent workers and the worker's
+# history writer each hold few connections, so the defaults stay small;
+# connections are checked before use and recycled before PostgreSQL or a
+# proxy drops them.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
 Base = declarative_base()
 
+def get_engine():
+    """The process's engine, created on first use rather than at import"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if not DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL is not set")
+                options = {"pool_pre_ping": True, "pool_recycle": DB_POOL_RECYCLE}
+                if not DATABASE_URL.startswith("sqlite"):
+                    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                                   pool_timeout=DB_POOL_TIMEOUT)
+                _engine = create_engine(DATABASE_URL, **options)
+    return _engine
+
+def SessionLocal():
+    """Session bound to the lazily created engine"""
+    return _session_factory(bind=get_engine())
+
 class User(Base):
     __tablename__ = "users"
 
@@ -15,13 +48,44 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     password = Column(String)
 
+# Longest user id and problem id the execution history stores
+ID_LENGTH = 255
+
+class Execution(Base):
+    """One finished queued execution, written in batches by the workers"""
+    __tablename__ = "executions"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    job_id = Column(String(64), index=True)
+    # X-User-Id of the request and the problem it was submitted for, if given
+    user_id = Column(String(ID_LENGTH))
+    problem_id = Column(String(ID_LENGTH))
+    language = Column(String(16), nullable=False)
+    # SHA-256 of the source, for spotting resubmissions
+    code_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False)
+    # Number of test cases for batched executions
+    cases = Column(Integer)
+    timings = Column(JSON().with_variant(JSONB, "postgresql"))
+    resources = Column(JSON().with_variant(JSONB, "postgresql"))
+    finished_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_executions_user_finished", "user_id", "finished_at"),
+        Index("ix_executions_problem_finished", "problem_id", "finished_at"),
+        Index("ix_executions_user_problem_finished", "user_id", "problem_id", "finished_at"),
+    )
+
 def init_db():
-    inspector = inspect(engine) 
-    if not inspector.has_table("users"):  
-        Base.metadata.create_all(bind=engine) 
-        print("Database tables created successfully.")
+    engine = get_engine()
+    inspector = inspect(engine)
+    missing = [t for t in Base.metadata.sorted_tables if not inspector.has_table(t.name)]
+    if missing:
+        # Creates only the missing tables
+        Base.metadata.create_all(bind=engine)
+        print(f"Database tables created: {', '.join(t.name for t in missing)}")
     else:
-        print("Users table already exists.")
+        print("Database tables already exist.")
 
 if __name__ == "__main__":
     print("Starting database initialization...")
@@ -0,0 +1,83 @@
+import importlib.util
+import os
+import stat
+import sys
+
+import fakeredis
+import pytest
+
+# The API's modules read their settings at import. Run against the stub
+# backend and an in-memory Redis; nothing here needs Docker, a database
+# server or a Redis server
+os.environ.setdefault("EXECUTION_BACKEND", "stub")
+os.environ.setdefault("STUB_RUN_SECONDS", "0")
+os.environ.setdefault("REDIS_HOST", "127.0.0.1")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from api import redis_conn  # noqa: E402
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    """Fresh in-memory Redis, also served by `get_redis()`"""
+    fake = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_conn, "_connection", fake)
+    return fake
+
+
+@pytest.fixture
+def client(conn, monkeypatch):
+    """Test client of the API, queueing on the fake Redis"""
+    from rq import Queue
+
+    from api import main
+    from api.admission import AdmissionController
+    monkeypatch.setattr(main, "r", conn)
+    monkeypatch.setattr(main, "q", Queue(connection=conn))
+    monkeypatch.setattr(main, "admission", AdmissionController(conn))
+    main.app.testing = True
+    return main.app.test_client()
+
+
+@pytest.fixture(scope="session")
+def agent():
+    """docker/agent/agent.py, the execution agent of the language images"""
+    spec = importlib.util.spec_from_file_location("agent", os.path.join(ROOT, "docker", "agent", "agent.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _script(path, body):
+    path.write_text("#!/bin/sh\n" + body + "\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def local_docker(tmp_path, conn, monkeypatch):
+    """`docker exec [options] <container> cmd...` runs cmd on this host"""
+    from api import compile_cache as compile_cache_module
+    from api import execution
+    from api.compile_cache import CompileCache
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _script(bin_dir / "docker", "\n".join([
+        "shift",
+        'while [ "${1#-}" != "$1" ]; do',
+        '    case "$1" in -i) shift ;; -u) shift 2 ;; -e) export "$2"; shift 2 ;; esac',
+        "done",
+        'shift; exec "$@"',
+    ]))
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(execution, "EXECUTION_BACKEND", "cli")
+    monkeypatch.setattr(compile_cache_module, "CACHE_ROOT", str(tmp_path / "compile_cache"))
+    # There are no cache and run users on this host
+    monkeypatch.setattr(compile_cache_module, "CACHE_USER", "root")
+    monkeypatch.setattr(compile_cache_module, "RUN_USER", "root")
+    monkeypatch.setattr(execution, "compile_cache", CompileCache())
+    monkeypatch.setattr(execution, "WORK_ROOT", str(tmp_path / "workspace"))
+    return bin_dir
@@ -0,0 +1,96 @@
+import pytest
+from rq import Queue
+
+from api import admission
+from api.admission import AdmissionController, Rejected
+
+
+def test_rate_limit_takes_a_token_per_request(conn, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 3)
+    controller = AdmissionController(conn)
+    for _ in range(3):
+        controller.check_rate("user:a", "python")
+
+    with pytest.raises(Rejected) as rejected:
+        controller.check_rate("user:a", "python")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    # Other clients have buckets of their own
+    controller.check_rate("user:b", "python")
+
+
+def test_language_limit_applies_on_top(conn, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "time", lambda: now[0])
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 2)
+    monkeypatch.setattr(admission, "LANGUAGE_RATE_LIMITS", {"java": 1})
+    controller = AdmissionController(conn)
+    controller.check_rates("user:a", {"java": 2})
+
+    # The global bucket refills within seconds, the Java one takes a minute
+    now[0] += 10
+    with pytest.raises(Rejected):
+        controller.check_rates("user:a", {"java": 1})
+    controller.check_rates("user:a", {"python": 1})
+
+
+def test_batches_have_a_bucket_of_their_own(conn, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 3)
+    monkeypatch.setattr(admission, "BATCH_RATE_LIMIT_BURST", 1000)
+    controller = AdmissionController(conn)
+
+    controller.check_batch_rate("user:a", 1000)
+    with pytest.raises(Rejected):
+        controller.check_batch_rate("user:a", 1)
+    # Single requests still have their tokens
+    controller.check_rate("user:a", "python")
+
+
+def test_batches_over_the_burst_are_rejected_outright(conn, monkeypatch):
+    monkeypatch.setattr(admission, "BATCH_RATE_LIMIT_BURST", 3)
+
+    with pytest.raises(Rejected) as rejected:
+        AdmissionController(conn).check_batch_rate("user:a", 4)
+    assert "smaller batches" in str(rejected.value)
+
+
+def test_capacity_counts_incoming_jobs(conn, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUE_DEPTH", 3)
+    queue = Queue("run:python", connection=conn)
+    controller = AdmissionController(conn)
+    for i in range(2):
+        queue.enqueue(print, i)
+
+    controller.check_capacity(queue)
+    controller.check_capacity(queue, incoming=1)
+    with pytest.raises(Rejected) as rejected:
+        controller.check_capacity(queue, incoming=2)
+    assert rejected.value.status == 503
+
+
+def test_job_times_feed_the_wait_estimate(conn, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_ESTIMATED_WAIT", 10)
+    queue = Queue("run:python", connection=conn)
+    for i in range(3):
+        queue.enqueue(print, i)
+    controller = AdmissionController(conn)
+    controller.check_capacity(queue)
+
+    admission.record_job_time(conn, queue.name, 100)
+    with pytest.raises(Rejected):
+        controller.check_capacity(queue)
+
+
+def test_api_answers_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 1)
+    body = {"code": "print(1)", "language": "python"}
+
+    assert client.post("/api/execute", json=body).status_code == 200
+    response = client.post("/api/execute", json=body)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # X-User-Id only names the bucket when a trusted proxy sets it
+    assert client.post("/api/execute", json=body, headers={"X-User-Id": "u2"}).status_code == 429
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"127.0.0.1"})
+    assert client.post("/api/execute", json=body, headers={"X-User-Id": "u2"}).status_code == 200
@@ -0,0 +1,165 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from api import agent_client as agent_client_module
+from api import execution
+from api.agent_client import AgentClient
+
+
+@pytest.fixture
+def client(agent, tmp_path, monkeypatch):
+    """Client of an agent serving on a local port"""
+    monkeypatch.setattr(agent, "WORK_ROOT", str(tmp_path / "work"))
+    monkeypatch.setattr(agent, "CACHE_ROOT", str(tmp_path / "cache"))
+    os.makedirs(agent.WORK_ROOT)
+    os.makedirs(agent.CACHE_ROOT)
+    server = agent.AgentServer(("127.0.0.1", 0), agent.AgentHandler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield AgentClient(port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def execute(client, on_chunk=None, **request):
+    request = dict({"op": "execute", "id": "e1", "stdin": "", "time_limit": 5}, **request)
+    return client.call("127.0.0.1", request, timeout=30, on_chunk=on_chunk)
+
+
+def test_ping(client):
+    assert client.ping("127.0.0.1")
+    assert not AgentClient(port=1).ping("127.0.0.1")
+
+
+def test_runs_python_with_stdin(client, agent):
+    result = execute(client, language="python", source="print(input()[::-1])", stdin="abc")
+
+    assert result["stdout"] == "cba\n"
+    assert result["exit_code"] == 0
+    assert not result["timed_out"]
+    assert set(result["resources"]["run"]) == {"cpu_user", "cpu_sys", "max_memory_kb", "read_bytes", "write_bytes"}
+    assert result["resources"]["run"]["max_memory_kb"] > 0
+    # The workspace is removed after the run
+    assert os.listdir(agent.WORK_ROOT) == []
+
+
+def test_reports_timeouts(client):
+    result = execute(client, language="python", source="while True: pass", time_limit=0.5)
+
+    assert result["timed_out"]
+    assert result["exit_code"] is None
+
+
+def test_output_cap_kills_the_run(client):
+    result = execute(client, language="python", source="while True: print('spam')", max_output=1000)
+
+    assert result["truncated"]
+    assert len(result["stdout"]) == 1000
+
+
+def test_streams_chunks_ahead_of_the_response(client):
+    chunks = []
+    source = "import sys, time\nprint('a', flush=True)\ntime.sleep(0.1)\nprint('b', file=sys.stderr)"
+
+    result = execute(client, on_chunk=lambda stream, data: chunks.append((stream, data)),
+                     language="python", source=source, stream=True)
+
+    assert "".join(data for stream, data in chunks if stream == "stdout") == "a\n"
+    assert "".join(data for stream, data in chunks if stream == "stderr") == "b\n"
+    assert (result["stdout"], result["stderr"], result["truncated"]) == ("a\n", "b\n", False)
+
+
+def test_connection_is_reused(client):
+    for i in range(3):
+        assert execute(client, id=f"e{i}", language="python", source="print(1)")["stdout"] == "1\n"
+    assert len(client._idle["127.0.0.1"]) == 1
+
+
+def test_errors_are_reported(client):
+    with pytest.raises(agent_client_module.AgentError):
+        execute(client, language="cobol", source="")
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_compile_cache(client, agent):
+    request = {"language": "cpp", "source": "#include <cstdio>\nint main() { puts(\"hi\"); }",
+               "compile_cache": True, "compile_flags": ""}
+    first = execute(client, id="e1", **request)
+    second = execute(client, id="e2", **request)
+
+    assert first["stdout"] == second["stdout"] == "hi\n"
+    assert first["compile_cache"] == "stored" and first["stored_bytes"] > 0
+    assert second["compile_cache"] == "hit"
+    assert os.listdir(agent.CACHE_ROOT) == [first["artifact_key"]]
+
+    execute(client, id="e3", language="python", source="", evict=[first["artifact_key"]])
+    assert os.listdir(agent.CACHE_ROOT) == []
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_failed_compile(client):
+    result = execute(client, language="cpp", source="int main() {", compile_cache=True, compile_flags="")
+
+    assert result["compile_cache"] == "failed"
+    assert result["exit_code"] == 1
+    assert "error" in result["stderr"]
+
+
+def test_compile_time_limit_kills_the_compiler(client, agent, tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    compiler = bin_dir / "g++"
+    # A compiler whose child outlives it unless the whole group is killed
+    compiler.write_text(f"#!/bin/sh\nsleep 30 &\necho $! > {tmp_path}/child\nwait\n")
+    compiler.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(agent, "COMPILE_TIME_LIMIT", 0.5)
+
+    result = execute(client, language="cpp", source="int main() {}", compile_cache=False, compile_flags="")
+
+    assert result["stderr"] == "Compilation timed out"
+    assert result["exit_code"] == 1 and not result["timed_out"]
+    child = (tmp_path / "child").read_text().strip()
+    # Killed; at most a zombie waiting for a parent that reaps
+    try:
+        with open(f"/proc/{child}/stat") as f:
+            assert f.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except FileNotFoundError:
+        pass
+
+
+def test_cases_run_against_every_input(client):
+    result = execute(client, language="python", source="n = int(input())\nwhile n < 0: pass\nprint(n * 2)",
+                     cases=["1", "2", "-1", "x"], time_limit=0.5)
+
+    assert [c["stdout"] for c in result["cases"]] == ["2\n", "4\n", "", ""]
+    assert [c["exit_code"] for c in result["cases"]] == [0, 0, None, 1]
+    assert [c["timed_out"] for c in result["cases"]] == [False, False, True, False]
+    assert all(c["time"] >= 0 for c in result["cases"])
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_cases_stop_at_compile_errors(client):
+    result = execute(client, language="cpp", source="int main() {", cases=["1", "2"])
+
+    assert result["compile_failed"]
+    assert "cases" not in result
+
+
+def test_agent_backend(client, monkeypatch):
+    monkeypatch.setattr(execution, "agent_client", client)
+
+    result = execution._run_with_agent("print(input())", "python", "42", "e1", "127.0.0.1")
+    assert result["status"] == "success"
+    assert result["output"] == "42"
+    assert execution._run_with_agent("raise SystemExit(3)", "python", None, "e2", "127.0.0.1")["status"] == "failure"
+
+
+def test_agent_cases_backend(client, monkeypatch):
+    monkeypatch.setattr(execution, "agent_client", client)
+
+    result = execution._run_cases_with_agent("print(int(input()) + 1)", "python", ["1", "x"], "e1", "127.0.0.1", 5)
+    assert [c["status"] for c in result["cases"]] == ["success", "failure"]
+    assert result["cases"][0]["output"] == "2"
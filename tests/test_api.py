@@ -0,0 +1,32 @@
+import pytest
+
+from api import main
+
+
+@pytest.mark.parametrize("body, error", [
+    ({"language": "python", "cases": ["1"]}, "Code and language are required"),
+    ({"code": "print(1)", "language": "python", "cases": []}, "cases must be a non-empty list of strings"),
+    ({"code": "print(1)", "language": "python", "cases": [1]}, "cases must be a non-empty list of strings"),
+    ({"code": "print(1)", "language": "python", "cases": ["1"], "time_limit": 0}, "time_limit must be between"),
+])
+def test_cases_requests_are_validated(client, body, error):
+    response = client.post("/api/execute/cases", json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith(error)
+
+
+def test_too_many_cases(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_CASES", 2)
+
+    response = client.post("/api/execute/cases", json={"code": "print(1)", "language": "python", "cases": ["1"] * 3})
+    assert response.status_code == 400
+
+
+def test_execute_without_redis_runs_with_stdin(client, monkeypatch):
+    monkeypatch.setattr(main, "r", None)
+    monkeypatch.setattr(main, "q", None)
+
+    response = client.post("/api/execute", json={"code": "print(input())", "language": "python", "stdin": "42"})
+    assert response.status_code == 200
+    assert response.get_json()["output"] == "42"
@@ -0,0 +1,84 @@
+from rq import Queue
+
+from api import admission, worker
+from api.queues import parse_queue_weights
+
+
+def run_jobs(conn):
+    queues = [Queue(name, connection=conn) for name, _ in parse_queue_weights()]
+    worker.ConcurrentWorker(queues, connection=conn, slots=2).work(burst=True)
+
+
+def test_batch_answers_every_submission_in_order(client, conn):
+    submissions = [{"code": f"print({i})", "language": "python", "stdin": str(i)} for i in range(3)]
+    submissions += [
+        {"code": "print(0)", "language": "python", "stdin": "0"},
+        {"language": "python"},
+        {"code": "print(1)", "language": "python", "priority": "urgent"},
+    ]
+    response = client.post("/api/execute/batch", json={"submissions": submissions})
+
+    assert response.status_code == 200
+    jobs = response.get_json()["jobs"]
+    assert len(jobs) == 6
+    assert len({job["job_id"] for job in jobs[:3]}) == 3
+    assert jobs[3] == {"status": "success", "job_id": jobs[0]["job_id"], "coalesced": True}
+    assert jobs[4]["status"] == "failure"
+    assert jobs[5]["status"] == "failure"
+    assert Queue("run:python", connection=conn).count == 3
+
+    ids = [job["job_id"] for job in jobs[:3]]
+    pending = client.get("/api/jobs?ids=" + ",".join(ids + ["missing"])).get_json()["jobs"]
+    assert all(pending[job_id] == {"status": "pending"} for job_id in ids)
+    assert pending["missing"] == {"error": "Job not found"}
+
+    run_jobs(conn)
+    done = client.post("/api/jobs", json={"ids": ids}).get_json()["jobs"]
+    for i, job_id in enumerate(ids):
+        assert done[job_id]["status"] == "completed"
+        assert done[job_id]["result"]["output"] == str(i)
+    # Finished jobs no longer take identical submissions
+    assert conn.keys("inflight:*") == []
+
+
+def test_batch_costs_a_token_per_submission(client, monkeypatch):
+    monkeypatch.setattr(admission, "BATCH_RATE_LIMIT_BURST", 10)
+    batch = {"submissions": [{"code": "print(input())", "language": "python", "stdin": str(i)} for i in range(6)]}
+
+    assert client.post("/api/execute/batch", json=batch).status_code == 200
+    response = client.post("/api/execute/batch", json=batch)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+    too_large = {"submissions": batch["submissions"] * 2}
+    assert client.post("/api/execute/batch", json=too_large).status_code == 429
+
+
+def test_batches_larger_than_the_request_burst_are_admitted(client, monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 2)
+    batch = {"submissions": [{"code": "print(input())", "language": "python", "stdin": str(i)} for i in range(30)]}
+
+    assert client.post("/api/execute/batch", json=batch).status_code == 200
+    assert client.post("/api/execute", json={"code": "print(1)", "language": "python"}).status_code == 200
+
+
+def test_batch_rejected_whole_when_queue_cannot_take_it(client, conn, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_QUEUE_DEPTH", 4)
+    batch = {"submissions": [{"code": f"print({i})", "language": "python"} for i in range(5)]}
+
+    response = client.post("/api/execute/batch", json=batch)
+
+    assert response.status_code == 503
+    assert Queue("run:python", connection=conn).count == 0
+    assert conn.keys("inflight:*") == []
+
+
+def test_batch_limits(client, monkeypatch):
+    from api import main
+    monkeypatch.setattr(main, "MAX_BATCH_JOBS", 2)
+    submissions = [{"code": "print(1)", "language": "python"}] * 3
+
+    assert client.post("/api/execute/batch", json={"submissions": []}).status_code == 400
+    assert client.post("/api/execute/batch", json={"submissions": submissions}).status_code == 400
+    assert client.get("/api/jobs?ids=a,b,c").status_code == 400
+    assert client.get("/api/jobs").status_code == 400
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "benchmark.py")
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    spec = importlib.util.spec_from_file_location("benchmark", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("values, pct, expected", [
+    (list(range(1, 11)), 50, 5),
+    (list(range(1, 7)), 50, 3),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 99, 99),
+    (list(range(1, 101)), 100, 100),
+    ([7], 50, 7),
+    ([1, 2], 0, 1),
+    ([], 50, None),
+])
+def test_percentile_is_nearest_rank(benchmark, values, pct, expected):
+    assert benchmark.percentile(values, pct) == expected
+
+
+def test_summarize(benchmark):
+    summary = benchmark.summarize([0.4, 0.1, 0.3, 0.2])
+    assert summary["count"] == 4
+    assert summary["p50"] == 0.2
+    assert summary["max"] == 0.4
+    assert benchmark.summarize([]) == {"count": 0}
+
+
+def test_stub_backend_echoes_stdin(client):
+    response = client.post("/api/execute/direct", json={"code": "print(input())", "language": "python", "stdin": "hi"})
+
+    body = response.get_json()
+    assert (body["status"], body["output"]) == ("success", "hi")
+    assert "run" in body["timings"]
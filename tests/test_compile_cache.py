@@ -0,0 +1,179 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+from api import compile_cache, execution
+from api.compile_cache import CompileCache, LRU_KEY, SIZES_KEY
+
+NONCE = "n0nce"
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_cache, "CACHE_ROOT", str(tmp_path))
+    monkeypatch.setattr(compile_cache, "CACHE_USER", "root")
+    return tmp_path
+
+
+def run_step(script, cwd):
+    env = dict(os.environ, **{compile_cache.NONCE_ENV: NONCE})
+    return subprocess.run(["bash", "-c", script], capture_output=True, text=True, cwd=cwd, env=env)
+
+
+def test_key_covers_code_compiler_and_flags():
+    key = compile_cache.cache_key("int main() {}", "cpp", "13.2.0", "-O2")
+
+    assert key == compile_cache.cache_key("int main() {}", "cpp", "13.2.0", "-O2")
+    assert key != compile_cache.cache_key("int main() {}", "cpp", "14.1.0", "-O2")
+    assert key != compile_cache.cache_key("int main() {}", "cpp", "13.2.0", "-O0")
+    assert key != compile_cache.cache_key("int main() { }", "cpp", "13.2.0", "-O2")
+
+
+def test_split_marker():
+    marker = f"{compile_cache.MARKER} {NONCE}"
+    assert compile_cache.split_marker("warning", NONCE) == ("warning", None)
+    assert compile_cache.split_marker(f"warning\n{marker} stored 12", NONCE) == ("warning", 12 * 1024)
+    assert compile_cache.split_marker(f"error: x\n{marker} failed", NONCE) == ("error: x", 0)
+    # Only the compile step knows the nonce
+    forged = f"{compile_cache.MARKER} guess stored 99"
+    assert compile_cache.split_marker(forged, NONCE) == (forged, None)
+
+
+def test_lru_evicts_oldest_artifacts_past_the_budget():
+    cache = CompileCache(max_bytes=300)
+
+    assert not cache.record("cpp-1", "a", 100)
+    assert not cache.record("cpp-1", "b", 100)
+    assert cache.record("cpp-1", "a", None)
+    assert not cache.record("cpp-1", "c", 150)
+    # "b" was used least recently
+    assert cache.eviction_step("cpp-1") == f"rm -rf {compile_cache.artifact_dir('b')}; "
+    assert cache.eviction_step("cpp-1") == ""
+    assert cache.eviction_step("cpp-2") == ""
+    assert cache.stats() == {"hits": 1, "misses": 3}
+
+
+def test_failed_compiles_are_not_stored():
+    cache = CompileCache(max_bytes=100)
+
+    assert not cache.record("cpp-1", "a", 0)
+    assert not cache.record("cpp-1", "b", 80)
+    assert not cache.record("cpp-1", "c", 80)
+    assert cache.eviction_step("cpp-1") == f"rm -rf {compile_cache.artifact_dir('b')}; "
+
+
+def test_lru_survives_the_process(conn):
+    # Each lookup from a fresh instance, as from another worker process
+    assert CompileCache(max_bytes=250).record("cpp-1", "a", 100) is False
+    assert CompileCache(max_bytes=250).record("cpp-1", "b", 100) is False
+    assert CompileCache(max_bytes=250).record("cpp-1", "a", None) is True
+    cache = CompileCache(max_bytes=250)
+    assert cache.record("cpp-1", "c", 100) is False
+
+    # b was used least recently
+    assert CompileCache().take_evictions("cpp-1") == ["b"]
+    assert CompileCache().take_evictions("cpp-1") == []
+    assert conn.zrange(LRU_KEY.format("cpp-1"), 0, -1) == [b"a", b"c"]
+    assert cache.stats() == {"hits": 1, "misses": 3}
+
+
+def test_failed_compile_stores_nothing(conn):
+    cache = CompileCache(max_bytes=100)
+    assert cache.record("cpp-1", "a", 0) is False
+    assert conn.zcard(LRU_KEY.format("cpp-1")) == 0
+
+
+def test_compiler_version_queried_once_across_processes(conn):
+    calls = []
+
+    def run(container, argv):
+        calls.append(container)
+        return 0, "13.2.0\n"
+
+    assert CompileCache().compiler_version("cpp-1", "cpp", run) == "13.2.0"
+    assert CompileCache().compiler_version("cpp-1", "cpp", run) == "13.2.0"
+    assert calls == ["cpp-1"]
+
+
+def test_local_fallback_without_redis(monkeypatch):
+    monkeypatch.setattr(compile_cache, "get_redis", lambda: None)
+    cache = CompileCache(max_bytes=150)
+    cache.record("cpp-1", "a", 100)
+    cache.record("cpp-1", "b", 100)
+    assert cache.take_evictions("cpp-1") == ["a"]
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_compile_step_stores_the_artifact_once(cache_root, tmp_path):
+    code = "#include <cstdio>\nint main() { puts(\"hi\"); }"
+    encoded = base64.b64encode(code.encode()).decode()
+    key = compile_cache.cache_key(code, "cpp", "test", "")
+
+    def run(execution_id):
+        script = compile_cache.compile_step("cpp", key, encoded, execution_id)
+        script += " && " + compile_cache.run_command("cpp", key)
+        return run_step(script, tmp_path)
+
+    first = run("e1")
+    assert first.stdout == "hi\n"
+    assert compile_cache.split_marker(first.stderr, NONCE)[1] > 0
+    second = run("e2")
+    assert second.stdout == "hi\n"
+    assert compile_cache.split_marker(second.stderr, NONCE) == ("", None)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [key]
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_compile_step_reports_failures(cache_root, tmp_path):
+    encoded = base64.b64encode(b"int main() {").decode()
+    key = compile_cache.cache_key("int main() {", "cpp", "test", "")
+
+    result = run_step(compile_cache.compile_step("cpp", key, encoded, "e1"), tmp_path)
+    assert result.returncode != 0
+    stderr, stored = compile_cache.split_marker(result.stderr, NONCE)
+    assert stored == 0
+    assert "error" in stderr
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def sandbox_dirs():
+    """Directories the unprivileged run user can reach, unlike tmp_path"""
+    root = tempfile.mkdtemp(prefix="compile_cache.")
+    os.chmod(root, 0o755)
+    work_root = os.path.join(root, "workspace")
+    os.mkdir(work_root)
+    os.chmod(work_root, 0o1777)
+    yield root, work_root
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@pytest.mark.skipif(shutil.which("g++") is None or shutil.which("runuser") is None,
+                    reason="needs g++ and runuser")
+def test_programs_cannot_alter_the_cache_or_forge_its_marker(local_docker, conn, sandbox_dirs, monkeypatch):
+    cache_root, work_root = sandbox_dirs
+    monkeypatch.setattr(compile_cache, "CACHE_ROOT", cache_root)
+    monkeypatch.setattr(compile_cache, "RUN_USER", "nobody")
+    monkeypatch.setattr(execution, "WORK_ROOT", work_root)
+    code = (
+        "#include <cstdio>\n#include <string>\n#include <iostream>\n"
+        "int main() { std::string dir; std::cin >> dir;\n"
+        "  fputs(\"__COMPILE_CACHE__ x stored 99999\\n\", stderr);\n"
+        "  bool ok = fopen((dir + \"/.ok\").c_str(), \"a\") || fopen((dir + \"/new\").c_str(), \"w\");\n"
+        "  std::cout << (ok ? \"writable\" : \"read-only\"); }"
+    )
+    key = compile_cache.cache_key(code, "cpp", execution.compile_cache.compiler_version("cpp-1", "cpp"), "")
+
+    first = execution._run_with_cli(code, "cpp", os.path.join(cache_root, key), "e1", "cpp-1", time_limit=5)
+
+    assert first["output"] == "read-only"
+    assert first["compile_cache"]["hit"] is False
+    # The forged line stays in the program's stderr and is not believed
+    assert "__COMPILE_CACHE__ x stored 99999" in first["error"]
+    assert int(conn.hget(SIZES_KEY.format("cpp-1"), key)) < 99999 * 1024
+    second = execution._run_with_cli(code, "cpp", os.path.join(cache_root, key), "e2", "cpp-1", time_limit=5)
+    assert second["compile_cache"]["hit"] is True
@@ -0,0 +1,83 @@
+import pytest
+
+from api import container_pool as pool_module
+from api.container_pool import ContainerPool, NoHealthyContainer
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    monkeypatch.setenv("CONTAINER_POOL_SIZE_PYTHON", "3")
+    return pool_module.replica_names("python")
+
+
+def test_replica_names(replicas):
+    assert replicas == [f"{pool_module.COMPOSE_PROJECT}-python-{i}" for i in (1, 2, 3)]
+
+
+def test_leases_go_to_the_least_loaded_replica(conn, replicas):
+    pool = ContainerPool()
+    leased = [pool.acquire("python", f"e{i}") for i in range(6)]
+
+    assert sorted(leased) == sorted(replicas * 2)
+    pool.release(leased[0], "e0")
+    assert pool.acquire("python", "e6") == leased[0]
+    assert sum(pool.utilization()["python"].values()) == 6
+
+
+def test_quarantined_replicas_are_skipped(conn, replicas):
+    pool = ContainerPool()
+    for name in replicas[:2]:
+        pool.mark_unhealthy(name, "test")
+
+    assert {pool.acquire("python", f"e{i}") for i in range(3)} == {replicas[2]}
+    pool.mark_unhealthy(replicas[2], "test")
+    with pytest.raises(NoHealthyContainer):
+        pool.acquire("python", "e3")
+    pool.mark_healthy(replicas[0])
+    assert pool.acquire("python", "e4") == replicas[0]
+
+
+def test_lease_is_released_on_errors(conn, replicas):
+    pool = ContainerPool()
+    with pytest.raises(RuntimeError):
+        with pool.lease("python", "e1"):
+            raise RuntimeError()
+
+    assert sum(pool.utilization()["python"].values()) == 0
+
+
+def test_local_bookkeeping_without_redis(replicas, monkeypatch):
+    monkeypatch.setattr(pool_module, "get_redis", lambda: None)
+    pool = ContainerPool()
+    first = pool.acquire("python", "e1")
+    second = pool.acquire("python", "e2")
+
+    assert first != second
+    pool.mark_unhealthy(next(name for name in replicas if name not in (first, second)))
+    pool.release(first, "e1")
+    assert pool.acquire("python", "e3") == first
+
+
+def test_probe_all_quarantines_failing_replicas(conn, replicas, monkeypatch):
+    pool = ContainerPool()
+    monkeypatch.setattr(pool, "probe", lambda container, language: container != replicas[1])
+
+    results = pool.probe_all()
+    assert results[replicas[0]] and not results[replicas[1]]
+    assert {pool.acquire("python", f"e{i}") for i in range(4)} == {replicas[0], replicas[2]}
+
+
+def test_capacity_counts_slots_per_replica(replicas, monkeypatch):
+    monkeypatch.setattr(pool_module, "CONTAINER_SLOTS", 2)
+
+    assert ContainerPool().capacity(["python"]) == 6
+
+
+def test_agent_backend_probes_the_agent(monkeypatch):
+    pinged = []
+    monkeypatch.setattr(pool_module, "EXECUTION_BACKEND", "agent")
+    monkeypatch.setattr(pool_module.agent_client, "ping", lambda container: pinged.append(container) or True)
+    monkeypatch.setattr(pool_module.subprocess, "run", lambda *args, **kwargs: pytest.fail("ran docker exec"))
+
+    assert ContainerPool().probe("python-1", "python")
+    assert pinged == ["python-1"]
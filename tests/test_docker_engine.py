@@ -0,0 +1,113 @@
+import io
+import json
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api.docker_engine import FRAME_HEADER, STDERR_STREAM, STDOUT_STREAM, DockerEngineClient, DockerEngineError
+
+
+class FakeEngine(BaseHTTPRequestHandler):
+    """Answers the few Engine API calls the client makes"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b"", close=False):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        if close:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.body()
+        if self.path == "/v1.41/containers/missing/exec":
+            self.reply(404, {"message": "No such container: missing"})
+        elif self.path.endswith("/exec"):
+            self.server.execs.append(json.loads(body))
+            self.reply(201, {"Id": "exec1"})
+        elif self.path.endswith("/start"):
+            frames = b"".join(FRAME_HEADER.pack(stream, len(data)) + data for stream, data in (
+                (STDOUT_STREAM, b"hello "), (STDERR_STREAM, b"warning"), (STDOUT_STREAM, b"world"),
+            ))
+            self.reply(200, frames, close=True)
+        else:
+            self.reply(404)
+
+    def do_GET(self):
+        self.reply(200, {"ExitCode": 3})
+
+    def do_PUT(self):
+        self.server.archives.append((self.path, self.body()))
+        self.reply(200)
+
+
+@pytest.fixture
+def engine():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEngine)
+    server.daemon_threads = True
+    server.execs, server.archives, server.connections = [], [], 0
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client_for(engine):
+    return DockerEngineClient(f"tcp://127.0.0.1:{engine.server_address[1]}")
+
+
+def test_exec_run_demultiplexes_output(engine):
+    exit_code, stdout, stderr = client_for(engine).exec_run("python-1", ["echo"], timeout=5, workdir="/tmp")
+
+    assert (exit_code, stdout, stderr) == (3, "hello world", "warning")
+    assert engine.execs == [{"AttachStdout": True, "AttachStderr": True, "Cmd": ["echo"], "WorkingDir": "/tmp"}]
+
+
+def test_exec_run_as_another_user(engine):
+    client_for(engine).exec_run("cpp-1", ["true"], timeout=5, user="root", env=["A=1"])
+
+    assert engine.execs[0]["User"] == "root"
+    assert engine.execs[0]["Env"] == ["A=1"]
+
+
+def test_idle_connections_are_reused(engine):
+    client = client_for(engine)
+    for _ in range(3):
+        client.exec_run("python-1", ["true"], timeout=5)
+
+    # One keep-alive connection for the create and inspect calls, plus one
+    # per attached start stream, which the daemon closes
+    assert engine.connections == 4
+    assert len(client._idle) == 1
+
+
+def test_put_archive_uploads_one_tar(engine):
+    client_for(engine).put_archive("python-1", "/tmp", {"ws/": None, "ws/script.py": b"print(1)"})
+
+    path, body = engine.archives[0]
+    assert path == "/v1.41/containers/python-1/archive?path=/tmp"
+    with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+        directory, script = tar.getmembers()
+        assert directory.isdir() and directory.mode == 0o777
+        assert tar.extractfile(script).read() == b"print(1)"
+
+
+def test_api_errors_raise(engine):
+    with pytest.raises(DockerEngineError, match="No such container"):
+        client_for(engine).exec_run("missing", ["true"], timeout=5)
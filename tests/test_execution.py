@@ -0,0 +1,123 @@
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api import execution
+
+
+def test_cases_run_against_every_input(local_docker):
+    result = execution.main_cases("print(int(input()) * 2)", "python", ["1", "2", "x"], 5)
+
+    assert [case["status"] for case in result["cases"]] == ["success", "success", "failure"]
+    assert [case["output"] for case in result["cases"]] == ["2", "4", ""]
+    assert "ValueError" in result["cases"][2]["error"]
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_cases_compile_once(local_docker):
+    code = "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x * 2; }"
+    result = execution.main_cases(code, "cpp", ["1", "2", "3"], 5)
+
+    assert [case["output"] for case in result["cases"]] == ["2", "4", "6"]
+    assert result["compile_cache"]["hit"] is False
+    assert execution.compile_cache.stats() == {"hits": 2, "misses": 1}
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_cases_compile_once_with_the_cache_disabled(local_docker, monkeypatch):
+    monkeypatch.setattr(execution, "CACHE_ENABLED", False)
+    code = "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x * 2; }"
+    result = execution.main_cases(code, "cpp", ["1", "2", "3"], 5)
+
+    assert [case["output"] for case in result["cases"]] == ["2", "4", "6"]
+    assert "compile_cache" not in result
+    assert execution.compile_cache.stats() == {"hits": 2, "misses": 1}
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_cases_stop_at_compile_errors(local_docker):
+    result = execution.main_cases("int main() {", "cpp", ["1", "2"], 5)
+
+    assert result["compile_failed"] is True
+    assert result["cases"] == []
+    assert "error" in result["error"]
+
+
+def test_chatty_programs_are_cut_off(local_docker):
+    sink = execution.OutputSink(limit=1000)
+
+    result = execution._run_with_cli("while True: print('spam')", "python", None, "e1", "python", sink=sink)
+
+    assert result["status"] == "failure"
+    assert result["truncated"] is True
+    assert "Output limit of 1000 bytes exceeded" in result["error"]
+
+
+def test_results_carry_a_timings_breakdown(local_docker):
+    result = execution.main("print(input())", "python", "hi")
+
+    assert result["output"] == "hi"
+    assert "__TRACE_MARK__" not in (result["error"] or "")
+    assert {"lease", "transfer", "run"} <= set(result["timings"])
+
+
+def test_executions_get_their_own_workspace(local_docker, tmp_path):
+    code = "import os, time\nopen('Main.txt', 'w').write(input())\ntime.sleep(0.2)\nprint(open('Main.txt').read(), os.getcwd())"
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: execution.main(code, "python", str(i)), range(4)))
+
+    for i, result in enumerate(results):
+        output, cwd = result["output"].split()
+        assert output == str(i)
+        assert cwd == str(tmp_path / "workspace" / f"exec_{result['execution_id']}")
+
+
+def test_cli_run_limit_kills_the_program(local_docker):
+    started = time.monotonic()
+    result = execution._run_with_cli("while True: pass", "python", None, "spin", "python-1", time_limit=1)
+
+    assert result["status"] == "timeout"
+    assert time.monotonic() - started < 1 + execution.EXEC_GRACE_SECONDS
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+@pytest.mark.parametrize("cache_enabled", [True, False])
+def test_cli_compile_time_does_not_count_against_the_run(local_docker, monkeypatch, cache_enabled):
+    monkeypatch.setattr(execution, "CACHE_ENABLED", cache_enabled)
+    compiler = local_docker / "g++"
+    compiler.write_text(f'#!/bin/sh\nsleep 1.5; exec {shutil.which("g++")} "$@"\n')
+    compiler.chmod(0o755)
+    code = "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x * 2; }"
+
+    result = execution._run_with_cli(code, "cpp", "21", "slow-compile", "cpp-1", time_limit=1)
+    assert result["status"] == "success"
+    assert result["output"] == "42"
+
+    monkeypatch.setattr(execution, "COMPILE_TIME_LIMIT", 1)
+    result = execution._run_with_cli(code + " ", "cpp", "21", "compile-timeout", "cpp-1", time_limit=1)
+    assert result["status"] == "failure"
+    assert result["compile_failed"] is True
+    assert result["error"] == "Compilation timed out"
+
+
+@pytest.mark.parametrize("cache_enabled", [True, False])
+def test_engine_limits_the_compiler(conn, monkeypatch, cache_enabled):
+    monkeypatch.setattr(execution, "CACHE_ENABLED", cache_enabled)
+    scripts = []
+
+    def exec_run(container, argv, timeout, **options):
+        if argv[:2] == ["sh", "-c"]:
+            scripts.append(argv[2])
+            return 124, "", ""
+        return 0, "g++ 12", ""
+
+    monkeypatch.setattr(execution.docker_engine, "put_archive", lambda *args: None)
+    monkeypatch.setattr(execution.docker_engine, "exec_run", exec_run)
+
+    result = execution._run_with_engine("int main() {}", "cpp", None, "e1", "cpp-1")
+    assert f"timeout -k 1 {execution.COMPILE_TIME_LIMIT} g++" in scripts[0]
+    assert result["error"] == "Compilation timed out"
+    assert result["compile_failed"] is True
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+from rq import Queue
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+
+from api import admission, history
+from api.worker import ConcurrentWorker
+from db import models
+from db.models import Execution, ID_LENGTH
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/history.db")
+    monkeypatch.setattr(models, "_engine", engine)
+    models.init_db()
+    return engine
+
+
+def row(job_id, **fields):
+    values = {
+        "job_id": job_id, "user_id": "u", "problem_id": "p", "language": "python",
+        "code_hash": "0" * 64, "status": "success", "cases": None, "timings": None,
+        "resources": None, "finished_at": "2026-01-01T00:00:00+00:00",
+    }
+    values.update(fields)
+    return json.dumps(values)
+
+
+def stored(engine):
+    with engine.connect() as db:
+        return [r.job_id for r in db.execute(select(Execution.job_id).order_by(Execution.id))]
+
+
+def test_flush_writes_the_batch(conn, engine):
+    conn.rpush(history.PENDING_KEY, *[row(f"job-{i}") for i in range(5)])
+
+    assert history.HistoryWriter().flush(conn) == 5
+    assert stored(engine) == [f"job-{i}" for i in range(5)]
+    assert conn.llen(history.PENDING_KEY) == 0
+
+
+def test_flush_dead_letters_rejected_rows(conn, engine):
+    rows = [row(f"job-{i}") for i in range(7)]
+    rows[2] = row("job-2", language=None)
+    rows[5] = "not json"
+    conn.rpush(history.PENDING_KEY, *rows)
+
+    assert history.HistoryWriter().flush(conn) == 7
+    assert stored(engine) == ["job-0", "job-1", "job-3", "job-4", "job-6"]
+    assert conn.lrange(history.DEAD_KEY, 0, -1) == [rows[2].encode(), b"not json"]
+    assert conn.llen(history.PENDING_KEY) == 0
+    # Nothing is retried
+    assert history.HistoryWriter().flush(conn) == 0
+
+
+def test_flush_keeps_rows_while_the_database_is_down(conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(models, "_engine", create_engine(f"sqlite:///{tmp_path}/missing/history.db"))
+    rows = [row(f"job-{i}") for i in range(3)]
+    conn.rpush(history.PENDING_KEY, *rows)
+
+    with pytest.raises(OperationalError):
+        history.HistoryWriter().flush(conn)
+    assert conn.lrange(history.PENDING_KEY, 0, -1) == [r.encode() for r in rows]
+    assert conn.llen(history.DEAD_KEY) == 0
+
+
+def test_finished_jobs_queue_a_row(client, conn, engine, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_ENABLED", True)
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"127.0.0.1"})
+    response = client.post("/api/execute", headers={"X-User-Id": "u1"},
+                           json={"code": "print(1)", "language": "python", "problem_id": "two-sum"})
+    job_id = response.get_json()["job_id"]
+
+    ConcurrentWorker([Queue("run:python", connection=conn)], connection=conn, slots=1).work(burst=True)
+
+    queued = json.loads(conn.lindex(history.PENDING_KEY, 0))
+    assert (queued["job_id"], queued["user_id"], queued["problem_id"]) == (job_id, "u1", "two-sum")
+    assert queued["code_hash"] == history.code_hash("print(1)")
+    assert history.HistoryWriter().flush(conn) == 1
+    assert stored(engine) == [job_id]
+
+
+def test_coalesced_requests_get_rows_of_their_own(client, conn, engine, monkeypatch):
+    monkeypatch.setattr(history, "HISTORY_ENABLED", True)
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"127.0.0.1"})
+    submission = {"code": "print(1)", "language": "python"}
+    first = client.post("/api/execute", headers={"X-User-Id": "u1"}, json=dict(submission, problem_id="p1"))
+    client.post("/api/execute", headers={"X-User-Id": "u2"}, json=dict(submission, problem_id="p2"))
+    client.post("/api/execute/batch", headers={"X-User-Id": "u3"}, json={"submissions": [submission, submission]})
+
+    ConcurrentWorker([Queue("run:python", connection=conn)], connection=conn, slots=1).work(burst=True)
+
+    rows = [json.loads(row) for row in conn.lrange(history.PENDING_KEY, 0, -1)]
+    assert {row["job_id"] for row in rows} == {first.get_json()["job_id"]}
+    assert sorted((row["user_id"], row["problem_id"]) for row in rows) == [
+        ("u1", "p1"), ("u2", "p2"), ("u3", None), ("u3", None),
+    ]
+
+
+def test_oversized_ids_are_rejected(client, conn, monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"127.0.0.1"})
+    long_id = "x" * (ID_LENGTH + 1)
+    submission = {"code": "print(1)", "language": "python"}
+
+    response = client.post("/api/execute", json=dict(submission, problem_id=long_id))
+    assert response.status_code == 400
+    assert "problem_id" in response.get_json()["error"]
+    response = client.post("/api/execute", json=submission, headers={"X-User-Id": long_id})
+    assert response.status_code == 400
+    assert client.post("/api/execute", json=dict(submission, problem_id={"a": 1})).status_code == 400
+
+    response = client.post("/api/execute/batch", json={"submissions": [
+        dict(submission, problem_id=long_id), dict(submission, problem_id=12),
+    ]})
+    jobs = response.get_json()["jobs"]
+    assert jobs[0]["status"] == "failure"
+    assert jobs[1]["status"] == "success"
+    assert Queue("run:python", connection=conn).count == 1
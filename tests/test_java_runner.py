@@ -0,0 +1,108 @@
+import sys
+import textwrap
+
+import pytest
+
+# Speaks the JavaRunner protocol without a JVM: "compiles" any source into
+# one class file, and runs by echoing stdin reversed, hangs on "hang" and
+# fills the output cap on "spam".
+# Every reply ends with 3 ms of CPU time, 2 ms of it user time.
+FAKE_RUNNER = textwrap.dedent("""
+    import socket, struct, sys, time
+    INT = struct.Struct(">i")
+    USAGE = struct.pack(">qq", 3000000, 2000000)
+    stream = socket.create_connection(("127.0.0.1", int(sys.argv[1]))).makefile("rwb")
+
+    def read_int():
+        data = stream.read(4)
+        if len(data) < 4:
+            sys.exit(0)
+        return INT.unpack(data)[0]
+
+    def read_bytes():
+        return stream.read(read_int())
+
+    def write(*parts):
+        for part in parts:
+            stream.write(INT.pack(part) if isinstance(part, int) else INT.pack(len(part)) + part)
+        stream.write(USAGE)
+        stream.flush()
+
+    while True:
+        op = read_int()
+        if op == 1:
+            source, flags = read_bytes(), read_bytes()
+            if b"error" in source:
+                write(0, b"Main.java:1: error")
+            else:
+                write(1, 1, b"pkg.Main", b"CAFEBABE")
+        else:
+            class_dir, stdin, limit, max_output = read_bytes(), read_bytes(), read_int(), read_int()
+            if stdin == b"hang":
+                time.sleep(60)
+            elif stdin == b"slow":
+                write(1, -1, b"partial", b"")
+            elif stdin == b"spam":
+                write(2, -1, b"x" * max_output, b"")
+            else:
+                write(0, 0, stdin[::-1], class_dir)
+""")
+
+
+@pytest.fixture
+def runners(agent, tmp_path, monkeypatch):
+    script = tmp_path / "fake_runner.py"
+    script.write_text(FAKE_RUNNER)
+    monkeypatch.setattr(agent, "JAVA_RUNNER_COMMAND", [sys.executable, str(script)])
+    monkeypatch.setattr(agent, "JAVA_RUNNER_ENABLED", True)
+    monkeypatch.setattr(agent, "JAVA_RUNNER_GRACE", 0.5)
+    pool = agent.JavaRunnerPool(2)
+    monkeypatch.setattr(agent, "java_runners", pool)
+    return pool
+
+
+def test_compile_writes_class_files(agent, runners, tmp_path):
+    ok, stderr, resources = agent.compile_into("java", "class Main {}", "", str(tmp_path))
+
+    assert ok and stderr == ""
+    assert resources["cpu_user"] == 0.002
+    assert (tmp_path / "pkg" / "Main.class").read_bytes() == b"CAFEBABE"
+    assert agent.compile_into("java", "error", "", str(tmp_path))[:2] == (False, "Main.java:1: error")
+
+
+def test_runs_reuse_the_warm_jvm(agent, runners):
+    first = agent.run_java_case("/classes", "abc", 1)
+    second = agent.run_java_case("/classes", "xyz", 1)
+
+    assert (first["stdout"], first["stderr"], first["exit_code"]) == ("cba", "/classes", 0)
+    # Memory and I/O belong to the shared JVM, not the run
+    assert first["resources"] == {
+        "cpu_user": 0.002, "cpu_sys": 0.001, "max_memory_kb": None, "read_bytes": None, "write_bytes": None,
+    }
+    assert second["stdout"] == "zyx"
+    assert runners._idle.qsize() == 1
+
+
+def test_timeouts_reported_by_the_runner(agent, runners):
+    case = agent.run_java_case("/classes", "slow", 1)
+
+    assert case["timed_out"] and case["exit_code"] is None
+    assert case["stdout"] == "partial"
+
+
+def test_output_limit_reported_by_the_runner(agent, runners):
+    case = agent.run_java_case("/classes", "spam", 1, 100)
+
+    assert case["truncated"] and not case["timed_out"]
+    assert case["exit_code"] is None
+    assert case["stdout"] == "x" * 100
+
+
+def test_watchdog_replaces_a_wedged_jvm(agent, runners):
+    case = agent.run_java_case("/classes", "hang", 0.5)
+
+    assert case["timed_out"]
+    assert "killed" in case["stderr"]
+    assert runners._idle.qsize() == 0
+    # The next run starts a fresh JVM
+    assert agent.run_java_case("/classes", "ok", 1)["stdout"] == "ko"
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+from rq.job import JobStatus
+from rq.results import Result
+
+from api import main, result_store
+from api.job_events import CompletionListener, publish_completion
+
+
+@pytest.fixture
+def completions(conn, monkeypatch):
+    listener = CompletionListener(conn)
+    monkeypatch.setattr(main, "completions", listener)
+    return listener
+
+
+def finish_later(conn, job, delay=0.2):
+    def finish():
+        time.sleep(delay)
+        reference = result_store.save(conn, job.id, {"status": "success", "output": ""}, ttl=60)
+        Result.create(job, Result.Type.SUCCESSFUL, ttl=60, return_value=reference)
+        job.set_status(JobStatus.FINISHED)
+        publish_completion(conn, job.id)
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    return thread
+
+
+def test_waiters_are_woken_for_their_job_only(conn, completions):
+    with completions.waiter("a") as a, completions.waiter("b") as b:
+        # Subscribing wakes every waiter once so they re-check their jobs
+        publish_completion(conn, "a")
+        assert a.wait(2)
+        a.clear()
+        b.clear()
+
+        publish_completion(conn, "a")
+
+        assert a.wait(2)
+        assert not b.is_set()
+
+    assert completions._waiters == {}
+
+
+def test_long_poll_returns_on_completion(client, conn, completions):
+    job = main.q.enqueue("os.getcwd")
+    thread = finish_later(conn, job)
+
+    started = time.time()
+    response = client.get(f"/api/job/{job.id}?wait=5")
+    thread.join()
+
+    assert response.get_json()["status"] == "completed"
+    assert time.time() - started < 2
+
+
+def test_long_poll_times_out_pending(client, completions):
+    job = main.q.enqueue("os.getcwd")
+
+    response = client.get(f"/api/job/{job.id}?wait=0.2")
+
+    assert response.get_json() == {"status": "pending"}
+    assert client.get(f"/api/job/{job.id}?wait=soon").status_code == 400
+
+
+def test_event_stream(client, conn, completions):
+    job = main.q.enqueue("os.getcwd")
+    thread = finish_later(conn, job)
+
+    body = client.get(f"/api/job/{job.id}/events").get_data(as_text=True)
+    thread.join()
+
+    assert body.startswith('event: status\ndata: {"status": "pending"}\n\n')
+    assert "event: result\n" in body
@@ -0,0 +1,36 @@
+from prometheus_client import REGISTRY, CollectorRegistry
+from rq import Queue
+
+from api import metrics
+
+
+def test_requests_are_counted_by_route(client):
+    labels = {"method": "GET", "route": "/api/job/<job_id>", "status": "404"}
+    before = REGISTRY.get_sample_value("http_requests_total", labels) or 0
+
+    client.get("/api/job/missing")
+    body = client.get("/metrics").get_data(as_text=True)
+
+    assert REGISTRY.get_sample_value("http_requests_total", labels) == before + 1
+    assert "http_request_duration_seconds_bucket" in body
+
+
+def test_executions_are_counted(conn):
+    labels = {"language": "python", "status": "timeout"}
+    before = REGISTRY.get_sample_value("executions_total", labels) or 0
+
+    metrics.observe_execution("python", "timeout", 2.0)
+    metrics.observe_execution("cobol", "timeout", 2.0)
+
+    assert REGISTRY.get_sample_value("executions_total", labels) == before + 1
+    assert REGISTRY.get_sample_value("executions_total", {"language": "cobol", "status": "timeout"}) is None
+
+
+def test_state_is_read_at_scrape_time(conn):
+    registry = CollectorRegistry()
+    registry.register(metrics.StateCollector(conn))
+    Queue("run:python", connection=conn).enqueue(print, 1)
+
+    assert registry.get_sample_value("rq_queue_depth", {"queue": "run:python"}) == 1
+    assert registry.get_sample_value("redis_ping_seconds") >= 0
+    assert registry.get_sample_value("container_pool_capacity", {"language": "python"}) > 0
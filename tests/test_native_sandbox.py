@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from api import compile_cache as compile_cache_module
+from api import execution, native_sandbox
+from api.compile_cache import CompileCache
+
+
+@pytest.fixture
+def native(tmp_path, conn, monkeypatch):
+    """The native backend, working and caching in a directory the sandbox user can reach"""
+    root = Path(tempfile.mkdtemp(prefix="native."))
+    root.chmod(0o755)
+    monkeypatch.setattr(execution, "EXECUTION_BACKEND", "native")
+    monkeypatch.setattr(native_sandbox, "NATIVE_WORK_ROOT", str(root / "work"))
+    monkeypatch.setattr(native_sandbox, "NATIVE_CACHE_DIR", str(root / "cache"))
+    monkeypatch.setattr(compile_cache_module, "CACHE_ROOT", str(tmp_path / "compile_cache"))
+    monkeypatch.setattr(execution, "compile_cache", CompileCache())
+    yield root
+    shutil.rmtree(root)
+
+
+def test_runs_python_on_the_host(native):
+    result = execution.main("import os\nprint(input(), os.getcwd() != '/')", "python", "hi")
+
+    assert (result["status"], result["output"]) == ("success", "hi True")
+    assert result["container_used"] == native_sandbox.HOST_NAME
+    # The private workspace is removed afterwards
+    assert os.listdir(native / "work") == []
+
+
+def test_timeouts_and_memory_limits(native):
+    result = execution._run_with_native("while True: pass", "python", None, "e1", native_sandbox.HOST_NAME, time_limit=1)
+
+    assert result["status"] == "timeout"
+
+    result = execution.main("x = bytearray(2 * 1024 ** 3)", "python")
+
+    assert result["status"] == "failure"
+    assert "MemoryError" in result["error"]
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="runs submissions as another user only as root")
+def test_runs_as_the_sandbox_user(native):
+    result = execution.main("import os\nprint(os.getuid())", "python")
+
+    assert result["output"] == str(native_sandbox.get_sandbox()._ids[0])
+
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs g++")
+def test_compiled_artifacts_are_cached_read_only(native):
+    code = "#include <iostream>\nint main() { int x; std::cin >> x; std::cout << x * 2; }"
+
+    first = execution.main(code, "cpp", "2")
+    second = execution.main(code, "cpp", "3")
+
+    assert (first["output"], second["output"]) == ("4", "6")
+    assert (first["compile_cache"]["hit"], second["compile_cache"]["hit"]) == (False, True)
+    [artifact] = os.listdir(native / "cache")
+    program = native / "cache" / artifact / "prog"
+    assert program.stat().st_uid == os.getuid()
+    assert not program.stat().st_mode & 0o022
+
+
+def test_process_groups_are_killed_with_the_run(native):
+    pid_file = native / "child.pid"
+    code = (
+        "import subprocess, sys\n"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+    )
+    native.chmod(0o777)
+
+    assert execution.main(code, "python")["status"] == "success"
+
+    assert wait_for_exit(int(pid_file.read_text()))
+
+
+def wait_for_exit(pid, timeout=1):
+    """Whether `pid` is gone or a zombie (an init that never reaps leaves those) within `timeout`"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return True
+        except FileNotFoundError:
+            return True
+        time.sleep(0.02)
+    return False
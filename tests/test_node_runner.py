@@ -0,0 +1,111 @@
+import os
+import shutil
+
+import pytest
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docker", "nodejs", "runner.js")
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+
+@pytest.fixture
+def node_runner(agent, tmp_path, monkeypatch):
+    runner = agent.NodeRunner(["node", RUNNER], str(tmp_path / "node_runner.sock"))
+    monkeypatch.setattr(agent, "node_runner", runner)
+    yield runner
+    if runner.process is not None:
+        runner.process.kill()
+        runner.process.wait()
+
+
+def run(agent, tmp_path, source, stdin="", time_limit=5, max_output=None):
+    script = tmp_path / "script.js"
+    script.write_text(source)
+    return agent.run_node_case(str(script), stdin, time_limit, max_output)
+
+
+def test_reads_stdin_and_writes_output(agent, node_runner, tmp_path):
+    source = (
+        "const input = require('fs').readFileSync(0, 'utf8');\n"
+        "console.log(input.trim().toUpperCase());\n"
+        "console.error('warning');\n"
+    )
+
+    case = run(agent, tmp_path, source, "abc\n")
+
+    assert (case["stdout"], case["stderr"], case["exit_code"], case["timed_out"]) == ("ABC\n", "warning\n", 0, False)
+    # CPU time of the worker thread; its heap is shared with other runs
+    assert case["resources"]["cpu_user"] >= 0
+    assert case["resources"]["max_memory_kb"] is None
+
+
+def test_stream_stdin_and_timers_finish_the_run(agent, node_runner, tmp_path):
+    source = (
+        "let data = '';\n"
+        "process.stdin.on('data', chunk => data += chunk);\n"
+        "process.stdin.on('end', () => setTimeout(() => console.log(data.length), 10));\n"
+    )
+
+    assert run(agent, tmp_path, source, "12345")["stdout"] == "5\n"
+
+
+def test_exit_codes_and_exceptions(agent, node_runner, tmp_path):
+    case = run(agent, tmp_path, "console.log('before'); process.exit(3); console.log('after');")
+
+    assert (case["stdout"], case["exit_code"]) == ("before\n", 3)
+
+    case = run(agent, tmp_path, "setTimeout(() => { throw new Error('boom'); }, 1);")
+
+    assert case["exit_code"] == 1
+    assert "Error: boom" in case["stderr"]
+
+
+def test_runs_do_not_share_globals(agent, node_runner, tmp_path):
+    run(agent, tmp_path, "globalThis.leaked = 1; var declared = 2;")
+
+    case = run(agent, tmp_path, "console.log(typeof leaked, typeof declared);")
+
+    assert case["stdout"] == "undefined undefined\n"
+
+
+def test_patched_host_objects_do_not_outlive_the_run(agent, node_runner, tmp_path):
+    run(agent, tmp_path, "Buffer.prototype.toString = () => 'patched'; require('os').patched = 1;")
+
+    case = run(agent, tmp_path, "console.log(Buffer.from('ok').toString(), typeof require('os').patched);")
+
+    assert case["stdout"] == "ok undefined\n"
+
+
+def test_output_limit_holds_when_the_worker_is_tampered_with(agent, node_runner, tmp_path):
+    # The worker counts every write as a single byte
+    source = "Buffer.byteLength = () => 1; while (true) console.log('spam');"
+
+    case = run(agent, tmp_path, source, time_limit=10, max_output=1000)
+
+    assert case["truncated"] is True
+    assert len(case["stdout"]) == 1000
+
+
+def test_timeouts(agent, node_runner, tmp_path):
+    case = run(agent, tmp_path, "while (true) {}", time_limit=0.5)
+
+    assert case["timed_out"] and case["exit_code"] is None
+
+    case = run(agent, tmp_path, "setInterval(() => {}, 10);", time_limit=0.5)
+
+    assert case["timed_out"]
+    assert run(agent, tmp_path, "console.log('next')")["stdout"] == "next\n"
+
+
+def test_runs_stop_at_the_output_limit(agent, node_runner, tmp_path):
+    case = run(agent, tmp_path, 'while (true) console.log("spam");', time_limit=10, max_output=1000)
+
+    assert case["truncated"] is True
+    assert case["timed_out"] is False
+    assert len(case["stdout"]) == 1000
+    assert case["time"] < 5
+
+    case = run(agent, tmp_path, 'console.log("hi"); console.error("e");', max_output=1000)
+
+    assert case["truncated"] is False
+    assert (case["stdout"], case["stderr"], case["exit_code"]) == ("hi\n", "e\n", 0)
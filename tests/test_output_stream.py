@@ -0,0 +1,119 @@
+import sys
+
+from rq import Queue
+
+from api import output_stream
+from api.output_stream import OutputSink, read_stream, sink_for_current_job, stream_process
+from api.worker import ConcurrentWorker
+
+
+def test_sink_caps_output():
+    sink = OutputSink(limit=10)
+
+    assert sink.write("stdout", b"hello ")
+    assert not sink.write("stderr", b"world!")
+    assert (sink.text("stdout"), sink.text("stderr")) == ("hello ", "worl")
+
+    response = sink.apply({"status": "success", "output": "hello", "error": None})
+
+    assert response == {
+        "status": "failure", "output": "hello", "error": "Output limit of 10 bytes exceeded", "truncated": True,
+    }
+
+
+def test_sink_publishes_to_the_job_stream(conn):
+    sink = OutputSink(conn=conn, job_id="job1")
+    sink.write("stdout", b"one")
+    sink.write("stderr", b"two")
+    sink.close()
+
+    chunks, last_id, done = read_stream(conn, "job1")
+
+    assert [(chunk["stream"], chunk["data"]) for chunk in chunks] == [("stdout", "one"), ("stderr", "two")]
+    assert done
+    assert read_stream(conn, "job1", chunks[0]["id"])[0] == chunks[1:]
+    assert conn.ttl("output:job1") > 0
+
+
+def test_sink_outside_a_job_does_not_publish(conn):
+    assert not sink_for_current_job().publishing
+
+
+def test_chunks_are_published_in_batches(conn):
+    sink = OutputSink(conn=conn, job_id="job1")
+    for i in range(50):
+        sink.write("stdout", f"{i}\n".encode())
+    sink.write("stderr", b"oops\n")
+    sink.write("stdout", b"more\n")
+    sink.close()
+
+    chunks, _, done = read_stream(conn, "job1")
+    assert [chunk["stream"] for chunk in chunks] == ["stdout", "stderr", "stdout"]
+    assert chunks[0]["data"] == "".join(f"{i}\n" for i in range(50))
+    assert done
+
+
+def test_pending_chunks_are_flushed_without_more_output(conn, monkeypatch):
+    monkeypatch.setattr(output_stream, "FLUSH_SECONDS", 0.01)
+    sink = OutputSink(conn=conn, job_id="job1")
+    sink.write("stdout", b"prompt> ")
+    sink._flush_timer.join()
+
+    assert [chunk["data"] for chunk in read_stream(conn, "job1")[0]] == ["prompt> "]
+
+
+def test_internal_markers_are_not_published(conn):
+    sink = OutputSink(conn=conn, job_id="job1")
+    for piece in (b"warn\n__TRACE", b"_MARK__ ready 1.5\n__COMPILE_CACHE__ n stored 4\n",
+                  b"__TRACE_MARK__ is in my output\n"[:4], b"no marker"):
+        sink.write("stderr", piece)
+    sink.close()
+
+    assert "".join(chunk["data"] for chunk in read_stream(conn, "job1")[0]) == "warn\n__TRno marker"
+    # The result keeps them for the worker to parse
+    assert "__TRACE_MARK__ ready" in sink.text("stderr")
+
+
+def test_only_jobs_that_ask_for_it_publish(client, conn):
+    submission = {"code": "print(1)", "language": "python"}
+    quiet = client.post("/api/execute", json=submission).get_json()["job_id"]
+    followed = client.post("/api/execute", json=dict(submission, stream=True)).get_json()
+
+    assert "coalesced" not in followed
+    ConcurrentWorker([Queue("run:python", connection=conn)], connection=conn, slots=1).work(burst=True)
+    assert not conn.exists(output_stream.stream_key(quiet))
+    assert read_stream(conn, followed["job_id"])[2]
+
+
+def test_stream_process_stops_at_the_cap():
+    sink = OutputSink(limit=1000)
+
+    returncode = stream_process([sys.executable, "-c", "while True: print('spam')"], None, 10, sink)
+
+    assert returncode is not None
+    assert sink.truncated
+    assert len(sink.text("stdout")) == 1000
+
+
+def test_stream_process_feeds_stdin_and_times_out():
+    sink = OutputSink()
+
+    assert stream_process([sys.executable, "-c", "print(input())"], "hi", 10, sink) == 0
+    assert sink.text("stdout") == "hi\n"
+    assert stream_process([sys.executable, "-c", "import time; time.sleep(10)"], None, 0.2, OutputSink()) is None
+
+
+def test_output_endpoint(client, conn):
+    sink = OutputSink(conn=conn, job_id="job1")
+    sink.write("stdout", b"partial")
+    sink.flush()
+
+    body = client.get("/api/job/job1/output").get_json()
+
+    assert [chunk["data"] for chunk in body["chunks"]] == ["partial"]
+    assert not body["done"]
+
+    sink.close()
+    body = client.get(f"/api/job/job1/output?after={body['last_id']}").get_json()
+
+    assert body["chunks"] == [] and body["done"]
@@ -0,0 +1,67 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ZYGOTE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docker", "python", "zygote.py")
+
+
+@pytest.fixture
+def python_zygote(agent, tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("zygote", ZYGOTE)
+    zygote = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(zygote)
+    monkeypatch.setattr(agent, "zygote", zygote, raising=False)
+    server = agent.PythonZygote([sys.executable, ZYGOTE], str(tmp_path / "zygote.sock"))
+    yield server
+    if server.process is not None:
+        server.process.kill()
+        server.process.wait()
+
+
+def run(server, tmp_path, source, stdin="", time_limit=5):
+    script = tmp_path / "main.py"
+    script.write_text(source)
+    return server.run(str(script), stdin, time_limit)
+
+
+def test_runs_scripts_with_stdin(python_zygote, tmp_path):
+    case = run(python_zygote, tmp_path, "import sys\nprint(sys.stdin.read().upper())\nprint(__name__, file=sys.stderr)", "abc")
+    resources = case.pop("resources")
+
+    assert case == {"stdout": "ABC\n", "stderr": "__main__\n", "exit_code": 0, "timed_out": False, "truncated": False}
+    # The child's own wait4() usage
+    assert resources["max_memory_kb"] > 0
+    assert resources["cpu_user"] >= 0
+
+
+def test_children_start_from_a_fresh_main(python_zygote, tmp_path):
+    run(python_zygote, tmp_path, "leaked = 1")
+    case = run(python_zygote, tmp_path, "print('leaked' in globals())")
+
+    assert case["stdout"] == "False\n"
+
+
+def test_exit_codes_and_tracebacks(python_zygote, tmp_path):
+    assert run(python_zygote, tmp_path, "raise SystemExit(3)")["exit_code"] == 3
+
+    case = run(python_zygote, tmp_path, "1 / 0")
+
+    assert case["exit_code"] == 1
+    assert "ZeroDivisionError" in case["stderr"]
+
+
+def test_timeouts_kill_the_child(python_zygote, tmp_path):
+    case = run(python_zygote, tmp_path, "print('started', flush=True)\nwhile True: pass", time_limit=0.5)
+
+    assert case["timed_out"] and case["exit_code"] is None
+    assert case["stdout"] == "started\n"
+
+
+def test_restarts_a_dead_zygote(python_zygote, tmp_path):
+    run(python_zygote, tmp_path, "pass")
+    python_zygote.process.kill()
+    python_zygote.process.wait()
+
+    assert run(python_zygote, tmp_path, "print(2)")["stdout"] == "2\n"
@@ -0,0 +1,49 @@
+import pytest
+from rq import Queue
+
+from api.execution import SUPPORTED_LANGUAGES
+from api.queues import (InvalidPriority, LEGACY_QUEUE, parse_queue_weights, queue_languages,
+                        queue_name, weighted_order)
+
+
+def test_queue_name():
+    assert queue_name("python") == "run:python"
+    assert queue_name("java", "rejudge") == "rejudge:java"
+    assert queue_name("cobol") == LEGACY_QUEUE
+    with pytest.raises(InvalidPriority):
+        queue_name("python", "urgent")
+
+
+def test_parse_queue_weights_expands_wildcards():
+    weights = parse_queue_weights("run:*=10,run:java=1,default")
+
+    assert weights[:len(SUPPORTED_LANGUAGES)] == [(f"run:{language}", 10.0) for language in SUPPORTED_LANGUAGES]
+    assert weights[-1] == ("default", 1.0)
+    assert len(weights) == len(SUPPORTED_LANGUAGES) + 1
+    with pytest.raises(ValueError):
+        parse_queue_weights("run:python=0")
+
+
+def test_queue_languages():
+    assert queue_languages(["run:java", "submit:java"]) == ["java"]
+    assert queue_languages([LEGACY_QUEUE]) == list(SUPPORTED_LANGUAGES)
+
+
+def test_weighted_order_favours_heavier_queues():
+    firsts = [weighted_order([10.0, 1.0])[0] for _ in range(2000)]
+
+    assert sorted(weighted_order([1.0, 2.0, 3.0])) == [0, 1, 2]
+    assert firsts.count(0) > 1500
+
+
+def test_jobs_are_routed_by_language_and_priority(client, conn):
+    response = client.post("/api/execute", json={"code": "print(1)", "language": "java", "priority": "submit"})
+    job_id = response.get_json()["job_id"]
+
+    assert Queue("submit:java", connection=conn).job_ids == [job_id]
+    assert client.get(f"/api/job/{job_id}").get_json() == {"status": "pending"}
+
+    response = client.post("/api/execute", json={"code": "print(1)", "language": "java", "priority": "urgent"})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Unknown priority")
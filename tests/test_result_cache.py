@@ -0,0 +1,39 @@
+import json
+
+from api import result_cache
+
+
+def test_store_and_lookup(conn):
+    key = result_cache.result_key("print(1)", "python", None)
+    result = {"status": "success", "output": "1"}
+
+    assert result_cache.store(conn, key, "print(1)", "python", result)
+    assert result_cache.lookup(conn, key) == result
+    assert result_cache.lookup(conn, "missing") is None
+    assert result_cache.lookup_many(conn, [key, "missing"]) == [result, None]
+    assert 0 < conn.ttl(result_cache.KEY_PREFIX + key) <= result_cache.RESULT_CACHE_TTL
+
+
+def test_only_reusable_results_are_stored(conn):
+    key = result_cache.result_key("print(1)", "python", None)
+
+    assert not result_cache.store(conn, key, "print(1)", "python", {"status": "timeout"})
+    assert not result_cache.store(conn, key, "import time", "python", {"status": "success"})
+    assert not result_cache.store(conn, key, "print(1)", "cobol", {"status": "success"})
+    assert result_cache.lookup(conn, key) is None
+
+
+def test_oldest_entries_are_evicted_past_the_byte_budget(conn, monkeypatch):
+    result = {"status": "success", "output": "x" * 50}
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_MAX_BYTES", 2 * len(json.dumps(result)))
+    keys = [result_cache.result_key(f"print({i})", "python", None) for i in range(3)]
+    for i, key in enumerate(keys):
+        result_cache.store(conn, key, f"print({i})", "python", result)
+
+    assert [result_cache.lookup(conn, key) for key in keys] == [None, result, result]
+    assert int(conn.get(result_cache.BYTES_KEY)) == 2 * len(json.dumps(result))
+
+
+def test_key_covers_stdin():
+    assert result_cache.result_key("c", "python", "1") != result_cache.result_key("c", "python", "2")
+    assert result_cache.result_key("c", "python", None) == result_cache.result_key("c", "python", "")
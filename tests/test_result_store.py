@@ -0,0 +1,58 @@
+from rq import Queue
+from rq.job import Job
+
+from api import result_store
+from api.worker import ConcurrentWorker
+
+
+def test_small_results_are_stored_inline(conn):
+    reference = result_store.save(conn, "a", {"status": "success", "output": "hi"}, ttl=60)
+
+    assert result_store.is_reference(reference)
+    assert result_store.load(conn, "a") == {"status": "success", "output": "hi"}
+    assert conn.keys(result_store.PART_KEY.format("a", "*")) == []
+    assert 0 < conn.ttl(result_store.KEY.format("a")) <= 60
+
+
+def test_long_strings_are_split_out(conn, monkeypatch):
+    monkeypatch.setattr(result_store, "INLINE_MAX_BYTES", 10)
+    result = {"status": "success", "output": "x" * 5000, "cases": [{"output": "y" * 20}, {"output": "z"}]}
+    result_store.save(conn, "a", result, ttl=60)
+
+    assert len(conn.keys(result_store.PART_KEY.format("a", "*"))) == 2
+    # Large values are compressed
+    assert conn.get(result_store.PART_KEY.format("a", 0))[:1] == result_store.COMPRESSED
+    assert result_store.load(conn, "a") == result
+
+
+def test_load_many_keeps_order_and_missing_results(conn, monkeypatch):
+    monkeypatch.setattr(result_store, "INLINE_MAX_BYTES", 10)
+    result_store.save(conn, "a", {"output": "a" * 20}, ttl=60)
+    result_store.save(conn, "b", {"output": "b"}, ttl=60)
+
+    assert result_store.load_many(conn, ["b", "missing", "a"]) == [{"output": "b"}, None, {"output": "a" * 20}]
+    assert result_store.load_many(conn, []) == []
+
+
+def test_ttl_by_status():
+    assert result_store.ttl_for({"status": "success"}) == result_store.SUCCESS_TTL
+    assert result_store.ttl_for({"status": "timeout"}) == result_store.TIMEOUT_TTL
+    assert result_store.ttl_for({"status": "error"}) == result_store.FAILURE_TTL
+
+
+def test_resolve_passes_through_plain_return_values(conn):
+    assert result_store.resolve(conn, "old", {"status": "success"}) == {"status": "success"}
+
+
+def test_queued_results_are_resolved_on_read(client, conn):
+    response = client.post("/api/execute", json={"code": "print(input())", "language": "python", "stdin": "hi"})
+    job_id = response.get_json()["job_id"]
+
+    ConcurrentWorker([Queue("run:python", connection=conn)], connection=conn, slots=1).work(burst=True)
+
+    # RQ only holds the reference; the result expires by its status
+    assert result_store.is_reference(Job.fetch(job_id, connection=conn).return_value())
+    assert 0 < conn.ttl(result_store.KEY.format(job_id)) <= result_store.SUCCESS_TTL
+    body = client.get(f"/api/job/{job_id}").get_json()
+    assert body["status"] == "completed"
+    assert body["result"]["output"] == "hi"
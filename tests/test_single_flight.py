@@ -0,0 +1,54 @@
+from rq import Queue
+
+from api import single_flight
+from api.worker import ConcurrentWorker
+
+
+def test_identical_submissions_join_the_first_job(conn):
+    key = single_flight.flight_key("print(1)", "python", None, "run:python")
+
+    assert single_flight.join(conn, key, "job-1") is None
+    assert single_flight.join(conn, key, "job-2") == "job-1"
+    assert single_flight.join(conn, key, "job-3") == "job-1"
+    assert single_flight.release(conn, key, "job-1") == [{}, {}]
+    assert single_flight.join(conn, key, "job-4") is None
+
+
+def test_release_by_another_job_keeps_the_flight(conn):
+    key = single_flight.flight_key("print(1)", "python", None, "run:python")
+    single_flight.join(conn, key, "job-1")
+
+    assert single_flight.release(conn, key, "job-2") is None
+    assert single_flight.join(conn, key, "job-3") == "job-1"
+
+
+def test_join_many_applies_claims_in_order(conn):
+    a = single_flight.flight_key("print(1)", "python", None, "run:python")
+    b = single_flight.flight_key("print(2)", "python", None, "run:python")
+
+    claims = [(a, "1", None), (b, "2", None), (a, "3", {"user_id": "u3"})]
+    assert single_flight.join_many(conn, claims) == [None, None, "1"]
+    assert single_flight.release(conn, a, "1") == [{"user_id": "u3"}]
+    single_flight.release_many(conn, [(b, "2")])
+    assert conn.keys(single_flight.KEY_PREFIX + "*") == []
+
+
+def test_keys_separate_queues_and_skip_nondeterministic_code():
+    run = single_flight.flight_key("print(1)", "python", None, "run:python")
+    submit = single_flight.flight_key("print(1)", "python", None, "submit:python")
+
+    assert run != submit
+    assert single_flight.flight_key("import random", "python", None, "run:python") is None
+
+
+def test_api_coalesces_until_the_job_finishes(client, conn):
+    submission = {"code": "print(1)", "language": "python"}
+    queue = Queue("run:python", connection=conn)
+
+    first = client.post("/api/execute", json=submission).get_json()
+    second = client.post("/api/execute", json=submission).get_json()
+
+    assert second == {"status": "success", "job_id": first["job_id"], "coalesced": True}
+    assert queue.count == 1
+    ConcurrentWorker([queue], connection=conn, slots=1).work(burst=True)
+    assert conn.keys(single_flight.KEY_PREFIX + "*") == []
@@ -0,0 +1,64 @@
+import json
+
+from api import tracing
+
+
+def test_spans_nest_and_inherit_attributes(tmp_path, monkeypatch):
+    trace_file = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(trace_file))
+    monkeypatch.setattr(tracing, "exporter", tracing.Exporter())
+
+    with tracing.span("execution", execution_id="e1", language="python", attempt=1) as outer:
+        with tracing.span("lease", container="python-1") as inner:
+            pass
+    tracing.flush()
+
+    spans = [span for line in trace_file.read_text().splitlines()
+             for resource in json.loads(line)["resourceSpans"]
+             for scope in resource["scopeSpans"] for span in scope["spans"]]
+    lease, execution = spans
+    assert (lease["name"], execution["name"]) == ("lease", "execution")
+    assert lease["traceId"] == execution["traceId"] == outer.trace_id
+    assert lease["parentSpanId"] == execution["spanId"]
+    # Only the identifying attributes are passed down
+    assert {a["key"] for a in lease["attributes"]} == {"execution_id", "language", "container"}
+    assert inner.attributes["container"] == "python-1"
+
+
+def test_phases_add_up_in_the_timings(monkeypatch):
+    with tracing.collect_timings() as timings:
+        with tracing.phase("run"):
+            pass
+        tracing.record_phase("run", 10.0, 10.5)
+        tracing.record_phase("compile", 11.0, 10.0)
+
+    assert set(timings) == {"run"}
+    assert 0.5 <= timings["run"] < 0.6
+
+
+def test_traces_continue_across_processes():
+    with tracing.span("enqueue") as enqueue:
+        header = tracing.traceparent()
+
+    with tracing.continue_trace(header):
+        with tracing.span("job") as job:
+            pass
+    with tracing.continue_trace("garbage"):
+        with tracing.span("job") as unrelated:
+            pass
+
+    assert header == f"00-{enqueue.trace_id}-{enqueue.span_id}-01"
+    assert (job.trace_id, job.parent_id) == (enqueue.trace_id, enqueue.span_id)
+    assert unrelated.trace_id != enqueue.trace_id and unrelated.parent_id is None
+
+
+def test_script_marks_are_split_from_stderr():
+    stderr = f"{tracing.MARKER} ready 10.0\nwarning\n{tracing.MARKER} compiled 12.5\n"
+
+    kept, marks = tracing.split_marks(stderr)
+
+    assert kept == "warning"
+    assert marks == {"ready": 10.0, "compiled": 12.5}
+    with tracing.collect_timings() as timings:
+        tracing.record_script_phases(9.0, 13.0, marks, compiles=True)
+    assert timings == {"transfer": 1.0, "compile": 2.5, "run": 0.5}
@@ -0,0 +1,43 @@
+import operator
+import os
+
+from rq import Queue
+
+from api import worker
+from api.job_events import CHANNEL
+
+
+def test_concurrent_worker_runs_jobs(conn):
+    queue = Queue("run:python", connection=conn)
+    jobs = [queue.enqueue(operator.add, i, 1) for i in range(3)]
+
+    w = worker.ConcurrentWorker([queue], connection=conn, slots=2)
+    w.work(burst=True)
+
+    for i, job in enumerate(jobs):
+        job.refresh()
+        assert job.is_finished
+        assert job.return_value() == i + 1
+    assert w._running == {}
+
+
+def test_single_slot_runs_jobs_in_process(conn):
+    queue = Queue("run:python", connection=conn)
+    job = queue.enqueue(os.getpid)
+
+    worker.ConcurrentWorker([queue], connection=conn, slots=1).work(burst=True)
+
+    job.refresh()
+    assert job.return_value() == os.getpid()
+
+
+def test_completions_are_published(conn):
+    queue = Queue("run:python", connection=conn)
+    pubsub = conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL)
+    job = queue.enqueue(operator.add, 1, 1)
+
+    worker.ConcurrentWorker([queue], connection=conn, slots=1).work(burst=True)
+
+    messages = [pubsub.get_message(timeout=0.1) for _ in range(3)]
+    assert [message["data"] for message in messages if message] == [job.id.encode()]
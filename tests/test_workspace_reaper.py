@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from api import workspace_reaper
+from api.container_pool import container_pool
+from api.workspace_reaper import WorkspaceReaper, lease_ids
+
+RUN = "3f2b9c1e-5d4a-4e8f-9a7b-123456789012"
+
+
+def test_lease_ids_of_batched_case():
+    assert lease_ids(f"/tmp/workspace/exec_{RUN}-3") == (f"{RUN}-3", RUN)
+    assert lease_ids("/tmp/workspace/exec_abc-0") == ("abc-0", "abc")
+    # A uuid ending in digits is its own lease id first
+    assert RUN in lease_ids(f"/tmp/workspace/exec_{RUN}")
+    assert lease_ids("/tmp/workspace/agent/abc") == ("abc",)
+
+
+def test_select_keeps_cases_of_a_leased_run():
+    now = 1000.0
+    workspaces = [
+        (now - 5, 4096, "/tmp/workspace/exec_abc-0"),
+        (now - 5, 4096, "/tmp/workspace/exec_abc-1"),
+        (now - 5, 4096, "/tmp/workspace/exec_def-0"),
+        (now - 5, 4096, "/tmp/workspace/exec_ghi"),
+    ]
+    selected = WorkspaceReaper().select(workspaces, {"abc", "ghi"}, now)
+
+    assert selected["finished"] == ["/tmp/workspace/exec_def-0"]
+    assert selected["expired"] == []
+    assert selected["over_budget"] == []
+
+
+@pytest.mark.parametrize("max_bytes, over_budget", [(10000, 0), (5000, 1)])
+def test_select_age_and_size_budgets(monkeypatch, max_bytes, over_budget):
+    monkeypatch.setattr(workspace_reaper, "MAX_BYTES", max_bytes)
+    now = 1000.0
+    workspaces = [
+        (now - workspace_reaper.MAX_AGE - 1, 4096, "/tmp/workspace/exec_old"),
+        (now - 30, 4096, "/tmp/workspace/exec_done"),
+        (now - 20, 4096, "/tmp/workspace/exec_a"),
+        (now - 10, 4096, "/tmp/workspace/exec_b"),
+    ]
+    selected = WorkspaceReaper().select(workspaces, {"old", "a", "b"}, now)
+
+    assert selected["expired"] == ["/tmp/workspace/exec_old"]
+    assert selected["finished"] == ["/tmp/workspace/exec_done"]
+    # The oldest running workspaces go first
+    assert selected["over_budget"] == ["/tmp/workspace/exec_a"][:over_budget]
+
+
+def test_reap_removes_finished_workspaces(local_docker, tmp_path, monkeypatch):
+    root = tmp_path / "workspace"
+    monkeypatch.setattr(workspace_reaper, "WORK_ROOT", str(root))
+    monkeypatch.setattr(workspace_reaper, "ENGINE_WORK_ROOT", str(tmp_path / "engine"))
+    for name in ("exec_running", "exec_done"):
+        (root / name).mkdir(parents=True)
+        (root / name / "script.py").write_text("print(1)")
+    container_pool.acquire("python", "running")
+    [container] = [c for c, count in container_pool.utilization()["python"].items() if count]
+
+    removed = WorkspaceReaper().reap(container)
+
+    assert removed == {"finished": 1, "expired": 0, "over_budget": 0}
+    assert os.listdir(root) == ["exec_running"]
+    usage = container_pool.scratch_usage()["python"][container]
+    assert usage["workspaces"] == 1 and usage["measured_at"] <= time.time()